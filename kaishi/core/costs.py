@@ -0,0 +1,12 @@
+"""Enumeration definition for the cost classes of pipeline components."""
+from enum import IntEnum
+
+
+class Costs(IntEnum):
+    """Enumeration of what a pipeline component reads per file, from cheapest to most expensive."""
+
+    METADATA = 0  # File names, labels and other in-memory state
+    HEADER = 1  # First bytes of each file
+    CONTENT = 2  # Whole file contents (e.g. hashing)
+    DECODE = 3  # Decoded data (e.g. images or dataframes)
+    INFERENCE = 4  # Model predictions
@@ -7,17 +7,29 @@ from kaishi.core.file_group import FileGroup
 class FileDataset:
     """Factory for generic file dataset objects."""
 
-    def __new__(self, source: str = None, recursive: bool = False):
+    def __new__(
+        self,
+        source: str = None,
+        recursive: bool = False,
+        workers: int = None,
+        manifest: str = None,
+    ):
         """Initialize with the default pipeline defined.
 
         :param source: string identifying source (e.g. directory)
         :type source: str
         :param recursive: flag to set recursion
         :type recursive: bool
+        :param workers: number of threads used to scan directories
+        :type workers: int
+        :param manifest: optional path to a manifest file that caches values (e.g. hashes) between loads
+        :type manifest: str
         """
         if os.path.exists(source):
             file_dataset = FileGroup(recursive=recursive)
-            file_dataset.load_dir(source, File, file_dataset.recursive)
+            file_dataset.load_dir(source, File, file_dataset.recursive, workers=workers)
+            if manifest is not None:
+                file_dataset.load_manifest(manifest, workers=workers)
             return file_dataset
         else:
             raise NotImplementedError("Currently only supports a valid path as input")
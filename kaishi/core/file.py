@@ -2,7 +2,8 @@
 import os
 from kaishi.core.labels import Labels
 from kaishi.core.misc import is_valid_label
-from kaishi.core.misc import md5sum
+from kaishi.core.misc import hash_file
+from kaishi.core.tracing import span
 import warnings
 
 
@@ -29,6 +30,9 @@ class File:
         else:
             self.abspath = os.path.join(basedir, filename)
         self.hash = None  # Default to None, populate later
+        self.hash_algorithm = None  # Digest algorithm used to compute 'hash'
+        self.size = None  # Populated by stat()
+        self.mtime_ns = None
 
     def __repr__(self):
         if self.relative_path is None:
@@ -38,12 +42,71 @@ class File:
     def __str__(self):
         return self.__repr__()
 
-    def compute_hash(self):
+    def stat(self):
+        """Read the size and modification time of the file from disk.
+
+        :return: size in bytes and modification time in nanoseconds
+        :rtype: tuple
+        """
+        stat_result = os.stat(self.abspath)
+        self.size = stat_result.st_size
+        self.mtime_ns = stat_result.st_mtime_ns
+
+        return self.size, self.mtime_ns
+
+    def unload(self):
+        """Release loaded data to save memory (generic files have nothing to release, but subclasses do)."""
+        return
+
+    def get_cached_values(self):
+        """Get computed values that only depend on the contents of the file on disk (e.g. for a manifest).
+
+        :return: dictionary of value names and values
+        :rtype: dict
+        """
+        return {"hash": self.hash, "hash_algorithm": self.hash_algorithm}
+
+    def set_cached_values(self, values: dict):
+        """Restore values previously returned by :meth:`get_cached_values` (None values are ignored).
+
+        :param values: dictionary of value names and values
+        :type values: dict
+        """
+        if values.get("hash") is not None:
+            self.hash = values["hash"]
+            self.hash_algorithm = values.get("hash_algorithm", "md5")
+
+    def get_state(self):
+        """Get a JSON-serializable snapshot of the labels and computed values of the file.
+
+        :return: dictionary with "labels" and "values" keys
+        :rtype: dict
+        """
+        return {
+            "labels": [label.name for label in self.labels],
+            "values": self.get_cached_values(),
+        }
+
+    def set_state(self, state: dict):
+        """Restore a snapshot returned by :meth:`get_state`.
+
+        :param state: dictionary with "labels" and "values" keys
+        :type state: dict
+        """
+        for label in state["labels"]:
+            self.add_label(label)
+        self.set_cached_values(state["values"])
+
+    def compute_hash(self, algorithm: str = "md5"):
         """Compute the hash of the file.
 
+        :param algorithm: digest algorithm, e.g. "md5", "blake2b" or "xxh64" (see :func:`kaishi.core.misc.get_hasher`)
+        :type algorithm: str
         :return: hash value
         """
-        self.hash = md5sum(self.abspath)
+        with span("hash", "hash", file=self.abspath, algorithm=algorithm):
+            self.hash = hash_file(self.abspath, algorithm=algorithm)
+        self.hash_algorithm = algorithm
 
         return self.hash
 
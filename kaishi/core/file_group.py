@@ -1,8 +1,14 @@
 """Class definition for reading/writing files of various types."""
+import os
+import json
+import hashlib
 import warnings
-from kaishi.core.misc import load_files_by_walk
+import copy
+from kaishi.core.misc import load_files_by_scandir
+from kaishi.core.manifest import Manifest
 from kaishi.core.pipeline import Pipeline
 from kaishi.core.printing import should_print_row
+from kaishi.core.printing import format_profile_row
 from prettytable import PrettyTable
 import pprint
 import numpy as np
@@ -33,6 +39,9 @@ class FileGroup:
         self.dir_children = None
         self.files = None
         self.recursive = recursive
+        self.manifest = None
+        self.supports_checkpoints = True  # The state covers all changes made by steps
+        self.file_stats = dict()  # Sizes and modification times, read once per run
 
     def __getitem__(self, key):
         """Get a specific file object."""
@@ -41,18 +50,290 @@ class FileGroup:
                 return fobj
         raise KeyError(key + " not a valid file")
 
-    def load_dir(self, source: str, file_initializer, recursive: bool):
+    def load_dir(
+        self, source: str, file_initializer, recursive: bool, workers: int = None
+    ):
         """Read file names in a directory
 
         :param source: Directory to load from
         :type source: str
         :param file_initializer: Data file calss to initialize each file with
         :type file_initializer: kaishi file initializer class (e.g. :class:`kaishi.core.file.File`)
+        :param recursive: flag to indicate recursion
+        :type recursive: bool
+        :param workers: number of threads used to scan directories (defaults to the `ThreadPoolExecutor` default)
+        :type workers: int
         """
-        self.dir_name, self.dir_children, self.files = load_files_by_walk(
-            source, file_initializer, recursive
+        self.dir_name, self.dir_children, self.files = load_files_by_scandir(
+            source, file_initializer, recursive, workers=workers
         )
 
+    def load_manifest(self, path: str, workers: int = None):
+        """Attach a persistent manifest and reuse its cached values (e.g. hashes) for unchanged files.
+
+        :param path: path to the manifest file (created if it doesn't exist)
+        :type path: str
+        :param workers: number of threads used to stat files
+        :type workers: int
+        :return: number of files with reused values
+        :rtype: int
+        """
+        self.manifest = Manifest(path)
+        self.files = [
+            fobj
+            for fobj in self.files
+            if not self.manifest.is_manifest_file(fobj.abspath)
+        ]
+
+        return self.manifest.apply(self.files, workers=workers)
+
+    def save_manifest(self):
+        """Record the cached values of all current and filtered files in the attached manifest (if any)."""
+        if self.manifest is None:
+            return
+        self.manifest.update(self._get_all_files())
+
+    def _get_all_files(self):
+        """Get a list of all current and filtered files.
+
+        :return: current files followed by filtered files
+        :rtype: list
+        """
+        all_files = list(self.files)
+        for k in self.filtered:
+            all_files.extend(self.filtered[k])
+
+        return all_files
+
+    def _get_view(self, files: list):
+        """Get a shallow copy of the group that operates on a subset of files (e.g. for incremental runs).
+
+        :param files: files in the view
+        :type files: list
+        :return: file group sharing everything but the file list and filter results
+        :rtype: :class:`kaishi.core.file_group.FileGroup`
+        """
+        view = copy.copy(self)
+        view.files = list(files)
+        view.filtered = dict()
+
+        return view
+
+    def _merge_view(self, view):
+        """Merge the filter results of a view from :meth:`_get_view` back into the group.
+
+        :param view: view after running a pipeline component
+        :type view: :class:`kaishi.core.file_group.FileGroup`
+        """
+        for k in view.filtered:
+            self.filtered.setdefault(k, []).extend(view.filtered[k])
+
+    def get_state(self):
+        """Get a JSON-serializable snapshot of the processing state (file lists, filter reasons, labels, hashes,
+        children and completed pipeline steps), e.g. to run the pipeline incrementally later.
+
+        :return: state dictionary
+        :rtype: dict
+        """
+        file_states = dict()
+        for fobj in self._get_all_files():
+            file_state = fobj.get_state()
+            file_state["children"] = {
+                k: [repr(child) for child in fobj.children[k]] for k in fobj.children
+            }
+            file_states[repr(fobj)] = file_state
+
+        return {
+            "files": [repr(fobj) for fobj in self.files],
+            "filtered": {
+                k: [repr(fobj) for fobj in self.filtered[k]] for k in self.filtered
+            },
+            "file_states": file_states,
+            "completed_steps": copy.deepcopy(self.pipeline.completed_steps),
+        }
+
+    def get_fingerprint(self):
+        """Get a digest of the input a pipeline component sees: the processing state, the settings of the group
+        and the size and modification time of each file (e.g. for a :class:`kaishi.core.memoization.ComponentCache`).
+
+        :return: hex digest
+        :rtype: str
+        """
+        state = self.get_state()
+        del state["completed_steps"]
+        stats = {
+            repr(fobj): [fobj.abspath] + self._get_file_stat(fobj.abspath)
+            for fobj in self._get_all_files()
+        }
+        description = json.dumps(
+            [state, stats, self._get_fingerprint_settings()],
+            sort_keys=True,
+            default=repr,
+        )
+
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _get_file_stat(self, path: str):
+        """Get the size and modification time of a file, reading them from disk once per run (see
+        :meth:`get_fingerprint`, which is called for each memoizable step).
+
+        :param path: path of the file
+        :type path: str
+        :return: size in bytes and modification time in nanoseconds (both None if the file can't be read)
+        :rtype: list
+        """
+        if path not in self.file_stats:
+            try:
+                stat = os.stat(path)
+                self.file_stats[path] = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                self.file_stats[path] = [None, None]
+
+        return self.file_stats[path]
+
+    def _get_fingerprint_settings(self):
+        """Get the settings of the group that affect the results of pipeline components.
+
+        :return: settings (none for generic files)
+        :rtype: dict
+        """
+        return dict()
+
+    def restore_state(self, state: dict):
+        """Restore a snapshot from :meth:`get_state` onto the files loaded from disk.
+
+        Files in the snapshot that no longer exist are dropped, and files that are not part of the snapshot
+        are returned (and removed from the current file list).
+
+        :param state: state dictionary
+        :type state: dict
+        :return: files that are not part of the snapshot (i.e. new files)
+        :rtype: list
+        """
+        unrestored = {repr(fobj): fobj for fobj in self.files}
+        new_names = set(unrestored.keys()) - set(state["file_states"].keys())
+        new_files = [fobj for fobj in self.files if repr(fobj) in new_names]
+        restored = {
+            name: unrestored[name]
+            for name in state["file_states"]
+            if name in unrestored
+        }
+
+        self.files = [restored[name] for name in state["files"] if name in restored]
+        self.filtered = dict()
+        for k in state["filtered"]:
+            self.filtered[k] = [
+                restored[name] for name in state["filtered"][k] if name in restored
+            ]
+        for name, fobj in restored.items():
+            file_state = state["file_states"][name]
+            fobj.set_state(file_state)
+            for k in file_state["children"]:
+                fobj.children[k] = [
+                    restored[child]
+                    for child in file_state["children"][k]
+                    if child in restored
+                ]
+
+        return new_files
+
+    def prepare_incremental_run(self, previous_state: dict):
+        """Restore the state of a previous run so that only new files are processed by the pipeline.
+
+        :param previous_state: state from :meth:`get_state` after the previous run
+        :type previous_state: dict
+        :return: new files to process, or None if the previous state can't be reused (e.g. the pipeline changed)
+        :rtype: list
+        """
+        if not self.pipeline.supports_incremental(previous_state):
+            warnings.warn(
+                "Previous state doesn't match an incremental pipeline, running the full pipeline"
+            )
+            return None
+
+        return self.restore_state(previous_state)
+
+    def load_checkpoint(self, path: str):
+        """Restore the state journaled by an interrupted pipeline run (see the `checkpoint` option of
+        :meth:`run_pipeline`), so the run continues from its first unfinished step without recomputation.
+
+        Files that aren't part of the checkpoint (e.g. added since) are left out of the resumed run.
+
+        :param path: path of the checkpoint
+        :type path: str
+        :return: checkpoint to resume from, or None if it doesn't exist or doesn't match the pipeline
+        :rtype: dict
+        """
+        self._check_checkpoints_supported()
+        if not os.path.exists(path):
+            return None
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if not self.pipeline.matches_checkpoint(checkpoint):
+            warnings.warn(
+                "Checkpoint doesn't match the pipeline, running the full pipeline"
+            )
+            return None
+        self.restore_state(checkpoint["state"])
+        if checkpoint["pending"] is not None:
+            files_by_name = {repr(fobj): fobj for fobj in self.files}
+            checkpoint["pending"] = [
+                files_by_name[name]
+                for name in checkpoint["pending"]
+                if name in files_by_name
+            ]
+
+        return checkpoint
+
+    def _prepare_run(
+        self,
+        previous_state: dict,
+        chunk_size: int,
+        checkpoint: str,
+        resume_from: str,
+    ):
+        """Check the options of :meth:`run_pipeline` and restore the state of a previous run or checkpoint.
+
+        :param previous_state: state from :meth:`get_state` after a previous run
+        :type previous_state: dict
+        :param chunk_size: maximum number of files loaded at once in streaming mode
+        :type chunk_size: int
+        :param checkpoint: path of the journal of the progress
+        :type checkpoint: str
+        :param resume_from: path of a journal to resume from
+        :type resume_from: str
+        :return: new files for an incremental run and checkpoint to resume from (each None if not applicable)
+        :rtype: list and dict
+        """
+        self.file_stats = dict()  # Files may have changed since the last run
+        if checkpoint is not None or resume_from is not None:
+            self._check_checkpoints_supported()
+        if (checkpoint is not None or resume_from is not None) and (
+            chunk_size is not None or previous_state is not None
+        ):
+            raise ValueError(
+                "Checkpoints are only supported for full (not streaming or incremental) runs"
+            )
+        if chunk_size is not None:
+            return None, None
+        new_files = None
+        if previous_state is not None:
+            new_files = self.prepare_incremental_run(previous_state)
+        resume = None
+        if resume_from is not None:
+            resume = self.load_checkpoint(resume_from)
+
+        return new_files, resume
+
+    def _check_checkpoints_supported(self):
+        """Raise an error if the progress of a run on this group can't be journaled (see :meth:`load_checkpoint`)."""
+        if not self.supports_checkpoints:
+            raise ValueError(
+                "Checkpoints aren't supported for "
+                + self.__class__.__name__
+                + " (in-place edits of the loaded data aren't journaled)"
+            )
+
     def get_pipeline_options(self):
         """Returns available pipeline options for this dataset.
 
@@ -75,13 +356,20 @@ class FileGroup:
 
         return options
 
-    def configure_pipeline(self, choices: list = None, verbose: bool = False):
+    def configure_pipeline(
+        self, choices: list = None, verbose: bool = False, optimize: bool = False
+    ):
         """Configures the sequence of components in the data processing pipeline.
 
         :param choices: list of pipeline choices
         :type choices: list
         :param verbose: flag to indicate verbosity
         :type verbose: bool
+        :param optimize: flag to run cheap filters first where the order doesn't matter (see
+            :meth:`kaishi.core.pipeline.Pipeline.optimize`)
+        :type optimize: bool
+        :return: plan chosen by the optimizer (None if not optimizing)
+        :rtype: list[dict]
         """
         options = self.get_pipeline_options()
         if choices is None:  # Prompt for choices if not provided
@@ -126,9 +414,37 @@ class FileGroup:
             elif callable(choice):
                 self.pipeline.add_component(choice)
 
+        plan = None
+        if optimize:
+            plan = self.pipeline.optimize()
+            if verbose:
+                self._print_plan(plan)
         if verbose:
             print(repr(self.pipeline))
 
+        return plan
+
+    def _print_plan(self, plan: list):
+        """Print the pipeline order chosen by the optimizer.
+
+        :param plan: plan from :meth:`kaishi.core.pipeline.Pipeline.optimize`
+        :type plan: list[dict]
+        """
+        print("Optimized pipeline order:")
+        table = PrettyTable()
+        table.field_names = ["Index", "Step", "Cost", "Commutative", "Given"]
+        for i, step in enumerate(plan):
+            table.add_row(
+                [
+                    i,
+                    step["step"],
+                    step["cost"],
+                    step["commutative"],
+                    step["original_index"],
+                ]
+            )
+        print(table)
+
     def file_report(self, max_file_entries=16, max_filter_entries=10):
         """Show a report of valid and invalid data.
 
@@ -177,12 +493,87 @@ class FileGroup:
                     table.add_row(["...", " "])
         print(table)
 
-    def run_pipeline(self, verbose: bool = False):
+        report = self.pipeline.get_profile_report()
+        if any(step["wall_time"] is not None for step in report["steps"]):
+            print("Pipeline profile:")
+            table = PrettyTable()
+            table.field_names = [
+                "Step",
+                "Wall (s)",
+                "CPU (s)",
+                "Traced peak (MB)",
+                "RSS peak growth (MB)",
+                "Files in",
+                "Files out",
+                "Read (MB)",
+            ]
+            for step in report["steps"] + [dict(report["total"], step="Total")]:
+                table.add_row(format_profile_row(step))
+            print(table)
+
+    def load_all(self, files: list = None):
+        """Load all files (generic files have nothing to load, but subclasses do).
+
+        :param files: subset of file objects to load (defaults to all files)
+        :type files: list
+        """
+        return
+
+    def stream_pipeline(self, chunk_size: int, verbose: bool = False):
+        """Run the pipeline in bounded-size chunks, releasing loaded data after each chunk is processed.
+
+        :param chunk_size: maximum number of files loaded at once
+        :type chunk_size: int
+        :param verbose: flag to indicate verbosity
+        :type verbose: bool
+        :return: generator of processed files (available before the whole run finishes)
+        """
+        for fobj in self.pipeline.stream(self, chunk_size, verbose=verbose):
+            yield fobj
+        self.save_manifest()
+        if verbose:
+            print("Pipeline completed")
+
+    def run_pipeline(
+        self,
+        verbose: bool = False,
+        previous_state: dict = None,
+        chunk_size: int = None,
+        checkpoint: str = None,
+        checkpoint_interval: int = None,
+        resume_from: str = None,
+    ):
         """Run the pipeline as configured.
 
         :param verbose: flag to indicate verbosity
         :type verbose: bool
+        :param previous_state: state from :meth:`get_state` after a previous run (only new files are processed)
+        :type previous_state: dict
+        :param chunk_size: if specified, run in streaming mode with at most this many files loaded at once
+        :type chunk_size: int
+        :param checkpoint: optional path where the progress is journaled after each step, to resume the run with
+            `resume_from` if it's interrupted (e.g. by running out of memory)
+        :type checkpoint: str
+        :param checkpoint_interval: if specified, also journal the progress of per-file steps after this many files
+        :type checkpoint_interval: int
+        :param resume_from: path of a checkpoint to resume from (the run starts over if the file doesn't exist)
+        :type resume_from: str
         """
-        self.pipeline(self, verbose=verbose)
+        new_files, resume = self._prepare_run(
+            previous_state, chunk_size, checkpoint, resume_from
+        )
+        if chunk_size is not None:
+            for _ in self.stream_pipeline(chunk_size, verbose=verbose):
+                pass
+            return
+        self.pipeline(
+            self,
+            verbose=verbose,
+            new_files=new_files,
+            checkpoint=checkpoint,
+            checkpoint_interval=checkpoint_interval,
+            resume=resume,
+        )
+        self.save_manifest()
         if verbose:
             print("Pipeline completed")
@@ -1,5 +1,5 @@
 """Class definition for filter by label."""
-from kaishi.core.misc import trim_list_by_inds
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
 
 
@@ -8,20 +8,21 @@ class FilterByLabel(PipelineComponent):
 
     def __init__(self):
         super().__init__()
+        self.cost = Costs.METADATA
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
         self.configure()
 
     def __call__(self, dataset):
         if self.label_to_filter is None:
             return []
-        to_trim = []
-        for i in self.get_target_indexes(dataset):
-            if dataset.files[i].has_label(self.label_to_filter):
-                to_trim.append(i)
-        dataset.files, trimmed = trim_list_by_inds(dataset.files, to_trim)
-        dataset.filtered["label_match"] = trimmed
+        return self.process_files(dataset)
 
-        return trimmed
+    def process_file(self, fobj, index: int):
+        if self.label_to_filter is None:
+            return True
+        return not fobj.has_label(self.label_to_filter)
 
     def configure(self, label_to_filter=None):
         """Specify the label to filter.
@@ -30,3 +31,4 @@ class FilterByLabel(PipelineComponent):
         :type label_to_filter: str
         """
         self.label_to_filter = label_to_filter
+        self.filter_key = None if label_to_filter is None else "label_match"
@@ -1,6 +1,6 @@
 """Class definition for filter by regex."""
 import re
-from kaishi.core.misc import trim_list_by_inds
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
 
 
@@ -9,19 +9,19 @@ class FilterByRegex(PipelineComponent):
 
     def __init__(self):
         super().__init__()
+        self.cost = Costs.METADATA
+        self.commutative = True
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
+        self.filter_key = "regex"
         self.configure()
 
     def __call__(self, dataset):
+        return self.process_files(dataset)
 
-        to_trim = []
-        for i in self.get_target_indexes(dataset):
-            if re.match(self.pattern, str(dataset.files[i])):
-                to_trim.append(i)
-        dataset.files, trimmed = trim_list_by_inds(dataset.files, to_trim)
-        dataset.filtered["regex"] = trimmed
-
-        return trimmed
+    def process_file(self, fobj, index: int):
+        return re.match(self.pattern, str(fobj)) is None
 
     def configure(self, pattern="/(?=a)b/"):
         """Configure the regex pattern to match (default does not filter).
@@ -1,26 +1,56 @@
 """Class definition for filtering duplicate files."""
-from kaishi.core.misc import find_duplicate_inds
+from kaishi.core.misc import find_duplicate_files
 from kaishi.core.misc import trim_list_by_inds
 from kaishi.core.misc import CollapseChildren
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
 
 
 class FilterDuplicateFiles(PipelineComponent):
-    """Filter duplicate files, detected via hashing."""
+    """Filter duplicate files, detected via hashing (only files with matching sizes and partial hashes are fully hashed)."""
 
     def __init__(self):
         super().__init__()
+        self.cost = Costs.CONTENT
+        self.incremental = True
+        self.filter_key = "duplicates"
+        self.memoizable = True
+        self.configure()
 
     def __call__(self, dataset):
-        hashlist = [
-            f.hash if f.hash is not None else f.compute_hash() for f in dataset.files
-        ]
-
-        duplicate_ind, parent_ind = find_duplicate_inds(hashlist)
+        duplicate_ind, parent_ind = find_duplicate_files(
+            dataset.files, algorithm=self.hash_algorithm, workers=self.workers
+        )
         for di, pi in zip(duplicate_ind, parent_ind):
-            dataset.files[pi].children["duplicates"].append(dataset.files[di])
+            dataset.files[pi].children[self.filter_key].append(dataset.files[di])
         dataset.files, trimmed = trim_list_by_inds(dataset.files, duplicate_ind)
-        dataset.filtered["duplicates"] = trimmed
+        dataset.filtered[self.filter_key] = trimmed
         CollapseChildren()(dataset)
 
         return trimmed
+
+    def commutes_with(self, other):
+        """Check if a component can swap places with this filter: commutative filters (e.g. by name, extension or
+        header) can run first, so fewer files are compared.
+
+        Which file of a group of duplicates is kept can change: if the file kept in the given order is removed by
+        the other filter afterwards, another file of the group is kept instead (and files rejected by both
+        filters are filtered by the one that runs first).
+
+        :param other: pipeline component next to this one
+        :type other: :class:`kaishi.core.pipeline_component.PipelineComponent`
+        :return: flag indicating the components can swap places
+        :rtype: bool
+        """
+        return other.commutative
+
+    def configure(self, hash_algorithm="md5", workers=1):
+        """Configure the digest algorithm used to detect duplicates.
+
+        :param hash_algorithm: "md5", any other `hashlib` algorithm (e.g. the faster "blake2b"), or "xxh64" if `xxhash` is installed
+        :type hash_algorithm: str
+        :param workers: number of threads used to hash files concurrently (hashing releases the GIL)
+        :type workers: int
+        """
+        self.hash_algorithm = hash_algorithm
+        self.workers = workers
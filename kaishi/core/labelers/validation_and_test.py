@@ -1,6 +1,7 @@
 """Class definition for validation and test labeler."""
 import random
 from kaishi.core.misc import trim_list_by_inds
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
 
 
@@ -9,6 +10,7 @@ class LabelerValidationAndTest(PipelineComponent):
 
     def __init__(self):
         super().__init__()
+        self.cost = Costs.METADATA
         self.configure()
 
     def __call__(self, dataset):
@@ -0,0 +1,132 @@
+"""Class definition for a persistent on-disk manifest of file attributes."""
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+MANIFEST_VERSION = 4  # Bump when the table layout changes, old manifests are discarded
+MANIFEST_COLUMNS = [  # Cached per file
+    "hash",
+    "hash_algorithm",
+    "perceptual_hash",
+    "perceptual_hash_type",
+    "perceptual_hash_decode",
+]
+
+
+class Manifest:
+    """SQLite-backed record of file sizes, modification times and computed values (e.g. hashes).
+
+    Values computed for a file are reused on a later load as long as the size and modification time of
+    the file are unchanged.
+    """
+
+    def __init__(self, path: str):
+        """Open (or create) a manifest file.
+
+        :param path: path to the manifest file
+        :type path: str
+        """
+        self.path = os.path.abspath(path)
+        manifest_dir = os.path.dirname(self.path)
+        if not os.path.exists(manifest_dir):
+            os.makedirs(manifest_dir)
+        self.connection = sqlite3.connect(self.path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != MANIFEST_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS files")
+            self.connection.execute("PRAGMA user_version = " + str(MANIFEST_VERSION))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            + ", ".join(column + " TEXT" for column in MANIFEST_COLUMNS)
+            + ")"
+        )
+        self.connection.commit()
+
+    def __repr__(self):
+        return "Manifest(" + self.path + ")"
+
+    def is_manifest_file(self, filename: str):
+        """Check if a file belongs to the manifest itself (e.g. if the manifest is stored in the data directory).
+
+        :param filename: name of file to check
+        :type filename: str
+        :return: flag indicating if the file is the manifest or one of its SQLite journals
+        :rtype: bool
+        """
+        return os.path.abspath(filename) in [
+            self.path + suffix for suffix in ["", "-journal", "-wal", "-shm"]
+        ]
+
+    def apply(self, files: list, workers: int = None):
+        """Reuse cached values for every file whose size and modification time are unchanged.
+
+        :param files: file objects to update
+        :type files: list[:class:`kaishi.core.file.File`]
+        :param workers: number of threads used to stat the files
+        :type workers: int
+        :return: number of files with reused values
+        :rtype: int
+        """
+        rows = dict()
+        for row in self.connection.execute(
+            "SELECT path, size, mtime_ns, "
+            + ", ".join(MANIFEST_COLUMNS)
+            + " FROM files"
+        ):
+            rows[row[0]] = row[1:]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stats = list(executor.map(_stat_or_none, files))
+
+        n_reused = 0
+        for fobj, stat in zip(files, stats):
+            row = rows.get(repr(fobj))
+            if stat is None or row is None or tuple(row[:2]) != stat:
+                continue
+            fobj.set_cached_values(dict(zip(MANIFEST_COLUMNS, row[2:])))
+            n_reused += 1
+
+        return n_reused
+
+    def update(self, files: list):
+        """Record the current values of a list of files.
+
+        :param files: file objects to record
+        :type files: list[:class:`kaishi.core.file.File`]
+        """
+        entries = []
+        for fobj in files:
+            if fobj.size is None or fobj.mtime_ns is None:
+                if _stat_or_none(fobj) is None:  # File no longer exists
+                    continue
+            values = fobj.get_cached_values()
+            entries.append(
+                [repr(fobj), fobj.size, fobj.mtime_ns]
+                + [values.get(column) for column in MANIFEST_COLUMNS]
+            )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO files VALUES ("
+            + ", ".join(["?"] * (3 + len(MANIFEST_COLUMNS)))
+            + ")",
+            entries,
+        )
+        self.connection.commit()
+
+    def close(self):
+        """Close the connection to the manifest file."""
+        self.connection.close()
+
+
+def _stat_or_none(fobj):
+    """Stat a file object, returning None if the file can't be read.
+
+    :param fobj: file object to stat
+    :type fobj: :class:`kaishi.core.file.File`
+    :return: size and modification time (None if the stat fails)
+    :rtype: tuple
+    """
+    try:
+        return fobj.stat()
+    except OSError:
+        return None
@@ -0,0 +1,160 @@
+"""Class definition for a cache of pipeline component effects, with functions to record and replay them."""
+import os
+import json
+import hashlib
+from kaishi.core.misc import write_json_atomically
+
+
+COMPONENT_CACHE_VERSION = 1  # Bump when the key or effect layout changes
+STATE_KEYS = ["files", "filtered", "file_states", "completed_steps"]  # Not attributes
+
+
+class ComponentCache:
+    """Record of the effects of memoizable pipeline components, keyed by everything that determines them.
+
+    Keys combine the component class, its configuration and a fingerprint of its input (see
+    :meth:`kaishi.core.file_group.FileGroup.get_fingerprint`), so re-running an unchanged prefix of a pipeline on
+    unchanged files replays the recorded effects (file list, filter results, labels, values, children and
+    transforms) instead of recomputing them. Effects are kept in memory, and also written to a directory if a path
+    is given (so they're shared between processes and sessions).
+    """
+
+    def __init__(self, path: str = None):
+        """Initialize a cache.
+
+        :param path: optional directory where effects are stored as JSON files (created if it doesn't exist)
+        :type path: str
+        """
+        self.path = None if path is None else os.path.abspath(path)
+        if self.path is not None and not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self.effects = dict()
+
+    def __repr__(self):
+        if self.path is None:
+            return "ComponentCache(in memory)"
+        return "ComponentCache(" + self.path + ")"
+
+    def __len__(self):
+        if self.path is None:
+            return len(self.effects)
+        return len([name for name in os.listdir(self.path) if name.endswith(".json")])
+
+    def get(self, key: str):
+        """Look up the effect recorded for a key.
+
+        :param key: cache key from :func:`get_cache_key`
+        :type key: str
+        :return: effect (None if it isn't cached)
+        :rtype: dict
+        """
+        if key not in self.effects and self.path is not None:
+            effect_path = os.path.join(self.path, key + ".json")
+            if os.path.exists(effect_path):
+                with open(effect_path) as effect_file:
+                    self.effects[key] = json.load(effect_file)
+
+        return self.effects.get(key)
+
+    def update(self, key: str, effect: dict):
+        """Record the effect for a key.
+
+        :param key: cache key from :func:`get_cache_key`
+        :type key: str
+        :param effect: effect from :func:`get_effect`
+        :type effect: dict
+        """
+        self.effects[key] = effect
+        if self.path is not None:
+            write_json_atomically(os.path.join(self.path, key + ".json"), effect)
+
+
+def get_cache_key(component, config: dict, fingerprint: str):
+    """Get the cache key of a component run.
+
+    :param component: pipeline component
+    :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+    :param config: configuration of the component
+    :type config: dict
+    :param fingerprint: fingerprint of the input dataset
+    :type fingerprint: str
+    :return: hex digest
+    :rtype: str
+    """
+    description = json.dumps(
+        [
+            COMPONENT_CACHE_VERSION,
+            component.__class__.__module__ + "." + component.__class__.__qualname__,
+            config,
+            fingerprint,
+        ],
+        sort_keys=True,
+        default=repr,
+    )
+
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def normalize_state(state: dict):
+    """Convert a state from :meth:`kaishi.core.file_group.FileGroup.get_state` to plain JSON types for comparisons.
+
+    :param state: state dictionary
+    :type state: dict
+    :return: state with the same contents as after a JSON round trip
+    :rtype: dict
+    """
+    return json.loads(json.dumps(state, default=repr))
+
+
+def get_effect(before: dict, after: dict):
+    """Get the changes a component made to a dataset.
+
+    :param before: normalized state before running the component
+    :type before: dict
+    :param after: normalized state after running the component
+    :type after: dict
+    :return: file list, changed filter results, changed file states and changed dataset attributes
+    :rtype: dict
+    """
+    return {
+        "files": after["files"],
+        "filtered": {
+            k: after["filtered"][k]
+            for k in after["filtered"]
+            if before["filtered"].get(k) != after["filtered"][k]
+        },
+        "file_states": {
+            name: after["file_states"][name]
+            for name in after["file_states"]
+            if before["file_states"].get(name) != after["file_states"][name]
+        },
+        "attributes": {
+            k: after[k]
+            for k in after
+            if k not in STATE_KEYS and before.get(k) != after[k]
+        },
+    }
+
+
+def replay_effect(dataset, effect: dict):
+    """Apply the changes recorded by :func:`get_effect` to a dataset with the same input.
+
+    :param dataset: dataset to change
+    :type dataset: :class:`kaishi.core.file_group.FileGroup`
+    :param effect: recorded effect
+    :type effect: dict
+    """
+    files_by_name = {repr(fobj): fobj for fobj in dataset._get_all_files()}
+    dataset.files = [files_by_name[name] for name in effect["files"]]
+    for k in effect["filtered"]:
+        dataset.filtered[k] = [files_by_name[name] for name in effect["filtered"][k]]
+    for name, file_state in effect["file_states"].items():
+        fobj = files_by_name[name]
+        fobj.labels = []  # Components may remove labels too
+        fobj.set_state(file_state)
+        for k in file_state["children"]:
+            fobj.children[k] = [
+                files_by_name[child] for child in file_state["children"][k]
+            ]
+    for k, value in effect["attributes"].items():
+        setattr(dataset, k, value)
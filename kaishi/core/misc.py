@@ -1,8 +1,24 @@
 """Miscellaneous helper functions."""
 import hashlib
+import json
 import os
-import numpy as np
+import queue
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from kaishi.core.pipeline_component import PipelineComponent
+from kaishi.core.costs import Costs
+
+try:
+    import xxhash
+except ImportError:  # Optional dependency
+    xxhash = None
+
+
+PARTIAL_HASH_BYTES = 4096  # Bytes hashed at each end of a file when prefiltering
+HASH_CHUNK_SIZE = 1 << 20  # Bytes read at a time when hashing a file
+PREFETCH_POLL_INTERVAL = 0.1  # Seconds between checks for a stopped consumer
 
 
 def load_files_by_walk(dir_name_raw: str, file_initializer, recursive: bool = False):
@@ -34,6 +50,103 @@ def load_files_by_walk(dir_name_raw: str, file_initializer, recursive: bool = Fa
     return dir_name, dir_children, files
 
 
+def _scan_directory(dir_path: str):
+    """List the immediate contents of a directory with a single `os.scandir` call.
+
+    Directories that can't be read (e.g. without permission) are skipped, like `os.walk` does by default.
+
+    :param dir_path: directory to scan
+    :type dir_path: str
+    :return: sorted file names and sorted subdirectory names (symbolic links to directories are not followed),
+        both empty if the directory can't be read
+    :rtype: list and list
+    """
+    filenames = []
+    subdir_names = []
+    try:
+        entries = os.scandir(dir_path)
+    except OSError:
+        return [], []
+    with entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not entry.is_symlink():  # Match os.walk(followlinks=False)
+                    subdir_names.append(entry.name)
+            else:
+                filenames.append(entry.name)
+
+    return sorted(filenames), sorted(subdir_names)
+
+
+def load_files_by_scandir(
+    dir_name_raw: str, file_initializer, recursive: bool = False, workers: int = None
+):
+    """Load files from a directory with an option to recurse, scanning subdirectories in parallel.
+
+    Each level of the directory tree is fanned out over a thread pool of `os.scandir` calls, and the
+    results are assembled in sorted, top-down order so the output is deterministic.
+
+    :param dir_name_raw: Directory to load file structure from
+    :type dir_name_raw: str
+    :param file_initializer: Data file class to initialize each file with
+    :type file_initializer: kaishi file initializer class (e.g. :class:`kaishi.core.file.File`)
+    :param recursive: Option to load recursively, defaults to False
+    :type recursive: bool
+    :param workers: number of threads used to scan directories (defaults to the `ThreadPoolExecutor` default)
+    :type workers: int
+    :return: canonical directory name, list of subdirectories, and list of initialized files
+    :rtype: str, list, and list
+    """
+    dir_name = os.path.abspath(dir_name_raw)
+    listings = dict()  # Relative path (None at the top level) -> directory listing
+    to_scan = [None]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(to_scan) > 0:
+            abspaths = [
+                dir_name if relpath is None else os.path.join(dir_name, relpath)
+                for relpath in to_scan
+            ]
+            next_to_scan = []
+            for relpath, listing in zip(
+                to_scan, executor.map(_scan_directory, abspaths)
+            ):
+                listings[relpath] = listing
+                if recursive:
+                    for subdir_name in listing[1]:
+                        next_to_scan.append(
+                            subdir_name
+                            if relpath is None
+                            else os.path.join(relpath, subdir_name)
+                        )
+            to_scan = next_to_scan
+
+    dir_children = []
+    seen_children = set()
+    files = []
+    stack = [None]
+    while len(stack) > 0:  # Assemble in top-down order, like os.walk
+        relpath = stack.pop()
+        if relpath is not None and relpath not in seen_children:
+            seen_children.add(relpath)
+            dir_children.append(relpath)
+        filenames, subdir_names = listings[relpath]
+        for filename in filenames:
+            files.append(file_initializer(dir_name, relpath, filename))
+        if recursive:
+            for subdir_name in reversed(subdir_names):
+                stack.append(
+                    subdir_name
+                    if relpath is None
+                    else os.path.join(relpath, subdir_name)
+                )
+
+    return dir_name, dir_children, files
+
+
 def trim_list_by_inds(list_to_trim: list, indices: list):
     """Trim a list given an unordered list of indices.
 
@@ -58,68 +171,262 @@ def trim_list_by_inds(list_to_trim: list, indices: list):
 def find_duplicate_inds(list_with_duplicates: list):
     """Find indices of duplicates in a list.
 
-    :param list_with_duplicates: list containing duplicate items
+    :param list_with_duplicates: list containing duplicate (hashable) items
     :type list_with_duplicates: list
     :return: list of duplicate indices, list of unique items (parents of duplicates)
     :rtype: list and list
     """
-    found = []
-    foundind = []
+    first_index = dict()  # Item -> index of its first occurrence
     badind = []
     parentind = []
 
     for i, item in enumerate(list_with_duplicates):
-        try:
-            parentind.append(foundind[found.index(item)])
+        parent = first_index.setdefault(item, i)
+        if parent != i:
             badind.append(i)
-        except ValueError:
-            found.append(item)
-            foundind.append(i)
+            parentind.append(parent)
 
     return badind, parentind
 
 
+def find_duplicate_files(
+    file_list: list,
+    partial_bytes: int = PARTIAL_HASH_BYTES,
+    algorithm: str = "md5",
+    workers: int = 1,
+):
+    """Find indices of duplicate files while reading as little data as possible.
+
+    Files are grouped by size first. Only files sharing a size have the first and last `partial_bytes` bytes
+    hashed, and only files that still collide are hashed in full (reusing any hash that is already known).
+
+    :param file_list: list of file objects
+    :type file_list: list[:class:`kaishi.core.file.File`]
+    :param partial_bytes: number of bytes to hash at each end of a file before computing a full hash
+    :type partial_bytes: int
+    :param algorithm: digest algorithm (see :func:`get_hasher`)
+    :type algorithm: str
+    :param workers: number of threads used to read and hash files
+    :type workers: int
+    :return: list of duplicate indices, list of unique items (parents of duplicates)
+    :rtype: list and list
+    """
+    keys = [("unique", i) for i in range(len(file_list))]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        to_stat = [fobj for fobj in file_list if fobj.size is None]
+        list(executor.map(lambda fobj: fobj.stat(), to_stat))
+        size_groups = defaultdict(list)
+        for i, fobj in enumerate(file_list):
+            size_groups[fobj.size].append(i)
+
+        colliding = []
+        to_prefilter = []
+        for size, inds in size_groups.items():
+            if len(inds) == 1:
+                continue
+            if size <= 2 * partial_bytes or all(
+                [file_list[i].hash_algorithm == algorithm for i in inds]
+            ):
+                colliding.append(inds)  # Partial hash wouldn't save anything
+            else:
+                to_prefilter.append(inds)
+
+        prefilter_inds = [i for inds in to_prefilter for i in inds]
+        partial_hashes = dict(
+            zip(
+                prefilter_inds,
+                executor.map(
+                    lambda i: partial_hash_file(
+                        file_list[i].abspath, partial_bytes, algorithm
+                    ),
+                    prefilter_inds,
+                ),
+            )
+        )
+        for inds in to_prefilter:
+            partial_groups = defaultdict(list)
+            for i in inds:
+                partial_groups[partial_hashes[i]].append(i)
+            colliding.extend(
+                [group for group in partial_groups.values() if len(group) > 1]
+            )
+
+        to_hash = [
+            file_list[i]
+            for group in colliding
+            for i in group
+            if file_list[i].hash is None or file_list[i].hash_algorithm != algorithm
+        ]
+        list(executor.map(lambda fobj: fobj.compute_hash(algorithm), to_hash))
+
+    for group in colliding:
+        for i in group:
+            keys[i] = ("hash", file_list[i].hash)
+
+    return find_duplicate_inds(keys)
+
+
+class BKTree:
+    """Burkhard-Keller tree for finding values within a distance threshold of a query value.
+
+    The distance (`abs(a - b)` by default, which is the Hamming distance for `imagehash` hashes) must be a
+    metric. Values at distance 0 from a value already in the tree are not stored again.
+    """
+
+    def __init__(self, distance=None):
+        """Initialize an empty tree.
+
+        :param distance: function computing the distance between two values (defaults to `abs(a - b)`)
+        :type distance: function
+        """
+        self.distance = distance if distance is not None else _absolute_difference
+        self.root = None  # Each node is [value, index, {distance: child node}]
+
+    def add(self, value, index: int):
+        """Add a value to the tree.
+
+        :param value: value to add
+        :param index: index identifying the value
+        :type index: int
+        """
+        if self.root is None:
+            self.root = [value, index, dict()]
+            return
+        node = self.root
+        while True:
+            d = self.distance(value, node[0])
+            if d == 0:
+                return
+            if d not in node[2]:
+                node[2][d] = [value, index, dict()]
+                return
+            node = node[2][d]
+
+    def query(self, value, threshold):
+        """Find the indices of all values within a distance threshold.
+
+        :param value: value to compare against
+        :param threshold: maximum distance (inclusive)
+        :type threshold: int or float
+        :return: indices of matching values
+        :rtype: list
+        """
+        matches = []
+        if self.root is None:
+            return matches
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            d = self.distance(value, node[0])
+            if d <= threshold:
+                matches.append(node[1])
+            for child_distance, child in node[2].items():
+                if d - threshold <= child_distance <= d + threshold:
+                    stack.append(child)
+
+        return matches
+
+
+def _absolute_difference(a, b):
+    """Default distance for :class:`BKTree`.
+
+    :return: absolute value of `a - b`
+    """
+    return abs(a - b)
+
+
 def find_similar_by_value(list_of_values: list, difference_threshold):
     """Find near duplicates based on similar reference value.
 
+    Each value is matched against all earlier values using a :class:`BKTree`, and its parent is the earliest
+    value within the threshold.
+
     :param list_of_values: list of values to compare
     :type list_of_values: list
     :param difference_threshold: differences above this threshold will be identified for removal
     :return: list of similar indices, list of unique items (parents of similar items)
     :rtype: list and list
     """
-
-    badind = []
-    parentind = []
-    if not isinstance(
-        list_of_values, np.ndarray
-    ):  # Make sure it's a numpy array, convert if not
-        array_of_values = np.array(list_of_values)
-    else:
-        array_of_values = list_of_values
-
-    for i in range(len(array_of_values) - 1, -1, -1):
-        if array_of_values[i] is None:
-            array_of_values = array_of_values[:-1]
+    tree = BKTree()
+    parents = dict()
+    for i, value in enumerate(list_of_values):
+        if value is None:
             continue
-        differences = np.array(
-            [
-                difference_threshold + 1
-                if value is None
-                else np.abs(value - array_of_values[-1])
-                for value in array_of_values[:-1]
-            ]
-        )
-        found_locs = np.nonzero(differences <= difference_threshold)[0]
+        matches = tree.query(value, difference_threshold)
+        if len(matches) > 0:
+            parents[i] = min(matches)
+        tree.add(value, i)
 
-        if len(found_locs) > 0:
-            badind.append(i)
-            parentind.append(found_locs[0])
-        array_of_values = array_of_values[:-1]
+    badind = sorted(parents.keys(), reverse=True)
+    parentind = [parents[i] for i in badind]
 
     return badind, parentind
 
 
+def get_hasher(algorithm: str = "md5"):
+    """Get a new hash object for a digest algorithm.
+
+    Any algorithm supported by `hashlib` can be used (e.g. "md5", "sha1" or the faster "blake2b"), as well as
+    "xxh64", "xxh3_64" and "xxh128" if the optional `xxhash` package is installed.
+
+    :param algorithm: name of the digest algorithm
+    :type algorithm: str
+    :return: hash object with `update()` and `hexdigest()` methods
+    """
+    if algorithm.startswith("xxh"):
+        if xxhash is None:
+            raise ImportError("The xxhash package is required for " + algorithm)
+        return getattr(xxhash, algorithm)()
+
+    return hashlib.new(algorithm)
+
+
+def hash_file(filename: str, algorithm: str = "md5", chunk_size: int = HASH_CHUNK_SIZE):
+    """Compute the hash of a file, reading it in chunks so memory use is constant.
+
+    :param filename: name of file to compute hash of
+    :type filename: str
+    :param algorithm: digest algorithm (see :func:`get_hasher`)
+    :type algorithm: str
+    :param chunk_size: number of bytes read at a time
+    :type chunk_size: int
+    :return: hash value
+    """
+    hasher = get_hasher(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filename, "rb", buffering=0) as fd:
+        n_read = fd.readinto(buf)
+        while n_read:
+            hasher.update(view[:n_read])
+            n_read = fd.readinto(buf)
+
+    return hasher.hexdigest()
+
+
+def partial_hash_file(
+    filename: str, n_bytes: int = PARTIAL_HASH_BYTES, algorithm: str = "md5"
+):
+    """Compute the hash of the first and last `n_bytes` bytes of a file.
+
+    :param filename: name of file to compute hash of
+    :type filename: str
+    :param n_bytes: number of bytes to read at each end of the file
+    :type n_bytes: int
+    :param algorithm: digest algorithm (see :func:`get_hasher`)
+    :type algorithm: str
+    :return: hash value
+    """
+    hasher = get_hasher(algorithm)
+    with open(filename, "rb") as fd:
+        hasher.update(fd.read(n_bytes))
+        fd.seek(0, os.SEEK_END)
+        fd.seek(max(fd.tell() - n_bytes, 0))
+        hasher.update(fd.read(n_bytes))
+
+    return hasher.hexdigest()
+
+
 def md5sum(filename: str):
     """Compute the md5sum of a file.
 
@@ -127,12 +434,78 @@ def md5sum(filename: str):
     :type filename: str
     :return: hash value
     """
-    with open(filename, "rb") as fd:
-        buf = fd.read()
-        hasher = hashlib.md5()
-        hasher.update(buf)
+    return hash_file(filename, algorithm="md5")
 
-        return hasher.hexdigest()
+
+def prefetch(iterable, depth: int = 2):
+    """Iterate in a background thread, keeping up to `depth` items ready ahead of the consumer.
+
+    The queue between the two is bounded, so the producer blocks once `depth` items are waiting (i.e. memory
+    stays bounded). Exceptions raised while producing items are re-raised in the consumer.
+
+    :param iterable: iterable to produce items from (e.g. a generator of batches)
+    :type iterable: iterable
+    :param depth: maximum number of items produced ahead of the consumer
+    :type depth: int
+    :return: generator of the items of `iterable`
+    """
+    items = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(kind, value):
+        while not stop.is_set():
+            try:
+                items.put((kind, value), timeout=PREFETCH_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False  # Consumer stopped early
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put("item", item):
+                    if hasattr(iterable, "close"):  # Release generator resources
+                        iterable.close()
+                    return
+        except Exception as error:
+            put("error", error)
+            return
+        put("done", None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "error":
+                raise value
+            if kind == "done":
+                return
+            yield value
+    finally:
+        stop.set()
+
+
+def write_json_atomically(path: str, data):
+    """Write a JSON file so that readers (e.g. a resumed run after a crash) never see a partially written file.
+
+    :param path: destination path
+    :type path: str
+    :param data: JSON-serializable data
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as temp_file:
+            json.dump(data, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
 
 
 class CollapseChildren(PipelineComponent):
@@ -140,8 +513,16 @@ class CollapseChildren(PipelineComponent):
 
     def __init__(self):
         super().__init__()
+        self.cost = Costs.METADATA
+        self.per_file = True
+        self.fusable = True
 
     def __call__(self, dataset):
+        # Recursively collapse tree for all files in this group
+        for fobj in dataset.files:
+            self.process_file(fobj, None)
+
+    def process_file(self, fobj, index: int):
         def recursive_collapse_children(
             parent, top_level_children, top_level_call=True, top_level_key=None
         ):
@@ -160,10 +541,7 @@ class CollapseChildren(PipelineComponent):
                 for k in parent.children:
                     parent.children[k] = []
 
-        for (
-            fobj
-        ) in dataset.files:  # Recursively collapse tree for all files in this group
-            recursive_collapse_children(fobj, fobj.children)
+        recursive_collapse_children(fobj, fobj.children)
 
 
 def is_valid_label(label_str: str, label_enum):
@@ -1,5 +1,21 @@
 """Class definition for a pipeline object."""
+import copy
 import inspect
+import json
+import time
+from kaishi.core.misc import write_json_atomically
+from kaishi.core.profiling import StepProfiler
+from kaishi.core.profiling import merge_profiles
+from kaishi.core.profiling import profile_report
+from kaishi.core.tracing import span
+from kaishi.core.costs import Costs
+from kaishi.core.memoization import get_cache_key
+from kaishi.core.memoization import get_effect
+from kaishi.core.memoization import normalize_state
+from kaishi.core.memoization import replay_effect
+
+
+CHECKPOINT_VERSION = 1  # Bump when the checkpoint layout changes
 
 
 class Pipeline:
@@ -8,25 +24,560 @@ class Pipeline:
     def __init__(self):
         self.components = []
         self.completed_steps = []
+        self.trace_memory = False  # Measure peak Python memory (slows down allocations)
+        self.profiles = dict()  # Profiles of the current run, by component ID
+        self.fuse = True  # Run consecutive fusable components in a single pass
+        self.component_cache = None  # Optional `ComponentCache` of component effects
+        self.given_order = dict()  # Index of each component before `optimize`, by ID
 
-    def __call__(self, dataset, verbose: bool = False):
+    def __call__(
+        self,
+        dataset,
+        verbose: bool = False,
+        new_files: list = None,
+        checkpoint: str = None,
+        checkpoint_interval: int = None,
+        resume: dict = None,
+        loader=None,
+    ):
         """Run the full pipeline as configured.
 
+        Unless `fuse` is disabled, consecutive fusable components (see
+        :meth:`kaishi.core.pipeline_component.PipelineComponent.process_files`) run in a single pass, where each
+        file goes through all of them in turn.
+
+        :param dataset: dataset to perform pipeline operations on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        :param verbose: flag to indicate verbosity
+        :type verbose: bool
+        :param new_files: if specified, `dataset.files` is assumed to be the result of a previous run and only
+            these new files are processed (see :meth:`kaishi.core.file_group.FileGroup.prepare_incremental_run`)
+        :type new_files: list
+        :param checkpoint: optional path of a journal of the progress, written after each step (see
+            :meth:`kaishi.core.file_group.FileGroup.load_checkpoint` to resume from it)
+        :type checkpoint: str
+        :param checkpoint_interval: if specified, per-file steps run on chunks of this many files with the
+            progress journaled after each chunk
+        :type checkpoint_interval: int
+        :param resume: checkpoint restored onto `dataset` by :meth:`kaishi.core.file_group.FileGroup.load_checkpoint`,
+            to continue from its first unfinished step
+        :type resume: dict
+        :param loader: optional function that loads a list of files (e.g. decodes images), called on the remaining
+            files before the first step that isn't a cheap commutative filter (see :meth:`_needs_loaded_files`), or
+            after the last step, so files removed by the leading filters are never loaded
+        :type loader: function
+        """
+        self.completed_steps = []
+        self.profiles = dict()
+        if new_files is not None:
+            self._run_incremental(dataset, new_files, verbose)
+            return
+        pending = None  # Files the next step hasn't processed yet (None for all)
+        if resume is not None:
+            self.completed_steps = copy.deepcopy(resume["state"]["completed_steps"])
+            pending = resume["pending"]
+        start = len(self.completed_steps)
+        for group in self._get_fused_groups(self.components[start:]):
+            if loader is not None and self._needs_loaded_files(group):
+                loader(dataset.files)
+                loader = None
+            if verbose:
+                print(
+                    "Running "
+                    + " + ".join([component.__class__.__name__ for component in group])
+                )
+            if pending is not None:  # Resuming a partially processed per-file step
+                self._run_in_chunks(
+                    group, dataset, pending, checkpoint, checkpoint_interval
+                )
+            elif checkpoint_interval is not None and all(
+                [getattr(component, "per_file", False) for component in group]
+            ):
+                self._run_in_chunks(
+                    group, dataset, None, checkpoint, checkpoint_interval
+                )
+            else:
+                self._run_group(group, dataset)
+            pending = None
+            for component in group:
+                self.completed_steps.append(self._get_step(component, profile=True))
+            if checkpoint is not None:
+                self._write_checkpoint(checkpoint, dataset)
+        if loader is not None:  # Only cheap filters ran
+            loader(dataset.files)
+
+    def _needs_loaded_files(self, group: list):
+        """Check if a group of components may read loaded data, i.e. isn't made of commutative filters that read
+        less than decoded data (e.g. file names or headers).
+
+        :param group: components that run together
+        :type group: list
+        :return: flag indicating the files have to be loaded first
+        :rtype: bool
+        """
+        return any(
+            [
+                not self._is_commutative(component)
+                or self._get_cost(component) >= Costs.DECODE
+                for component in group
+            ]
+        )
+
+    def _run_group(self, group: list, dataset):
+        """Run a group of components from :meth:`_get_fused_groups`.
+
+        :param group: components to run (fused if there are several)
+        :type group: list
+        :param dataset: dataset to perform pipeline operations on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        """
+        if len(group) == 1:
+            self._run_component(group[0], dataset)
+        else:
+            self._run_fused(group, dataset)
+
+    def _run_in_chunks(
+        self, group: list, dataset, pending: list, checkpoint: str, chunk_size: int
+    ):
+        """Run a group of per-file components on chunks of files, journaling the progress after each chunk.
+
+        :param group: per-file components to run
+        :type group: list
+        :param dataset: dataset to perform pipeline operations on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        :param pending: files that haven't been processed by the group yet (None for all files)
+        :type pending: list
+        :param checkpoint: path of the journal (None to skip journaling)
+        :type checkpoint: str
+        :param chunk_size: number of files in each chunk (None for a single chunk)
+        :type chunk_size: int
+        """
+        if pending is None:
+            pending = list(dataset.files)
+        if chunk_size is None:
+            chunk_size = max(1, len(pending))
+        pending_ids = set(id(fobj) for fobj in pending)
+        processed = [fobj for fobj in dataset.files if id(fobj) not in pending_ids]
+        for start in range(0, len(pending), chunk_size):
+            view = dataset._get_view(pending[start : start + chunk_size])
+            self._run_group(group, view)
+            dataset._merge_view(view)
+            processed.extend(view.files)
+            dataset.files = processed + pending[start + chunk_size :]
+            if checkpoint is not None and start + chunk_size < len(pending):
+                self._write_checkpoint(
+                    checkpoint, dataset, pending[start + chunk_size :]
+                )
+
+    def _write_checkpoint(self, path: str, dataset, pending: list = None):
+        """Journal the progress of a run: dataset state, completed steps and files pending in the next step.
+
+        :param path: path of the journal (replaced atomically)
+        :type path: str
+        :param dataset: dataset the pipeline runs on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        :param pending: files the next step hasn't processed yet (None for all)
+        :type pending: list
+        """
+        state = dataset.get_state()
+        state["completed_steps"] = copy.deepcopy(self.completed_steps)
+        if pending is not None:
+            pending = [repr(fobj) for fobj in pending]
+        write_json_atomically(
+            path,
+            {
+                "version": CHECKPOINT_VERSION,
+                "steps": [self._get_step(component) for component in self.components],
+                "state": state,
+                "pending": pending,
+            },
+        )
+
+    def matches_checkpoint(self, checkpoint: dict):
+        """Check if a checkpoint was written by a run of this pipeline (same components and configurations).
+
+        :param checkpoint: journal written by a run with a checkpoint path
+        :type checkpoint: dict
+        :return: flag indicating if the run can resume from the checkpoint
+        :rtype: bool
+        """
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            return False
+        steps = [self._get_step(component) for component in self.components]
+
+        return json.dumps(steps, sort_keys=True, default=repr) == json.dumps(
+            checkpoint["steps"], sort_keys=True, default=repr
+        )
+
+    def _get_fused_groups(self, components: list = None):
+        """Split components into groups that run in a single pass (singletons if not fusable).
+
+        :param components: components to split (defaults to all components)
+        :type components: list
+        :return: groups of consecutive components
+        :rtype: list[list]
+        """
+        groups = []
+        for component in self.components if components is None else components:
+            if (
+                (self.fuse or self._is_reordered(component, groups))
+                and getattr(component, "fusable", False)
+                and len(groups) > 0
+                and getattr(groups[-1][-1], "fusable", False)
+            ):
+                groups[-1].append(component)
+            else:
+                groups.append([component])
+
+        return groups
+
+    def _is_reordered(self, component, groups: list):
+        """Check if the optimizer moved a component before one in the last group (so they have to share a pass).
+
+        :param component: pipeline component
+        :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :param groups: groups of components before it
+        :type groups: list[list]
+        :return: flag indicating the component was given before a component of the last group
+        :rtype: bool
+        """
+        if len(groups) == 0 or id(component) not in self.given_order:
+            return False
+
+        return any(
+            self.given_order.get(id(other), -1) > self.given_order[id(component)]
+            for other in groups[-1]
+        )
+
+    def _run_fused(self, components: list, dataset):
+        """Run fusable components in a single pass over the files, with the same results as running them in turn.
+
+        The time spent in each component and its file counts are profiled separately. Peak memory and bytes read
+        are measured for the whole pass and recorded in the profile of the first component. If the optimizer moved
+        a component before others that were given first, a file it rejects is also checked by those (see
+        :meth:`_get_rejecting_component`), so it's filtered under the same key as in the given order.
+
+        :param components: fusable components, in pipeline order
+        :type components: list
+        :param dataset: dataset to perform pipeline operations on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        """
+        n_components = len(components)
+        n_seen = [0] * n_components  # Index of the next file for each component
+        trimmed = [[] for _ in components]
+        wall_times = [0.0] * n_components
+        cpu_times = [0.0] * n_components
+        kept = []
+        names = [component.__class__.__name__ for component in components]
+        with span(" + ".join(names), "pipeline", files=len(dataset.files)):
+            with StepProfiler(dataset, trace_memory=self.trace_memory) as profiler:
+                for fobj in dataset.files:
+                    for k, component in enumerate(components):
+                        index = n_seen[k]
+                        n_seen[k] += 1
+                        if not component.is_target(index, fobj):
+                            continue
+                        wall_start = time.perf_counter()
+                        cpu_start = time.process_time()
+                        keep = component.process_file(fobj, index)
+                        wall_times[k] += time.perf_counter() - wall_start
+                        cpu_times[k] += time.process_time() - cpu_start
+                        if keep is False and component.filter_key is not None:
+                            k = self._get_rejecting_component(
+                                components, k, fobj, n_seen
+                            )
+                            trimmed[k].append(fobj)
+                            break
+                    else:
+                        kept.append(fobj)
+                dataset.files = kept
+                for k, component in enumerate(components):  # As in 'process_files'
+                    if component.filter_key is not None:
+                        dataset.filtered[component.filter_key] = trimmed[k][::-1]
+
+        for k, component in enumerate(components):
+            profile = dict.fromkeys(profiler.profile)
+            if k == 0:
+                profile.update(profiler.profile)
+            profile["wall_time"] = wall_times[k]
+            profile["cpu_time"] = cpu_times[k]
+            profile["files_in"] = n_seen[k]
+            profile["files_out"] = n_seen[k] - len(trimmed[k])
+            self.profiles[id(component)] = merge_profiles(
+                self.profiles.get(id(component)), profile
+            )
+
+    def _get_rejecting_component(self, components: list, k: int, fobj, n_seen: list):
+        """Find the component that would have rejected a file first in the given order (before optimizing).
+
+        :param components: fusable components, in pipeline order
+        :type components: list
+        :param k: position of the component that rejected the file
+        :type k: int
+        :param fobj: rejected file
+        :type fobj: :class:`kaishi.core.file.File`
+        :param n_seen: index of the next file for each component
+        :type n_seen: list[int]
+        :return: position of the first component in the given order that rejects the file
+        :rtype: int
+        """
+        if id(components[k]) not in self.given_order:
+            return k
+        moved = [  # Given before component 'k', but moved after it
+            j
+            for j in range(k + 1, len(components))
+            if self.given_order.get(id(components[j]), len(self.components))
+            < self.given_order[id(components[k])]
+        ]
+        for j in sorted(moved, key=lambda j: self.given_order[id(components[j])]):
+            component = components[j]
+            if (
+                component.filter_key is not None
+                and component.is_target(n_seen[j], fobj)
+                and component.process_file(fobj, n_seen[j]) is False
+            ):
+                return j
+
+        return k
+
+    def _run_incremental(self, dataset, new_files: list, verbose: bool = False):
+        """Run the pipeline on new files only, given a dataset already processed by the same pipeline.
+
         :param dataset: dataset to perform pipeline operations on
         :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        :param new_files: files that have not been processed yet
+        :type new_files: list
         :param verbose: flag to indicate verbosity
         :type verbose: bool
         """
+        existing = list(dataset.files)
+        delta = list(new_files)
+        for k, component in enumerate(self.components):
+            if verbose:
+                print(
+                    "Running "
+                    + component.__class__.__name__
+                    + " on "
+                    + str(len(delta))
+                    + " new files"
+                )
+            later_keys = set(c.filter_key for c in self.components[k + 1 :])
+            passed = [  # Passed this component last time, but a later one filtered them
+                fobj
+                for key in later_keys
+                if key is not None
+                for fobj in dataset.filtered.get(key, [])
+            ]
+            existing, delta = self._run_on_delta(
+                dataset, component, existing, delta, passed
+            )
+            dataset.files = existing + delta
+            self.completed_steps.append(self._get_step(component, profile=True))
+
+    def stream(self, dataset, chunk_size: int, verbose: bool = False):
+        """Run the pipeline on bounded-size chunks of files, yielding the surviving files of each chunk.
+
+        Each chunk is loaded, passed through every component and unloaded again once the yielded files have
+        been consumed, so only compact per-file state (e.g. hashes and labels) is kept for incremental
+        (cross-file) components, which compare each chunk against the files kept from earlier chunks. Components
+        targeting files by index (see :meth:`kaishi.core.pipeline_component.PipelineComponent.applies_to`) can't
+        run this way, since each chunk is processed on its own.
+
+        :param dataset: dataset to perform pipeline operations on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        :param chunk_size: maximum number of files loaded at once
+        :type chunk_size: int
+        :param verbose: flag to indicate verbosity
+        :type verbose: bool
+        :return: generator of processed files
+        """
         for component in self.components:
+            if not (
+                getattr(component, "per_file", False)
+                or getattr(component, "incremental", False)
+            ):
+                raise NotImplementedError(
+                    component.__class__.__name__ + " can't run in streaming mode"
+                )
+            if component.has_index_targets():  # Indexes would refer to chunk positions
+                raise NotImplementedError(
+                    component.__class__.__name__
+                    + " can't run in streaming mode with integer 'applies_to()' targets"
+                )
+        self.completed_steps = []
+        self.profiles = dict()
+        files = list(dataset.files)
+        dataset.files = []
+        stage_survivors = [[] for _ in self.components]  # Kept files at each step
+        for start in range(0, len(files), chunk_size):
+            chunk = files[start : start + chunk_size]
             if verbose:
-                print("Running " + component.__class__.__name__)
-            component(dataset)
-            self.completed_steps.append(
-                {
-                    "step": component.__class__.__name__,
-                    "config": self._get_configs_for_component(component),
-                }
+                print(
+                    "Running chunk of files "
+                    + str(start)
+                    + " to "
+                    + str(start + len(chunk) - 1)
+                )
+            with span("chunk", "batch", start=start, files=len(chunk)):
+                dataset.load_all(chunk)
+                delta = chunk
+                for i, component in enumerate(self.components):
+                    _, delta = self._run_on_delta(
+                        dataset, component, stage_survivors[i], delta
+                    )
+                    if not component.per_file:
+                        stage_survivors[i].extend(delta)
+            dataset.files.extend(delta)
+            for fobj in delta:
+                yield fobj
+            for fobj in chunk:
+                fobj.unload()
+        self.completed_steps = [
+            self._get_step(component, profile=True) for component in self.components
+        ]
+
+    def _run_on_delta(
+        self, dataset, component, existing: list, delta: list, passed: list = None
+    ):
+        """Run a component on a subset of files that haven't been processed yet.
+
+        Per-file components only see the unprocessed files, and incremental (cross-file) components see the
+        processed files followed by the unprocessed files, so only unprocessed files are compared against the
+        processed ones (including files a later component filtered, as in a full run). Filter results are merged
+        into the dataset.
+
+        :param dataset: dataset to perform pipeline operations on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        :param component: per-file or incremental component to run
+        :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :param existing: files that have already been processed by this component
+        :type existing: list
+        :param delta: files that have not been processed yet
+        :type delta: list
+        :param passed: processed files that were kept by this component, but filtered by a later one
+        :type passed: list
+        :return: remaining processed files and remaining unprocessed files
+        :rtype: list and list
+        """
+        passed = [] if passed is None else passed
+        view = dataset._get_view(
+            delta if component.per_file else existing + passed + delta
+        )
+        self._run_component(component, view)
+        dataset._merge_view(view)
+
+        delta_ids = set(id(fobj) for fobj in delta)
+        if not component.per_file:
+            passed_ids = set(id(fobj) for fobj in passed)
+            existing = [
+                fobj
+                for fobj in view.files
+                if id(fobj) not in delta_ids and id(fobj) not in passed_ids
+            ]
+
+        return existing, [fobj for fobj in view.files if id(fobj) in delta_ids]
+
+    def _run_component(self, component, dataset):
+        """Run a component on a dataset, adding its resource usage to the component's profile for this run.
+
+        If a component cache is set, the effect of a memoizable component on the same input (with the same
+        configuration) is replayed from the cache instead of running the component.
+
+        :param component: pipeline component
+        :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :param dataset: dataset (or view of a dataset) to run the component on
+        :type dataset: initiailized kaishi dataset class (e.g. :class `kaishi.image.dataset.Dataset`)
+        """
+        key = None
+        effect = None
+        if self.component_cache is not None and component.memoizable:
+            key = get_cache_key(
+                component,
+                self._get_configs_for_component(component),
+                dataset.get_fingerprint(),
             )
+            effect = self.component_cache.get(key)
+            before = normalize_state(dataset.get_state())
+        name = component.__class__.__name__
+        cached = effect is not None
+        with span(name, "pipeline", files=len(dataset.files), cached=cached):
+            with StepProfiler(dataset, trace_memory=self.trace_memory) as profiler:
+                if effect is None:
+                    component(dataset)
+                else:
+                    replay_effect(dataset, effect)
+        if key is not None and effect is None:
+            after = normalize_state(dataset.get_state())
+            self.component_cache.update(key, get_effect(before, after))
+        self.profiles[id(component)] = merge_profiles(
+            self.profiles.get(id(component)), profiler.profile
+        )
+
+    def supports_incremental(self, previous_state: dict):
+        """Check if a previous state can be used to run this pipeline incrementally.
+
+        This requires every component to be per-file or incremental, without integer `applies_to()` criteria
+        (new files are processed on their own, so indexes wouldn't match positions in the dataset), filters with
+        distinct filter keys (to tell which step filtered a file), and the previous state to come from the same
+        sequence of components with the same configurations.
+
+        :param previous_state: state from :meth:`kaishi.core.file_group.FileGroup.get_state`
+        :type previous_state: dict
+        :return: flag indicating if the pipeline can run incrementally
+        :rtype: bool
+        """
+        for component in self.components:
+            if not (
+                getattr(component, "per_file", False)
+                or getattr(component, "incremental", False)
+            ):
+                return False
+            if component.has_index_targets():
+                return False
+        filter_keys = [
+            component.filter_key
+            for component in self.components
+            if component.filter_key is not None
+        ]
+        if len(set(filter_keys)) < len(filter_keys):
+            return False
+        steps = [self._get_step(component) for component in self.components]
+        previous_steps = [  # Profiles differ between runs
+            {"step": step["step"], "config": step["config"]}
+            for step in previous_state["completed_steps"]
+        ]
+
+        return json.dumps(steps, sort_keys=True, default=repr) == json.dumps(
+            previous_steps, sort_keys=True, default=repr
+        )
+
+    def _get_step(self, component, profile: bool = False):
+        """Get the record of a pipeline step, as stored in `completed_steps`.
+
+        :param component: pipeline component
+        :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :param profile: flag to include the component's profile from the current run (see
+            :class:`kaishi.core.profiling.StepProfiler`)
+        :type profile: bool
+        :return: dictionary with the step name and its configuration (and profile)
+        :rtype: dict
+        """
+        step = {
+            "step": component.__class__.__name__,
+            "config": self._get_configs_for_component(component),
+        }
+        if profile:
+            step["profile"] = self.profiles.get(id(component))
+
+        return step
+
+    def get_profile_report(self):
+        """Get the resource usage of each step of the last run.
+
+        :return: report with a list of steps (name and profile fields) and the totals over all steps
+        :rtype: dict
+        """
+        return profile_report(self.completed_steps)
 
     def __repr__(self):
         """Print pipeline overview."""
@@ -71,6 +622,89 @@ class Pipeline:
         """
         self.components.append(component)
 
+    def optimize(self):
+        """Reorder components so that cheaper ones run first, where the order doesn't matter.
+
+        Each component moves before the components given before it as long as it's in a cheaper cost class (see
+        :class:`kaishi.core.costs.Costs`) and can swap places with each of them (see
+        :meth:`kaishi.core.pipeline_component.PipelineComponent.commutes_with`), so equal costs keep the given
+        order. Commutative filters (deciding on each file by itself, e.g. by name or header) swap with each other,
+        and also move before duplicate and similarity filters. Components targeting files by index never move or
+        get crossed. Reordered commutative filters always share a single pass, where a file rejected by several of
+        them is filtered under the one given first (see :meth:`_run_fused`), so they give the same files and
+        filtered files, only sooner. A duplicate or similarity filter may keep a different file of a group though,
+        if the one it kept in the given order is removed by a filter moved before it.
+
+        :return: plan with the step name, cost class, commutativity and original index of each component
+        :rtype: list[dict]
+        """
+        indexes = []
+        for i, component in enumerate(self.components):
+            position = len(indexes)
+            while position > 0:
+                previous = self.components[indexes[position - 1]]
+                if not (
+                    self._get_cost(component) < self._get_cost(previous)
+                    and self._commutes(component, previous)
+                ):
+                    break
+                position -= 1
+            indexes.insert(position, i)
+        self.given_order = {
+            id(self.components[original_index]): original_index
+            for original_index in indexes
+        }
+        self.components = [self.components[i] for i in indexes]
+
+        return [
+            {
+                "step": self.components[i].__class__.__name__,
+                "cost": self._get_cost(self.components[i]).name,
+                "commutative": self._is_commutative(self.components[i]),
+                "original_index": original_index,
+            }
+            for i, original_index in enumerate(indexes)
+        ]
+
+    def _is_commutative(self, component):
+        """Check if a component can be reordered with its commutative neighbors.
+
+        :param component: pipeline component
+        :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :return: flag indicating the component is commutative and doesn't target files by index
+        :rtype: bool
+        """
+        if not getattr(component, "commutative", False):
+            return False
+
+        return not component.has_index_targets()
+
+    def _commutes(self, first, second):
+        """Check if two components can swap places (neither may target files by index, which depends on the order).
+
+        :param first: pipeline component
+        :type first: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :param second: pipeline component
+        :type second: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :return: flag indicating either component declares it commutes with the other
+        :rtype: bool
+        """
+        for component in [first, second]:
+            if not hasattr(component, "commutes_with") or component.has_index_targets():
+                return False
+
+        return first.commutes_with(second) or second.commutes_with(first)
+
+    def _get_cost(self, component):
+        """Get the cost class of a component (components not inheriting from the base class count as decoding).
+
+        :param component: pipeline component
+        :type component: initialized pipeline component (has to inherit from :class:`kaishi.core.pipeline_component.PipelineComponent`)
+        :return: cost class
+        :rtype: :class:`kaishi.core.costs.Costs`
+        """
+        return getattr(component, "cost", Costs.DECODE)
+
     def remove_component(self, index):
         """Remove a pipeline method by index.
 
@@ -82,3 +716,4 @@ class Pipeline:
     def reset(self):
         """Reset the pipeline by removing all components."""
         self.components = []
+        self.given_order = dict()
@@ -2,6 +2,7 @@
 import warnings
 import re
 import numpy as np
+from kaishi.core.costs import Costs
 
 
 class PipelineComponent:
@@ -10,6 +11,13 @@ class PipelineComponent:
     def __init__(self):
         self.applies_to_available = False
         self.target_criteria = [".*"]
+        self.per_file = False  # Each file is processed independently of the others
+        self.incremental = False  # New files can be compared against processed files
+        self.fusable = False  # Implements `process_file`, so it can share a pass with its neighbors
+        self.filter_key = None  # Where files rejected by the component are filtered
+        self.cost = Costs.DECODE  # What it reads, used by `Pipeline.optimize`
+        self.commutative = False  # Order-independent with commutative neighbors
+        self.memoizable = False  # Same input and config always has the same effect
 
     def __str__(self):
         return self.__class__.__name__
@@ -35,6 +43,65 @@ class PipelineComponent:
         else:
             self.target_criteria = target_criteria
 
+    def commutes_with(self, other):
+        """Check if this component and another one can swap places in a pipeline (see
+        :meth:`kaishi.core.pipeline.Pipeline.optimize`), which by default requires both to be commutative.
+
+        :param other: pipeline component next to this one
+        :type other: :class:`kaishi.core.pipeline_component.PipelineComponent`
+        :return: flag indicating the components can swap places
+        :rtype: bool
+        """
+        return self.commutative and other.commutative
+
+    def has_index_targets(self):
+        """Check if any criteria set using the `applies_to()` method are indexes (which depend on the file order).
+
+        :return: flag indicating integer target criteria
+        :rtype: bool
+        """
+        return any(
+            self._is_valid_target_int(criterion) for criterion in self.target_criteria
+        )
+
+    def process_file(self, fobj, index: int):
+        """Process a single file (implemented by fusable components, see :meth:`process_files`).
+
+        :param fobj: file to process
+        :type fobj: :class:`kaishi.core.file.File`
+        :param index: index of the file in the list of files the component runs on
+        :type index: int
+        :return: `False` to filter the file (into `dataset.filtered[self.filter_key]`), anything else keeps it
+        """
+        raise NotImplementedError(
+            "process_file() method not implemented for " + self.__class__.__name__
+        )
+
+    def process_files(self, dataset):
+        """Run :meth:`process_file` on each target file of a dataset, then remove the rejected files.
+
+        Fusable components implement their operation this way, so the pipeline can also run consecutive
+        fusable components in a single pass over the files (see :meth:`kaishi.core.pipeline.Pipeline`).
+
+        :param dataset: dataset to process
+        :type dataset: initialized kaishi dataset object (e.g. :class:`kaishi.core.dataset.FileDatset`)
+        :return: filtered files, in reverse order (if the component is a filter)
+        :rtype: list
+        """
+        badind = []
+        for i in self.get_target_indexes(dataset):
+            if self.process_file(dataset.files[i], i) is False:
+                badind.append(i)
+        if self.filter_key is None:
+            return None
+
+        bad = set(badind)
+        trimmed = [dataset.files[i] for i in sorted(badind, reverse=True)]
+        dataset.files = [fobj for i, fobj in enumerate(dataset.files) if i not in bad]
+        dataset.filtered[self.filter_key] = trimmed
+
+        return trimmed
+
     def get_target_indexes(self, dataset):
         """Get target indexes of a dataset based on criteria set using the `applies_to()` method
 
@@ -43,20 +110,29 @@ class PipelineComponent:
         :return: list of indexes
         :rtype: list of int
         """
-        targets = []
-        for i, fobj in enumerate(dataset.files):
-            for criterion in self.target_criteria:
-                if self._is_valid_target_int(criterion):
-                    if i == criterion:
-                        targets.append(i)
-                elif self._is_valid_target_str(criterion):
-                    if re.match(criterion, str(fobj)):
-                        targets.append(i)
-                else:
-                    raise TypeError(
-                        "Unrecognized type for 'applies_to()' target criteria"
-                    )
-        return targets
+        return [i for i, fobj in enumerate(dataset.files) if self.is_target(i, fobj)]
+
+    def is_target(self, index: int, fobj):
+        """Check if a file matches the criteria set using the `applies_to()` method.
+
+        :param index: index of the file in the dataset
+        :type index: int
+        :param fobj: file to check
+        :type fobj: :class:`kaishi.core.file.File`
+        :return: flag indicating if the component applies to the file
+        :rtype: bool
+        """
+        for criterion in self.target_criteria:
+            if self._is_valid_target_int(criterion):
+                if index == criterion:
+                    return True
+            elif self._is_valid_target_str(criterion):
+                if re.match(criterion, str(fobj)):
+                    return True
+            else:
+                raise TypeError("Unrecognized type for 'applies_to()' target criteria")
+
+        return False
 
     def _is_valid_target_int(self, target):
         """Check if an index is a valid integer type.
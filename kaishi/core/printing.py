@@ -1,6 +1,9 @@
 """Definitions for print helper utilities."""
 
 
+BYTES_PER_MB = 1024 * 1024
+
+
 def should_print_row(i: int, max_entries: int, num_entries: int):
     """Make decision to print row or not based on max_rows.
 
@@ -27,3 +30,29 @@ def should_print_row(i: int, max_entries: int, num_entries: int):
         else:
             # Do not print
             return 0
+
+
+def format_profile_row(step: dict):
+    """Format a step of a profile report as a table row.
+
+    :param step: step from :func:`kaishi.core.profiling.profile_report`
+    :type step: dict
+    :return: step name, times in seconds, memory and bytes read in megabytes, and file counts ("-" if unavailable)
+    :rtype: list
+    """
+
+    def format_value(value, scale=1, precision=3):
+        if value is None:
+            return "-"
+        return format(value / scale, "." + str(precision) + "f")
+
+    return [
+        step["step"],
+        format_value(step["wall_time"]),
+        format_value(step["cpu_time"]),
+        format_value(step["tracemalloc_peak"], BYTES_PER_MB, 1),
+        format_value(step["rss_peak_delta"], BYTES_PER_MB, 1),
+        "-" if step["files_in"] is None else step["files_in"],
+        "-" if step["files_out"] is None else step["files_out"],
+        format_value(step["bytes_read"], BYTES_PER_MB, 1),
+    ]
@@ -0,0 +1,172 @@
+"""Functions and classes for profiling pipeline components."""
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+PROFILE_FIELDS = [  # Fields of each step profile, in report order
+    "wall_time",
+    "cpu_time",
+    "tracemalloc_peak",
+    "rss_peak_delta",
+    "files_in",
+    "files_out",
+    "bytes_read",
+]
+MAX_FIELDS = ["tracemalloc_peak", "rss_peak_delta"]  # Merged by maximum, not sum
+
+
+class StepProfiler:
+    """Context manager that measures the resources used while running a pipeline component on a dataset.
+
+    After the block, `profile` holds the wall and CPU time (seconds), peak memory allocated by Python (bytes,
+    only if `trace_memory` is set since tracing slows down allocations), growth of the peak resident set size
+    (bytes), file counts before and after, and bytes read by the process. Unavailable values are None.
+    """
+
+    def __init__(self, dataset, trace_memory: bool = False):
+        """Initialize the profiler.
+
+        :param dataset: dataset the component runs on
+        :type dataset: :class:`kaishi.core.file_group.FileGroup`
+        :param trace_memory: flag to measure peak Python memory with `tracemalloc`
+        :type trace_memory: bool
+        """
+        self.dataset = dataset
+        self.trace_memory = trace_memory
+        self.profile = None
+
+    def __enter__(self):
+        self.files_in = len(self.dataset.files)
+        self.started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            elif hasattr(tracemalloc, "reset_peak"):  # Python >= 3.9
+                tracemalloc.reset_peak()
+            self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.rss_start = get_peak_rss()
+        self.bytes_start = get_bytes_read()
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.wall_start
+        cpu_time = time.process_time() - self.cpu_start
+        tracemalloc_peak = None
+        if self.trace_memory:
+            tracemalloc_peak = tracemalloc.get_traced_memory()[1] - self.traced_start
+            if self.started_tracing:
+                tracemalloc.stop()
+        self.profile = {
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+            "tracemalloc_peak": tracemalloc_peak,
+            "rss_peak_delta": _difference(get_peak_rss(), self.rss_start),
+            "files_in": self.files_in,
+            "files_out": len(self.dataset.files),
+            "bytes_read": _difference(get_bytes_read(), self.bytes_start),
+        }
+
+
+def merge_profiles(profile_a: dict, profile_b: dict):
+    """Combine the profiles of several runs of the same component (e.g. on chunks of files).
+
+    :param profile_a: first profile (may be None)
+    :type profile_a: dict
+    :param profile_b: second profile
+    :type profile_b: dict
+    :return: combined profile (peak values are combined by maximum, all others are summed)
+    :rtype: dict
+    """
+    if profile_a is None:
+        return dict(profile_b)
+    merged = dict()
+    for field in PROFILE_FIELDS:
+        values = [
+            profile[field]
+            for profile in [profile_a, profile_b]
+            if profile[field] is not None
+        ]
+        if len(values) == 0:
+            merged[field] = None
+        elif field in MAX_FIELDS:
+            merged[field] = max(values)
+        else:
+            merged[field] = sum(values)
+
+    return merged
+
+
+def get_peak_rss():
+    """Get the peak resident set size of the process.
+
+    :return: peak resident set size in bytes (None if unavailable)
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == "darwin" else peak * 1024  # Kilobytes on Linux
+
+
+def get_bytes_read():
+    """Get the number of bytes the process has read so far (Linux only).
+
+    :return: bytes read via read system calls, including cached reads (None if unavailable)
+    :rtype: int
+    """
+    try:
+        with open("/proc/self/io") as io_file:
+            for line in io_file:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _difference(end, start):
+    """Subtract two measurements that may be unavailable.
+
+    :param end: measurement at the end (None if unavailable)
+    :param start: measurement at the start (None if unavailable)
+    :return: difference (None if either is unavailable)
+    """
+    if end is None or start is None:
+        return None
+    return end - start
+
+
+def profile_report(completed_steps: list):
+    """Build a structured (JSON serializable) report from the profiles recorded in pipeline steps.
+
+    :param completed_steps: steps as recorded in :attr:`kaishi.core.pipeline.Pipeline.completed_steps`
+    :type completed_steps: list[dict]
+    :return: report with a list of steps (name and profile fields) and the totals over all steps
+    :rtype: dict
+    """
+    steps = []
+    for step in completed_steps:
+        profile = step.get("profile") or dict.fromkeys(PROFILE_FIELDS)
+        steps.append(dict(step=step["step"], **profile))
+    total = dict()
+    for field in ["wall_time", "cpu_time", "bytes_read"] + MAX_FIELDS:
+        values = [step[field] for step in steps if step[field] is not None]
+        if len(values) == 0:
+            total[field] = None
+        else:
+            total[field] = max(values) if field in MAX_FIELDS else sum(values)
+    total["files_in"] = steps[0]["files_in"] if len(steps) > 0 else None
+    total["files_out"] = steps[-1]["files_out"] if len(steps) > 0 else None
+
+    return {"steps": steps, "total": total}
@@ -0,0 +1,154 @@
+"""Functions for opt-in tracing of pipeline and per-file work, exported in the Chrome trace event format.
+
+Tracing is off by default, in which case :func:`span` returns a shared no-op context manager. Once started
+with :func:`start_tracing`, each span is recorded as a complete ("X") event with its process and thread IDs, so
+nested spans (e.g. pipeline component > batch > file) show up as stacks in Perfetto or chrome://tracing.
+"""
+import os
+import json
+import threading
+import time
+
+
+_tracer = None  # Active tracer (None when tracing is disabled)
+
+
+class _Tracer:
+    """Thread-safe record of trace events."""
+
+    def __init__(self):
+        self.events = []
+        self.thread_names = dict()
+        self.lock = threading.Lock()
+
+    def add(self, event: dict):
+        """Record an event, naming its thread the first time it's seen.
+
+        :param event: trace event
+        :type event: dict
+        """
+        with self.lock:
+            key = (event["pid"], event["tid"])
+            if key not in self.thread_names:
+                self.thread_names[key] = threading.current_thread().name
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": event["pid"],
+                        "tid": event["tid"],
+                        "args": {"name": self.thread_names[key]},
+                    }
+                )
+            self.events.append(event)
+
+
+class _Span:
+    """Context manager recording the time spent in a block as a complete event."""
+
+    def __init__(self, tracer, name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.event = {"name": name, "cat": category, "ph": "X", "args": args}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.event["ts"] = self.start * 1e6  # Microseconds
+        self.event["dur"] = (end - self.start) * 1e6
+        self.event["pid"] = os.getpid()
+        self.event["tid"] = threading.get_ident()
+        if exc_type is not None:
+            self.event["args"]["error"] = exc_type.__name__
+        self.tracer.add(self.event)
+
+
+class _NullSpan:
+    """Context manager that does nothing (used when tracing is disabled)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, category: str = "kaishi", **args):
+    """Get a context manager that records a span if tracing is enabled.
+
+    :param name: name of the span (e.g. the component or operation)
+    :type name: str
+    :param category: category of the span, e.g. "pipeline", "batch", "io", "hash" or "inference"
+    :type category: str
+    :param args: JSON serializable details shown with the span (e.g. the file name)
+    :return: context manager
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, category, args)
+
+
+def is_tracing():
+    """Check if tracing is enabled.
+
+    :return: flag indicating if spans are being recorded
+    :rtype: bool
+    """
+    return _tracer is not None
+
+
+def start_tracing():
+    """Start recording spans (discarding any spans recorded before)."""
+    global _tracer
+    _tracer = _Tracer()
+
+
+def stop_tracing(path: str = None):
+    """Stop recording spans and optionally write them to a Chrome trace file (which Perfetto can load).
+
+    :param path: optional path of the JSON trace file
+    :type path: str
+    :return: recorded trace events
+    :rtype: list[dict]
+    """
+    global _tracer
+    events = drain_events()
+    _tracer = None
+    if path is not None:
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+    return events
+
+
+def drain_events():
+    """Remove and return the events recorded so far (e.g. to send them from a worker process to the main one).
+
+    :return: recorded trace events (empty if tracing is disabled)
+    :rtype: list[dict]
+    """
+    if _tracer is None:
+        return []
+    with _tracer.lock:
+        events = _tracer.events
+        _tracer.events = []
+        _tracer.thread_names = dict()
+
+    return events
+
+
+def add_events(events: list):
+    """Add events recorded elsewhere (e.g. by a worker process) to the trace.
+
+    :param events: trace events from :func:`drain_events`
+    :type events: list[dict]
+    """
+    if _tracer is None:
+        return
+    with _tracer.lock:
+        _tracer.events.extend(events)
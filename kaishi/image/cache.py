@@ -0,0 +1,84 @@
+"""Class definition for a memory-budgeted cache of full resolution images."""
+import threading
+from collections import OrderedDict
+
+
+class PixelCache:
+    """Least recently used record of loaded full resolution images that evicts pixels over a byte budget.
+
+    Evicted images are released by :meth:`kaishi.image.file.ImageFile.evict` and transparently reloaded from
+    disk (replaying any transforms) on their next access. Derived images (thumbnail, small image and patch)
+    are kept, so only full resolution pixels count towards the budget.
+    """
+
+    def __init__(self, budget: int):
+        """Initialize an empty cache.
+
+        :param budget: maximum number of bytes of full resolution pixels kept in memory
+        :type budget: int
+        """
+        self.budget = budget
+        self.total = 0
+        self.entries = OrderedDict()  # id(file object) -> (file object, bytes)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            "PixelCache("
+            + str(self.total)
+            + " of "
+            + str(self.budget)
+            + " bytes, "
+            + str(len(self.entries))
+            + " images)"
+        )
+
+    def touch(self, fobj, image):
+        """Record an access to the image of a file, evicting the least recently used images if over budget.
+
+        The most recently used image is never evicted, even if it alone exceeds the budget.
+
+        :param fobj: file object that owns the image
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        :param image: loaded full resolution image
+        :type image: PIL image object
+        """
+        nbytes = image_nbytes(image)
+        evicted = []
+        with self.lock:
+            key = id(fobj)
+            if key in self.entries:
+                self.total -= self.entries[key][1]
+                self.entries.move_to_end(key)
+            self.entries[key] = (fobj, nbytes)
+            self.total += nbytes
+            while self.total > self.budget and len(self.entries) > 1:
+                _, (oldest, oldest_nbytes) = self.entries.popitem(last=False)
+                self.total -= oldest_nbytes
+                evicted.append(oldest)
+        for oldest in evicted:  # Release outside the lock
+            oldest.evict()
+
+    def discard(self, fobj):
+        """Stop tracking the image of a file (e.g. after it's unloaded).
+
+        :param fobj: file object that owns the image
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        """
+        with self.lock:
+            entry = self.entries.pop(id(fobj), None)
+            if entry is not None:
+                self.total -= entry[1]
+
+
+def image_nbytes(image):
+    """Estimate the memory used by the pixels of an image.
+
+    :param image: image to measure
+    :type image: PIL image object
+    :return: number of bytes (one per band and pixel, four for 32 bit modes)
+    :rtype: int
+    """
+    bytes_per_band = 4 if image.mode in ["I", "F"] else 1
+
+    return image.size[0] * image.size[1] * len(image.getbands()) * bytes_per_band
@@ -1,25 +1,43 @@
 """Definition for kaishi image datasets."""
 import os
-import warnings
 from kaishi.image.file_group import ImageFileGroup
-import torch
 
 
 class ImageDataset:
     """Factory for image dataset objects."""
 
-    def __new__(self, source: str = None, recursive: bool = False):
+    def __new__(
+        self,
+        source: str = None,
+        recursive: bool = False,
+        workers: int = None,
+        manifest: str = None,
+        analysis_only: bool = False,
+        memory_budget: int = None,
+    ):
         """Initialize a kaishi image dataset (currently a directory of files is the only option).
 
         :param source: string pointing to the data source
         :type source: str
         :param recusive: flag indicating recursion
         :type recursive: bool
+        :param workers: number of threads used to scan directories
+        :type workers: int
+        :param manifest: optional path to a manifest file that caches values (e.g. hashes) between loads
+        :type manifest: str
+        :param analysis_only: flag to decode JPEG images at reduced resolution when loading
+        :type analysis_only: bool
+        :param memory_budget: maximum bytes of full resolution pixels kept in memory (no limit if `None`)
+        :type memory_budget: int
         """
-        if torch.cuda.is_available() is False:
-            warnings.warn("No GPU detected, ConvNet prediction tasks will be very slow")
-
         if os.path.exists(source):
-            return ImageFileGroup(source=source, recursive=recursive)
+            return ImageFileGroup(
+                source=source,
+                recursive=recursive,
+                workers=workers,
+                manifest=manifest,
+                analysis_only=analysis_only,
+                memory_budget=memory_budget,
+            )
         else:
             raise NotImplementedError("Currently only supports a valid path as input")
@@ -1,7 +1,12 @@
 """Definition for image files."""
+import os
+import copy
 from PIL import Image
-import imagehash
 from kaishi.core.file import File
+from kaishi.core.tracing import span
+from kaishi.core.tracing import is_tracing
+from kaishi.core.tracing import start_tracing
+from kaishi.core.tracing import drain_events
 from kaishi.image import ops
 
 
@@ -9,6 +14,13 @@ THUMBNAIL_SIZE = (64, 64)
 MAX_DIM_FOR_SMALL = 224  # Max dimension for small sample
 PATCH_SIZE = (64, 64)  # Patch size for compression artifact detection
 RESAMPLE_METHOD = Image.NEAREST  # Resampling method for resizing images
+SHARED_MEMORY_MODES = ["1", "L", "LA", "RGB", "RGBA", "CMYK", "I", "F"]  # 4 bytes max
+DECODED_SLOT_BYTES = 4 * (  # Shared memory reserved for the derived images of each file
+    THUMBNAIL_SIZE[0] * THUMBNAIL_SIZE[1]
+    + MAX_DIM_FOR_SMALL * MAX_DIM_FOR_SMALL
+    + PATCH_SIZE[0] * PATCH_SIZE[1]
+)
+_shared_block = None  # Shared memory attached by each worker process (see :func:`attach_shared_memory`)
 
 
 class ImageFile(File):
@@ -26,32 +38,246 @@ class ImageFile(File):
         """
         super().__init__(basedir, relpath, filename)
         self.children["similar"] = []
-        self.image = None
-        self.small_image = None
-        self.thumbnail = None
-        self.patch = None
+        self._image = None
+        self._small_image = None  # Derived images are computed on first access
+        self._thumbnail = None
+        self._patch = None
+        self.evicted = False  # Flag indicating the image is reloaded on access
+        self.pixel_cache = None  # Optional :class:`kaishi.image.cache.PixelCache`
+        self.transform_log = []  # Transforms replayed after reloading the image
         self.perceptual_hash = None
+        self.perceptual_hash_type = None  # None, or the type of a batch hash
+        self.transformed = False  # Flag indicating the image differs from the file
+        self.dimensions = None  # Image size, kept after unloading
+        self.draft = False  # Flag indicating the image was decoded at reduced size
+        self.decode_mode = None  # "draft" after an analysis only load, else "full"
+        self.perceptual_hash_decode = None  # Decode mode of the hashed image
 
-    def verify_loaded(self):
-        """Verify image and derivatives are loaded (only performs the load if the image is unloaded)."""
-        if self.image is None:
-            try:
-                self.image = Image.open(self.abspath)
-                self.image.load()  # https://github.com/python-pillow/Pillow/issues/1144
-                self.update_derived_images()
-                if "L" in self.image.mode:
-                    self.add_label("GRAYSCALE")
-            except OSError:  # Not an image file
-                self.image = None
+    def get_cached_values(self):
+        """Get computed values that only depend on the contents of the file on disk (e.g. for a manifest).
 
-    def update_derived_images(self):
-        """Update images derived from the base image (i.e. thumbnail, small version, and random patch)."""
-        if self.image is not None:
-            self.thumbnail = self.image.resize(THUMBNAIL_SIZE)
-            self.small_image = ops.make_small(
+        :return: dictionary of value names and values
+        :rtype: dict
+        """
+        values = super().get_cached_values()
+        if self.perceptual_hash is None or self.transformed:
+            values["perceptual_hash"] = None
+            values["perceptual_hash_type"] = None
+            values["perceptual_hash_decode"] = None
+        else:
+            values["perceptual_hash"] = str(self.perceptual_hash)
+            values["perceptual_hash_type"] = self.perceptual_hash_type
+            values["perceptual_hash_decode"] = self.perceptual_hash_decode
+
+        return values
+
+    def set_cached_values(self, values: dict):
+        """Restore values previously returned by :meth:`get_cached_values` (None values are ignored).
+
+        :param values: dictionary of value names and values
+        :type values: dict
+        """
+        super().set_cached_values(values)
+        if values.get("perceptual_hash") is not None:
+            import imagehash  # Imported when needed to keep 'import kaishi' light
+
+            self.perceptual_hash = imagehash.hex_to_hash(values["perceptual_hash"])
+            self.perceptual_hash_type = values.get("perceptual_hash_type")
+            self.perceptual_hash_decode = values.get("perceptual_hash_decode")
+
+    def get_state(self):
+        """Get a JSON-serializable snapshot of the labels and computed values of the file.
+
+        :return: dictionary with "labels" and "values" keys
+        :rtype: dict
+        """
+        state = super().get_state()
+        if self.perceptual_hash is not None:  # Keep hashes of transformed images too
+            state["values"]["perceptual_hash"] = str(self.perceptual_hash)
+            state["values"]["perceptual_hash_type"] = self.perceptual_hash_type
+            state["values"]["perceptual_hash_decode"] = self.perceptual_hash_decode
+        if len(self.transform_log) > 0:
+            state["transform_log"] = copy.deepcopy(self.transform_log)
+
+        return state
+
+    def set_state(self, state: dict):
+        """Restore a snapshot returned by :meth:`get_state`, including transforms (replayed when loading).
+
+        :param state: dictionary with "labels" and "values" keys (and "transform_log" for transformed images)
+        :type state: dict
+        """
+        super().set_state(state)
+        transform_log = state.get("transform_log", [])
+        if len(transform_log) > 0 and transform_log != self.transform_log:
+            reload = self.loaded
+            if reload:
+                self.unload()
+            self.transform_log = copy.deepcopy(transform_log)
+            self.transformed = True
+            self.evicted = reload  # Reloaded on access, with the transforms
+
+    @property
+    def image(self):
+        """Image (reloaded from disk with its transforms replayed if it was evicted)."""
+        if self._image is None and self.evicted:
+            self._load(analysis_only=self.draft)
+        if self._image is not None and self.pixel_cache is not None:
+            self.pixel_cache.touch(self, self._image)
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self.evicted = False
+
+    @property
+    def thumbnail(self):
+        """Thumbnail version of the image (computed on first access)."""
+        if self._thumbnail is None and self.image is not None:
+            self._thumbnail = self.image.resize(THUMBNAIL_SIZE)
+        return self._thumbnail
+
+    @property
+    def small_image(self):
+        """Small version of the image (computed on first access)."""
+        if self._small_image is None and self.image is not None:
+            self._small_image = ops.make_small(
                 self.image, max_dim=MAX_DIM_FOR_SMALL, resample_method=RESAMPLE_METHOD
             )
-            self.patch = ops.extract_patch(self.image, PATCH_SIZE)
+        return self._small_image
+
+    @property
+    def patch(self):
+        """Center patch of the image (computed on first access)."""
+        if self._patch is None and self.image is not None:
+            self._patch = ops.extract_patch(self.image, PATCH_SIZE)
+        return self._patch
+
+    @property
+    def loaded(self):
+        """Flag indicating the image is loaded (or was evicted and is reloaded on access)."""
+        return self._image is not None or self.evicted
+
+    def verify_loaded(self, analysis_only: bool = False):
+        """Verify image and derivatives are loaded (only performs the load if the image is unloaded).
+
+        Transforms applied before the image was unloaded are replayed after loading.
+
+        :param analysis_only: flag to decode JPEG images at the smallest scale that still covers the small image
+            (the full resolution image is loaded by :meth:`load_full_resolution` when needed)
+        :type analysis_only: bool
+        """
+        if not self.loaded:
+            with span("load", "io", file=self.abspath, analysis_only=analysis_only):
+                self._load(analysis_only=analysis_only)
+
+    def _load(self, analysis_only: bool = False):
+        """Load the image from disk and replay its transforms (see :meth:`verify_loaded`).
+
+        :param analysis_only: flag to decode JPEG images at reduced resolution
+        :type analysis_only: bool
+        """
+        reloading = self.evicted  # Derived images of evicted images are still valid
+        self.evicted = False
+        self.draft = False
+        try:
+            image = Image.open(self.abspath)
+            self.dimensions = image.size
+            if (
+                analysis_only
+                and image.format == "JPEG"
+                and len(self.transform_log) == 0
+            ):
+                image.draft(
+                    image.mode, (MAX_DIM_FOR_SMALL, MAX_DIM_FOR_SMALL)
+                )  # Picks the smallest DCT scale that is at least this size
+                self.draft = image.size != self.dimensions
+            image.load()  # https://github.com/python-pillow/Pillow/issues/1144
+            self._image = image
+            for step in self.transform_log:
+                getattr(self, step[0])(*step[1:])
+            if not self.draft:
+                self.dimensions = self._image.size
+            if not reloading:
+                self.update_derived_images()
+                self.decode_mode = "draft" if analysis_only else "full"
+            if "L" in self._image.mode:
+                self.add_label("GRAYSCALE")
+        except OSError:  # Not an image file
+            self._image = None
+            self.draft = False
+        if self._image is not None and self.pixel_cache is not None:
+            self.pixel_cache.touch(self, self._image)
+
+    def set_decoded(
+        self,
+        thumbnail,
+        small_image,
+        patch,
+        dimensions: tuple,
+        draft: bool,
+        analysis_only: bool = False,
+    ):
+        """Set derived images decoded elsewhere (e.g. in a worker process), leaving the image to load on access.
+
+        :param thumbnail: thumbnail version of the image
+        :type thumbnail: PIL image object
+        :param small_image: small version of the image
+        :type small_image: PIL image object
+        :param patch: center patch of the image
+        :type patch: PIL image object
+        :param dimensions: size of the image
+        :type dimensions: tuple
+        :param draft: flag indicating the derived images come from a reduced resolution decode
+        :type draft: bool
+        :param analysis_only: flag indicating the image was decoded in analysis only mode
+        :type analysis_only: bool
+        """
+        self._image = None
+        self._thumbnail = thumbnail
+        self._small_image = small_image
+        self._patch = patch
+        self.dimensions = tuple(dimensions)
+        self.draft = draft
+        self.decode_mode = "draft" if analysis_only else "full"
+        self.evicted = True
+
+    def load_full_resolution(self):
+        """Reload the image at full resolution if it was decoded at reduced resolution (e.g. before a transform)."""
+        if self.draft:
+            self.unload()
+            self.verify_loaded()
+
+    def unload(self):
+        """Release the image and its derivatives, keeping the labels, hashes, dimensions and transforms."""
+        if self._image is not None and not self.draft:
+            self.dimensions = self._image.size
+        if self.pixel_cache is not None:
+            self.pixel_cache.discard(self)
+        self.draft = False
+        self.evicted = False
+        self.decode_mode = None
+        self._image = None
+        self.update_derived_images()
+
+    def evict(self):
+        """Release the full resolution image only, reloading it from disk on its next access."""
+        if self._image is None:
+            return
+        if not self.draft:
+            self.dimensions = self._image.size
+        self._image = None
+        self.evicted = True
+
+    def update_derived_images(self):
+        """Reset images derived from the base image (i.e. thumbnail, small version, and random patch).
+
+        They are recomputed from the current image on their next access.
+        """
+        self._thumbnail = None
+        self._small_image = None
+        self._patch = None
 
     def rotate(self, ccw_rotation_degrees: int):
         """Rotate all instances of image by 'ccw_rotation_degrees'.
@@ -59,8 +285,7 @@ class ImageFile(File):
         :param ccw_rotation_degrees: degrees to rotate the image by
         :type ccw_rotation_degrees: int
         """
-        self.image = self.image.rotate(ccw_rotation_degrees, expand=True)
-        self.update_derived_images()
+        self._apply_transform("_rotate", ccw_rotation_degrees)
 
     def limit_dimensions(
         self, max_width: int = None, max_height: int = None, max_dimension: int = None
@@ -75,42 +300,176 @@ class ImageFile(File):
         :param max_dimension: maximum width or height (applies to both)
         :type max_dimension: int
         """
-        if self.image is None:
-            return
+        self._apply_transform("_limit_dimensions", max_width, max_height, max_dimension)
+
+    def convert_to_grayscale(self):
+        """Convert image to grayscale."""
+        if self._apply_transform("_convert_to_grayscale"):
+            self.add_label("GRAYSCALE")
+        return self.image
+
+    def _apply_transform(self, method: str, *args):
+        """Apply a transform to the full resolution image and record it for replay after a reload.
+
+        :param method: name of the method that performs the transform (returns a flag indicating a change)
+        :type method: str
+        :return: flag indicating the image changed
+        :rtype: bool
+        """
+        self.load_full_resolution()
+        if self.image is None or not getattr(self, method)(*args):
+            return False
+        self.transform_log.append([method] + list(args))
+        self.transformed = True
+        self.update_derived_images()
+        self.perceptual_hash = None  # Hashed the image before the transform
+        self.perceptual_hash_type = None
+        self.perceptual_hash_decode = None
+
+        return True
+
+    def _rotate(self, ccw_rotation_degrees: int):
+        """Rotate the image (see :meth:`rotate`)."""
+        self._image = self._image.rotate(ccw_rotation_degrees, expand=True)
+
+        return True
+
+    def _limit_dimensions(
+        self, max_width: int = None, max_height: int = None, max_dimension: int = None
+    ):
+        """Resize the image if it's over the limits (see :meth:`limit_dimensions`)."""
         if max_dimension is not None:
             max_width = max_dimension
             max_height = max_dimension
-        width_factor = 0 if max_width is None else float(self.image.size[0]) / max_width
+        width_factor = (
+            0 if max_width is None else float(self._image.size[0]) / max_width
+        )
         height_factor = (
-            0 if max_height is None else float(self.image.size[1]) / max_height
+            0 if max_height is None else float(self._image.size[1]) / max_height
         )
         if width_factor <= 1 and height_factor <= 1:
-            return  # Image already under limit(s)
+            return False  # Image already under limit(s)
         factor = max((width_factor, height_factor))
-        self.image = self.image.resize(
-            (round(self.image.size[0] / factor), round(self.image.size[1] / factor))
+        self._image = self._image.resize(
+            (round(self._image.size[0] / factor), round(self._image.size[1] / factor))
         )
-        self.update_derived_images()
 
-    def convert_to_grayscale(self):
-        """Convert image to grayscale."""
-        if self.image is not None:
-            self.image = self.image.convert("L")
-            self.add_label("GRAYSCALE")
-            self.update_derived_images()
-        return self.image
+        return True
 
-    def compute_perceptual_hash(self, hashfunc=imagehash.average_hash):
+    def _convert_to_grayscale(self):
+        """Convert the image to grayscale (see :meth:`convert_to_grayscale`)."""
+        self._image = self._image.convert("L")
+
+        return True
+
+    def compute_perceptual_hash(self, hashfunc=None, analysis_only: bool = False):
         """Calculate perceptual hash (close in value to similar images.
 
         :param hashfunc: function object to be used to calculate the hash value (defualts to `imagehash.average_hash`)
         :type hashfunc: function
+        :param analysis_only: flag to decode JPEG images at reduced resolution if the image isn't loaded yet
+        :type analysis_only: bool
         :return: hash value (as computed by `hashfunc`)
         """
-        self.verify_loaded()
-        if self.image is None:  # Couldn't load the image
+        if hashfunc is None:
+            import imagehash
+
+            hashfunc = imagehash.average_hash
+        self.verify_loaded(analysis_only=analysis_only)
+        if self.thumbnail is None:  # Couldn't load the image
             return None
 
         self.perceptual_hash = hashfunc(self.thumbnail)
+        self.perceptual_hash_type = None
+        self.perceptual_hash_decode = self.decode_mode
 
         return self.perceptual_hash
+
+
+def compute_perceptual_hash_from_path(
+    abspath: str, hashfunc=None, analysis_only: bool = False
+):
+    """Load an image and compute its perceptual hash exactly like :class:`ImageFile` does (e.g. in a worker process).
+
+    Only valid for untransformed images, since transforms aren't replayed.
+
+    :param abspath: path to the image file
+    :type abspath: str
+    :param hashfunc: function object to be used to calculate the hash value (defaults to `imagehash.average_hash`)
+    :type hashfunc: function
+    :param analysis_only: flag to decode JPEG images at reduced resolution
+    :type analysis_only: bool
+    :return: hash value as a hex string (None if the image can't be loaded) and flag indicating a grayscale image
+    :rtype: str and bool
+    """
+    fobj = ImageFile(os.path.dirname(abspath), None, os.path.basename(abspath))
+    hashval = fobj.compute_perceptual_hash(hashfunc, analysis_only=analysis_only)
+
+    return (None if hashval is None else str(hashval)), fobj.has_label("GRAYSCALE")
+
+
+def attach_shared_memory(name: str, tracing: bool = False):
+    """Attach a worker process to the shared memory block that :func:`decode_to_shared_memory` writes to.
+
+    :param name: name of the shared memory block
+    :type name: str
+    :param tracing: flag to record spans in the worker (see :mod:`kaishi.core.tracing`)
+    :type tracing: bool
+    """
+    global _shared_block
+    from multiprocessing import shared_memory  # Python >= 3.8
+
+    _shared_block = shared_memory.SharedMemory(name=name)
+    if tracing:
+        start_tracing()  # Also drops events inherited from a forked parent
+
+
+def decode_to_shared_memory(abspath: str, offset: int, analysis_only: bool = False):
+    """Load an image and write its derived images to the attached shared memory block (e.g. in a worker process).
+
+    :param abspath: path to the image file
+    :type abspath: str
+    :param offset: position in the shared memory block of the slot for this file (of size `DECODED_SLOT_BYTES`)
+    :type offset: int
+    :param analysis_only: flag to decode JPEG images at reduced resolution
+    :type analysis_only: bool
+    :return: None if the image can't be loaded, else dimensions, draft flag, grayscale flag and a (mode, size,
+        number of bytes) entry for each derived image, or only the dimensions if a mode can't be shared (when
+        tracing, the spans recorded by the worker are added as "trace_events")
+    :rtype: dict
+    """
+    fobj = ImageFile(os.path.dirname(abspath), None, os.path.basename(abspath))
+    fobj.verify_loaded(analysis_only=analysis_only)
+    result = None
+    if fobj.image is not None:
+        result = _write_derived_images(fobj, offset)
+    if is_tracing():
+        result = dict(result or {}, trace_events=drain_events())
+
+    return result
+
+
+def _write_derived_images(fobj, offset: int):
+    """Write the derived images of a loaded image to the attached shared memory block.
+
+    :param fobj: loaded image file
+    :type fobj: :class:`kaishi.image.file.ImageFile`
+    :param offset: position in the shared memory block of the slot for this file
+    :type offset: int
+    :return: see :func:`decode_to_shared_memory`
+    :rtype: dict
+    """
+    result = {"dimensions": fobj.dimensions, "draft": fobj.draft}
+    derived = [fobj.thumbnail, fobj.small_image, fobj.patch]
+    if any([image.mode not in SHARED_MEMORY_MODES for image in derived]):
+        return result  # e.g. palette images, which are loaded in the main process
+
+    result["grayscale"] = fobj.has_label("GRAYSCALE")
+    result["derived"] = []
+    for image in derived:
+        data = image.tobytes()
+        _shared_block.buf[offset : offset + len(data)] = data
+        result["derived"].append((image.mode, image.size, len(data)))
+        offset += len(data)
+
+    return result
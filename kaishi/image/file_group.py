@@ -1,13 +1,28 @@
 """Definition for groups of image files."""
 import os
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
 from kaishi.core.file_group import FileGroup
-from kaishi.image.util import swap_channel_dimension
+from kaishi.core.misc import prefetch
+from kaishi.core.tracing import span
+from kaishi.core.tracing import is_tracing
+from kaishi.core.tracing import add_events
 from kaishi.image.file import ImageFile
+from kaishi.image.file import DECODED_SLOT_BYTES
+from kaishi.image.file import attach_shared_memory
+from kaishi.image.file import decode_to_shared_memory
+from kaishi.image.cache import PixelCache
+from kaishi.image.hashing import batch_perceptual_hashes
+from kaishi.image.hashing import unpack_hashes
+from kaishi.image.util import get_weights_path
 
 
 THUMBNAIL_SIZE = (64, 64)
+HASH_BATCH_SIZE = 256  # Thumbnails hashed at once by compute_perceptual_hashes
+DECODE_CHUNK_PER_WORKER = 16  # Files decoded per worker between shared memory reads
 MAX_DIM_FOR_SMALL = 224  # Max dimension for small sample
 PATCH_SIZE = (64, 64)  # Patch size for compression artifact detection
 RESAMPLE_METHOD = Image.NEAREST  # Resampling method for resizing images
@@ -28,13 +43,30 @@ class ImageFileGroup(FileGroup):
     from kaishi.image.transforms.to_grayscale import TransformToGrayscale
     from kaishi.image.transforms.limit_dimensions import TransformLimitDimensions
 
-    def __init__(self, source: str, recursive: bool):
+    def __init__(
+        self,
+        source: str,
+        recursive: bool,
+        workers: int = None,
+        manifest: str = None,
+        analysis_only: bool = False,
+        memory_budget: int = None,
+    ):
         """Initialize new image file group.
 
         :param source: directory containing data
         :type source: str
         :param recursive: flag indicating recursion
         :type recursive: bool
+        :param workers: number of threads used to scan directories
+        :type workers: int
+        :param manifest: optional path to a manifest file that caches values (e.g. hashes) between loads
+        :type manifest: str
+        :param analysis_only: flag to decode JPEG images at reduced resolution when loading (see :meth:`load_all`)
+        :type analysis_only: bool
+        :param memory_budget: maximum bytes of full resolution pixels kept in memory (least recently used images are
+            evicted and reloaded from disk when needed), no limit if `None`
+        :type memory_budget: int
         """
         super().__init__(recursive=recursive)
         self.thumbnail_size = THUMBNAIL_SIZE
@@ -42,23 +74,199 @@ class ImageFileGroup(FileGroup):
         self.patch_size = PATCH_SIZE
         self.model = None  # Only load model if needed
         self.labeled = False
-        self.load_dir(source, ImageFile, recursive)
+        self.analysis_only = analysis_only
+        self.load_dir(source, ImageFile, recursive, workers=workers)
+        self.pixel_cache = None if memory_budget is None else PixelCache(memory_budget)
+        for fobj in self.files:
+            fobj.pixel_cache = self.pixel_cache
+        if manifest is not None:
+            self.load_manifest(manifest, workers=workers)
+
+    def load_all(
+        self, files: list = None, analysis_only: bool = None, workers: int = None
+    ):
+        """Load all files in the directory that this class was initialized with.
+
+        In analysis only mode, JPEG images are decoded at the smallest scale that still covers the small image,
+        which is much faster for large photos. Transforms and :meth:`save` reload full resolution images as needed.
+
+        :param files: subset of file objects to load (defaults to all files)
+        :type files: list
+        :param analysis_only: flag to decode JPEG images at reduced resolution (defaults to `self.analysis_only`)
+        :type analysis_only: bool
+        :param workers: number of processes used to decode images (see :meth:`_load_in_processes`)
+        :type workers: int
+        """
+        if analysis_only is None:
+            analysis_only = self.analysis_only
+        files = self.files if files is None else files
+        if workers is not None and workers > 1:
+            self._load_in_processes(files, analysis_only, workers)
+        for fobj in files:
+            fobj.verify_loaded(analysis_only=analysis_only)
+
+    def _load_in_processes(self, files: list, analysis_only: bool, workers: int):
+        """Decode images and build their derived images in a process pool.
+
+        Workers copy the derived images into a shared memory block instead of pickling them. The full resolution
+        image is loaded in the main process only when it's accessed (e.g. by a transform). Files that can't be
+        decoded or shared this way are left for :meth:`load_all` to load in the main process (as are all files on
+        Python versions without `multiprocessing.shared_memory`, i.e. before 3.8).
 
-    def load_all(self):
-        """Load all files in the directory that this class was initialized with."""
+        :param files: file objects to load
+        :type files: list
+        :param analysis_only: flag to decode JPEG images at reduced resolution
+        :type analysis_only: bool
+        :param workers: number of worker processes
+        :type workers: int
+        """
+        pending = [
+            fobj for fobj in files if not fobj.loaded and len(fobj.transform_log) == 0
+        ]
+        if len(pending) == 0:
+            return
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:  # Python < 3.8
+            return
+        n_slots = min(len(pending), workers * DECODE_CHUNK_PER_WORKER)
+        block = shared_memory.SharedMemory(
+            create=True, size=n_slots * DECODED_SLOT_BYTES
+        )
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=attach_shared_memory,
+                initargs=(block.name, is_tracing()),
+            ) as executor:
+                for chunk_start in range(0, len(pending), n_slots):
+                    chunk = pending[chunk_start : chunk_start + n_slots]
+                    offsets = [i * DECODED_SLOT_BYTES for i in range(len(chunk))]
+                    with span("decode_chunk", "batch", files=len(chunk)):
+                        results = list(
+                            executor.map(
+                                decode_to_shared_memory,
+                                [fobj.abspath for fobj in chunk],
+                                offsets,
+                                [analysis_only] * len(chunk),
+                            )
+                        )
+                    for fobj, offset, result in zip(chunk, offsets, results):
+                        if result is not None:  # Spans recorded by the worker
+                            add_events(result.pop("trace_events", []))
+                        if result is None or "derived" not in result:
+                            continue
+                        derived = []
+                        for mode, size, nbytes in result["derived"]:
+                            data = bytes(block.buf[offset : offset + nbytes])
+                            derived.append(Image.frombytes(mode, size, data))
+                            offset += nbytes
+                        fobj.set_decoded(
+                            *derived,
+                            result["dimensions"],
+                            result["draft"],
+                            analysis_only=analysis_only,
+                        )
+                        if result["grayscale"]:
+                            fobj.add_label("GRAYSCALE")
+        finally:
+            block.close()
+            block.unlink()
+
+    def get_state(self):
+        """Get a JSON-serializable snapshot of the processing state (see :meth:`kaishi.core.file_group.FileGroup.get_state`).
+
+        :return: state dictionary, which also records if the images were labeled by the ConvNet
+        :rtype: dict
+        """
+        state = super().get_state()
+        state["labeled"] = self.labeled
+
+        return state
+
+    def load_manifest(self, path: str, workers: int = None):
+        """Attach a persistent manifest and reuse its cached values (see
+        :meth:`kaishi.core.file_group.FileGroup.load_manifest`), except perceptual hashes computed in another decode
+        mode (analysis only or full resolution), since they may differ.
+
+        :param path: path to the manifest file (created if it doesn't exist)
+        :type path: str
+        :param workers: number of threads used to stat files
+        :type workers: int
+        :return: number of files with reused values
+        :rtype: int
+        """
+        n_reused = super().load_manifest(path, workers=workers)
+        decode_mode = "draft" if self.analysis_only else "full"
         for fobj in self.files:
-            fobj.verify_loaded()
+            if fobj.perceptual_hash_decode != decode_mode:
+                fobj.perceptual_hash = None
+                fobj.perceptual_hash_type = None
+                fobj.perceptual_hash_decode = None
+
+        return n_reused
+
+    def _get_fingerprint_settings(self):
+        """Get the settings of the group that affect the results of pipeline components.
+
+        Without a loaded model, the weights of the default model (loaded by the generic convnet labeler) are
+        identified by their path, size and modification time, so changing them invalidates cached effects.
+
+        :return: decoding mode, derived image sizes and the signature of the model
+        :rtype: dict
+        """
+        if self.model is None:
+            weights = get_weights_path()
+            model = [weights] + self._get_file_stat(weights)
+        else:
+            model = self.model.get_signature()
+
+        return {
+            "analysis_only": self.analysis_only,
+            "thumbnail_size": self.thumbnail_size,
+            "max_dim_for_small": self.max_dim_for_small,
+            "patch_size": self.patch_size,
+            "model": model,
+        }
+
+    def load_checkpoint(self, path: str):
+        """Restore the state journaled by an interrupted pipeline run (see
+        :meth:`kaishi.core.file_group.FileGroup.load_checkpoint`), including if the images were labeled.
+
+        :param path: path of the checkpoint
+        :type path: str
+        :return: checkpoint to resume from, or None if it doesn't exist or doesn't match the pipeline
+        :rtype: dict
+        """
+        checkpoint = super().load_checkpoint(path)
+        if checkpoint is not None:
+            self.labeled = checkpoint["state"].get("labeled", False)
+
+        return checkpoint
+
+    def _merge_view(self, view):
+        """Merge the filter results of a view back into the group, keeping any model the view loaded.
+
+        :param view: view after running a pipeline component
+        :type view: :class:`kaishi.image.file_group.ImageFileGroup`
+        """
+        super()._merge_view(view)
+        self.model = view.model
 
     def build_numpy_batches(
         self,
         channels_first: bool = True,
         batch_size: int = None,
         image_type: str = "small_image",
+        dtype=np.uint8,
+        out=None,
     ):
         """Build a tensor from the entire image corpus (or generate batches if specified).
 
         If a batch size is specified, this acts as a generator of batches and returns a list
         of file objects to manipulate. Otherwise, a single batch of all images is returned in an array format.
+        Images are written straight into one contiguous buffer in the requested layout, which is reused (i.e.
+        overwritten) by each batch. The last batch is trimmed to the number of images it contains.
 
         :param channels_first: flag indicating channels first (e.g. PyTorch) vs. channels last (e.g. Keras)
         :type channels_first: bool
@@ -66,49 +274,153 @@ class ImageFileGroup(FileGroup):
         :type batch_size: int
         :param image_type: choice of "small_image", "thumbnail", or "patch", indicating which version of each image to use
         :type image_type: str
+        :param dtype: data type of the tensor (default is `numpy.uint8`, pixel values aren't rescaled)
+        :type dtype: `numpy.dtype`
+        :param out: optional buffer to write batches into, with the full batch shape (e.g. reused across calls)
+        :type out: `numpy.array`
         :return: batch of images (generator if batch size specified)
         :rtype: `numpy.array`
         """
-        final_batch_size = batch_size if batch_size is not None else len(self.files)
+        if batch_size is not None:
+            return self._generate_numpy_batches(
+                channels_first, batch_size, image_type, dtype, out
+            )
+        for im_tensor, _ in self._generate_numpy_batches(
+            channels_first, max(1, len(self.files)), image_type, dtype, out
+        ):
+            return (
+                im_tensor  # Don't return file objects as it's the same as 'self.files'
+            )
         shape = self.get_batch_dimensions(
-            final_batch_size, channels_first=False, image_type=image_type
-        )  # Start with PIL-style channel layout
-        im_tensor = np.zeros(shape)
+            0, channels_first=channels_first, image_type=image_type
+        )
+        return np.empty(shape, dtype=dtype if out is None else out.dtype)
+
+    def _generate_numpy_batches(
+        self, channels_first: bool, batch_size: int, image_type: str, dtype, out
+    ):
+        """Generate batches for :meth:`build_numpy_batches`.
+
+        :param channels_first: flag indicating channels first vs. channels last
+        :type channels_first: bool
+        :param batch_size: size of each batch
+        :type batch_size: int
+        :param image_type: choice of "small_image", "thumbnail", or "patch"
+        :type image_type: str
+        :param dtype: data type of the tensor (ignored if `out` is specified)
+        :type dtype: `numpy.dtype`
+        :param out: optional buffer to write batches into
+        :type out: `numpy.array`
+        :return: generator of batches and the file objects in each batch
+        """
+        shape = tuple(
+            int(dim)
+            for dim in self.get_batch_dimensions(
+                batch_size, channels_first=channels_first, image_type=image_type
+            )
+        )
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape:
+            raise ValueError(
+                "Output buffer shape " + str(out.shape) + " should be " + str(shape)
+            )
 
         bi = 0
         batch_file_objects = []
+        batch_span = None
         for fobj in self.files:
-            try:
-                fobj.verify_loaded()
-                if image_type == "small_image":
-                    im_tensor[bi] = np.array(fobj.small_image.convert("RGB"))
-                elif image_type == "thumbnail":
-                    im_tensor[bi] = np.array(fobj.thumbnail.convert("RGB"))
-                elif image_type == "patch":
-                    im_tensor[bi] = np.array(fobj.patch.convert("RGB"))
-            except AttributeError:
+            if batch_span is None:  # Spans building the batch, not consuming it
+                batch_span = span("build_batch", "batch", image_type=image_type)
+                batch_span.__enter__()
+            fobj.verify_loaded()
+            image = getattr(fobj, image_type)
+            if image is None:  # Not an image file
                 continue
+            pixels = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+            out[bi] = np.moveaxis(pixels, -1, 0) if channels_first else pixels
+            batch_file_objects.append(fobj)
             bi += 1
-            if batch_size is not None:
-                batch_file_objects.append(fobj)
-                if bi == batch_size:
-                    if channels_first:
-                        yield swap_channel_dimension(im_tensor), batch_file_objects
-                    else:
-                        yield im_tensor, batch_file_objects
-                    bi = 0  # Reset the batch
-                    batch_file_objects = []
-
-        if batch_size is None:
-            if channels_first:
-                return swap_channel_dimension(im_tensor)
-            return (
-                im_tensor  # Don't return file objects as it's the same as 'self.files'
-            )
-        if channels_first:
-            yield swap_channel_dimension(im_tensor), batch_file_objects
-        else:
-            yield im_tensor, batch_file_objects
+            if bi == batch_size:
+                batch_span.__exit__(None, None, None)
+                batch_span = None
+                yield out, batch_file_objects
+                bi = 0  # Reset the batch
+                batch_file_objects = []
+
+        if batch_span is not None:
+            batch_span.__exit__(None, None, None)
+        if bi > 0:
+            yield out[:bi], batch_file_objects
+
+    def prefetch_numpy_batches(
+        self,
+        batch_size: int,
+        depth: int = 2,
+        workers: int = 1,
+        channels_first: bool = True,
+        image_type: str = "small_image",
+        dtype=np.uint8,
+    ):
+        """Generate batches like :meth:`build_numpy_batches`, building up to `depth` batches ahead in the background.
+
+        Images of each batch are loaded by a pool of `workers` threads while the consumer processes the previous
+        batch (e.g. during model inference). Each batch has its own buffer, so it's not overwritten by the next one.
+
+        :param batch_size: maximum size of each batch (batches are smaller if some files aren't images)
+        :type batch_size: int
+        :param depth: maximum number of batches prepared ahead of the consumer
+        :type depth: int
+        :param workers: number of threads used to load images
+        :type workers: int
+        :param channels_first: flag indicating channels first vs. channels last
+        :type channels_first: bool
+        :param image_type: choice of "small_image", "thumbnail", or "patch"
+        :type image_type: str
+        :param dtype: data type of the batches
+        :type dtype: `numpy.dtype`
+        :return: generator of batches and the file objects in each batch
+        """
+
+        def produce():
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for start in range(0, len(self.files), batch_size):
+                    chunk = self.files[start : start + batch_size]
+                    list(executor.map(lambda fobj: fobj.verify_loaded(), chunk))
+                    yield from self._get_view(chunk).build_numpy_batches(
+                        channels_first=channels_first,
+                        batch_size=batch_size,
+                        image_type=image_type,
+                        dtype=dtype,
+                    )
+
+        return prefetch(produce(), depth=depth)
+
+    def compute_perceptual_hashes(
+        self,
+        hash_type: str = "average",
+        files: list = None,
+        batch_size: int = HASH_BATCH_SIZE,
+    ):
+        """Compute perceptual hashes in batches over the thumbnail tensor (see :mod:`kaishi.image.hashing`).
+
+        :param hash_type: one of "average", "difference", or "dct"
+        :type hash_type: str
+        :param files: subset of file objects to hash (defaults to all files)
+        :type files: list
+        :param batch_size: number of thumbnails hashed at once
+        :type batch_size: int
+        """
+        group = self if files is None else self._get_view(files)
+        for im_tensor, batch_file_objects in group.build_numpy_batches(
+            channels_first=False, batch_size=batch_size, image_type="thumbnail"
+        ):
+            with span("perceptual_hash", "hash", files=len(batch_file_objects)):
+                packed = batch_perceptual_hashes(im_tensor, hash_type=hash_type)
+            for fobj, hashval in zip(batch_file_objects, unpack_hashes(packed)):
+                fobj.perceptual_hash = hashval
+                fobj.perceptual_hash_type = hash_type
+                fobj.perceptual_hash_decode = fobj.decode_mode
 
     def save(self, out_dir: str):
         """Save image data set in the current structure while preserving any changes.
@@ -122,6 +434,7 @@ class ImageFileGroup(FileGroup):
         for fobj in self.files:  # Determine file paths and save
             if fobj.image is None:
                 continue
+            fobj.load_full_resolution()
             if fobj.relative_path is not None:
                 file_dir = os.path.join(out_dir, fobj.relative_path)
                 if not os.path.exists(file_dir):
@@ -130,14 +443,63 @@ class ImageFileGroup(FileGroup):
                 file_dir = out_dir
             fobj.image.save(os.path.join(file_dir, fobj.basename))
 
-    def run_pipeline(self, verbose: bool = False):
+    def run_pipeline(
+        self,
+        verbose: bool = False,
+        previous_state: dict = None,
+        chunk_size: int = None,
+        workers: int = None,
+        checkpoint: str = None,
+        checkpoint_interval: int = None,
+        resume_from: str = None,
+    ):
         """Run the pipeline as configured.
 
+        Images are decoded after any leading filters that only read names or headers (see
+        :meth:`kaishi.core.pipeline.Pipeline.optimize` to move those first), so the files they remove are never
+        decoded. In an incremental run, previously processed files are loaded after the new files are processed
+        (replaying their transforms), so :meth:`save` writes the same images as a full run.
+
         :param verbose: flag indicating verbosity
         :type verbose: bool
+        :param previous_state: state from :meth:`get_state` after a previous run (only new files are processed)
+        :type previous_state: dict
+        :param chunk_size: if specified, run in streaming mode with at most this many files loaded at once
+        :type chunk_size: int
+        :param workers: number of processes used to decode images (not used in streaming mode)
+        :type workers: int
+        :param checkpoint: optional path where the progress is journaled after each step, to resume the run with
+            `resume_from` if it's interrupted (e.g. by running out of memory)
+        :type checkpoint: str
+        :param checkpoint_interval: if specified, also journal the progress of per-file steps after this many files
+        :type checkpoint_interval: int
+        :param resume_from: path of a checkpoint to resume from (the run starts over if the file doesn't exist)
+        :type resume_from: str
         """
-        self.load_all()
-        self.pipeline(self, verbose=verbose)
+        new_files, resume = self._prepare_run(
+            previous_state, chunk_size, checkpoint, resume_from
+        )
+        if chunk_size is not None:
+            for _ in self.stream_pipeline(chunk_size, verbose=verbose):
+                pass
+            return
+        loader = None
+        if new_files is None:  # Load the files left after the leading cheap filters
+            loader = functools.partial(self.load_all, workers=workers)
+        else:
+            self.load_all(new_files, workers=workers)
+        self.pipeline(
+            self,
+            verbose=verbose,
+            new_files=new_files,
+            checkpoint=checkpoint,
+            checkpoint_interval=checkpoint_interval,
+            resume=resume,
+            loader=loader,
+        )
+        if new_files is not None:
+            self.load_all(workers=workers)
+        self.save_manifest()
         if verbose:
             print("Pipeline completed")
 
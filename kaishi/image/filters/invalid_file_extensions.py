@@ -1,7 +1,7 @@
 """Class definition for filtering by invalid image file extensions."""
 import os
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
-from kaishi.core.misc import trim_list_by_inds
 
 
 VALID_EXT = [  # Valid extensions for invalid file extension filter
@@ -28,7 +28,12 @@ class FilterInvalidFileExtensions(PipelineComponent):
     def __init__(self):
         """Initialize new filter component."""
         super().__init__()
+        self.cost = Costs.METADATA
+        self.commutative = True
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
+        self.filter_key = "unsupported_extension"
         self.configure()
 
     def __call__(self, dataset):
@@ -37,16 +42,20 @@ class FilterInvalidFileExtensions(PipelineComponent):
         :param dataset: dataset to perform filter operation on
         :type dataset: :class:`kaishi.image.dataset.ImageDataset`
         """
-        # Trim any files without image extensions
-        badind = []
-        for i in self.get_target_indexes(dataset):
-            fobj = dataset.files[i]
-            _, ext = os.path.splitext(fobj.basename)
-            if len(ext) == 0 or ext.lower() not in self.valid_extensions:
-                badind.append(i)
-
-        dataset.files, trimmed = trim_list_by_inds(dataset.files, badind)
-        dataset.filtered["unsupported_extension"] = trimmed
+        self.process_files(dataset)  # Trim any files without image extensions
+
+    def process_file(self, fobj, index: int):
+        """Check the extension of a file.
+
+        :param fobj: file to check
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        :param index: index of the file in the dataset
+        :type index: int
+        :return: flag indicating if the file has a valid image extension
+        :rtype: bool
+        """
+        _, ext = os.path.splitext(fobj.basename)
+        return len(ext) > 0 and ext.lower() in self.valid_extensions
 
     def configure(self, valid_extensions=VALID_EXT):
         """Configure filter with the valid extensions defined.
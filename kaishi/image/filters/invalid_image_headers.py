@@ -1,6 +1,6 @@
 """Class definition for filtering files with invalid image headers."""
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
-from kaishi.core.misc import trim_list_by_inds
 from kaishi.image.util import validate_image_header
 
 
@@ -10,7 +10,13 @@ class FilterInvalidImageHeaders(PipelineComponent):
     def __init__(self):
         """Initialize filter object."""
         super().__init__()
+        self.cost = Costs.HEADER
+        self.commutative = True
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
+        self.filter_key = "invalid_header"
+        self.memoizable = True
 
     def __call__(self, dataset):
         """Perform filter operation on a kaishi image dataset.
@@ -18,11 +24,16 @@ class FilterInvalidImageHeaders(PipelineComponent):
         :param dataset: image dataset to perform filter operation on
         :type dataset: :class:`kaishi.image.dataset.ImageDataset`
         """
-        badind = []
-        for i in self.get_target_indexes(dataset):
-            fobj = dataset.files[i]
-            if not validate_image_header(fobj.abspath):
-                badind.append(i)
+        self.process_files(dataset)
 
-        dataset.files, trimmed = trim_list_by_inds(dataset.files, badind)
-        dataset.filtered["invalid_header"] = trimmed
+    def process_file(self, fobj, index: int):
+        """Check the header of an image file.
+
+        :param fobj: file to check
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        :param index: index of the file in the dataset
+        :type index: int
+        :return: flag indicating if the file has a valid image header
+        :rtype: bool
+        """
+        return validate_image_header(fobj.abspath)
@@ -1,8 +1,14 @@
 """Class definition for filtering similar images in a dataset."""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
 from kaishi.core.misc import trim_list_by_inds
 from kaishi.core.misc import find_similar_by_value
 from kaishi.core.misc import CollapseChildren
+from kaishi.image.file import compute_perceptual_hash_from_path
+from kaishi.image.hashing import pack_hashes
+from kaishi.image.hashing import find_similar_hashes
 
 
 class FilterSimilar(PipelineComponent):
@@ -11,6 +17,10 @@ class FilterSimilar(PipelineComponent):
     def __init__(self):
         """Initialize filter object."""
         super().__init__()
+        self.cost = Costs.DECODE
+        self.incremental = True
+        self.filter_key = "similar"
+        self.memoizable = True
         self.configure()
 
     def __call__(self, dataset):
@@ -19,26 +29,112 @@ class FilterSimilar(PipelineComponent):
         :param dataset: dataset to perform operation on
         :type dataset: :class:`kaishi.image.dataset.ImageDataset`
         """
-        hashlist = [
-            f.perceptual_hash
-            if f.perceptual_hash is not None
-            else f.compute_perceptual_hash()
-            for f in dataset.files
-        ]
+        if self.hash_type is None:
+            self._compute_perceptual_hashes(dataset.files, dataset.analysis_only)
+        else:
+            dataset.compute_perceptual_hashes(
+                self.hash_type,
+                files=[
+                    fobj
+                    for fobj in dataset.files
+                    if fobj.perceptual_hash is None
+                    or fobj.perceptual_hash_type != self.hash_type
+                ],
+            )
+        hashlist = [f.perceptual_hash for f in dataset.files]
 
-        duplicate_ind, parent_ind = find_similar_by_value(
-            hashlist, self.perceptual_hash_threshold
-        )
+        try:  # 64 bit hashes are compared as packed integers
+            packed, valid = pack_hashes(hashlist)
+            duplicate_ind, parent_ind = find_similar_hashes(
+                packed, valid, self.perceptual_hash_threshold
+            )
+        except ValueError:  # Other hash sizes are compared one by one
+            duplicate_ind, parent_ind = find_similar_by_value(
+                hashlist, self.perceptual_hash_threshold
+            )
         for di, pi in zip(duplicate_ind, parent_ind):
-            dataset.files[pi].children["similar"].append(dataset.files[di])
+            dataset.files[pi].children[self.filter_key].append(dataset.files[di])
         dataset.files, trimmed = trim_list_by_inds(dataset.files, duplicate_ind)
-        dataset.filtered["similar"] = trimmed
+        dataset.filtered[self.filter_key] = trimmed
         CollapseChildren()(dataset)
 
-    def configure(self, perceptual_hash_threshold=3):
+    def _compute_perceptual_hashes(self, files: list, analysis_only: bool = False):
+        """Compute missing perceptual hashes, decoding unloaded images in a process pool if `workers` > 1.
+
+        Images are decoded in the same mode either way, and transformed images are always hashed in this process
+        (where their transforms are replayed), so the hashes don't depend on `workers`.
+
+        :param files: image files to compute perceptual hashes for
+        :type files: list[:class:`kaishi.image.file.ImageFile`]
+        :param analysis_only: flag to decode unloaded JPEG images at reduced resolution
+        :type analysis_only: bool
+        """
+        missing = [
+            fobj
+            for fobj in files
+            if fobj.perceptual_hash is None or fobj.perceptual_hash_type is not None
+        ]
+        unloaded = [
+            fobj for fobj in missing if not fobj.loaded and len(fobj.transform_log) == 0
+        ]
+        if self.workers > 1 and len(unloaded) > 0:
+            import imagehash  # Imported when needed to keep 'import kaishi' light
+
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(
+                    compute_perceptual_hash_from_path,
+                    [fobj.abspath for fobj in unloaded],
+                    [None] * len(unloaded),
+                    [analysis_only] * len(unloaded),
+                    chunksize=max(1, len(unloaded) // (4 * self.workers)),
+                )
+                for fobj, (hash_string, grayscale) in zip(unloaded, results):
+                    if hash_string is None:  # Not an image
+                        continue
+                    fobj.perceptual_hash = imagehash.hex_to_hash(hash_string)
+                    fobj.perceptual_hash_type = None
+                    fobj.perceptual_hash_decode = "draft" if analysis_only else "full"
+                    if grayscale:
+                        fobj.add_label("GRAYSCALE")
+            unloaded_ids = set(id(fobj) for fobj in unloaded)
+            missing = [fobj for fobj in missing if id(fobj) not in unloaded_ids]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(
+                executor.map(
+                    lambda fobj: fobj.compute_perceptual_hash(
+                        analysis_only=analysis_only
+                    ),
+                    missing,
+                )
+            )
+
+    def commutes_with(self, other):
+        """Check if a component can swap places with this filter: commutative filters (e.g. by name, extension or
+        header) can run first, so fewer files are compared.
+
+        Which file of a group of similar images is kept can change: if the file kept in the given order is removed by
+        the other filter afterwards, another file of the group is kept instead (and files rejected by both
+        filters are filtered by the one that runs first).
+
+        :param other: pipeline component next to this one
+        :type other: :class:`kaishi.core.pipeline_component.PipelineComponent`
+        :return: flag indicating the components can swap places
+        :rtype: bool
+        """
+        return other.commutative
+
+    def configure(self, perceptual_hash_threshold=3, workers=1, hash_type=None):
         """Configure the filter with a perceptual hash threshold.
 
         :param perceptual_hash_threshold: threshold for determining whether or not images are similar (> are deemed not similar)
         :type perceptual_hash_threshold: int or float
+        :param workers: number of processes used to decode unloaded images (loaded images are hashed in threads)
+        :type workers: int
+        :param hash_type: "average", "difference", or "dct" to hash thumbnails in vectorized batches (default
+            is `None`, which hashes each image with `imagehash.average_hash`)
+        :type hash_type: str
         """
         self.perceptual_hash_threshold = perceptual_hash_threshold
+        self.workers = workers
+        self.hash_type = hash_type
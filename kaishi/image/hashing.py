@@ -0,0 +1,378 @@
+"""Vectorized operations on perceptual hashes packed into 64 bit unsigned integers."""
+import numpy as np
+
+
+HAMMING_BLOCK_SIZE = 1024  # Rows and columns of each tile of pairwise distances
+MIN_BAND_BITS = 7  # Narrower bands put too many hashes in the same buckets
+PERCEPTUAL_HASH_TYPES = ["average", "difference", "dct"]  # Hashes computed in batches
+HASH_SIZE = 8  # Hashes are HASH_SIZE x HASH_SIZE bits (i.e. 64 bits)
+DCT_SIZE = 32  # Images are reduced to DCT_SIZE x DCT_SIZE pixels before the DCT
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])  # RGB to grayscale, as done by PIL
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def pack_hashes(hashlist: list):
+    """Pack a list of 64 bit perceptual hashes (e.g. `imagehash.ImageHash` objects) into a `numpy.uint64` array.
+
+    :param hashlist: list of hashes, where None marks a missing hash
+    :type hashlist: list
+    :return: packed hashes (0 where missing) and flags indicating which hashes are present
+    :rtype: `numpy.array` and `numpy.array`
+    """
+    valid = np.array([hashval is not None for hashval in hashlist], dtype=bool)
+    bits = np.zeros((len(hashlist), 64), dtype=bool)
+    for i, hashval in enumerate(hashlist):
+        if hashval is None:
+            continue
+        hash_bits = np.asarray(hashval.hash).flatten()
+        if hash_bits.size != 64:
+            raise ValueError("Only 64 bit hashes can be packed")
+        bits[i] = hash_bits
+
+    return _pack_bits(bits), valid
+
+
+def unpack_hashes(packed):
+    """Convert packed hashes back into `imagehash.ImageHash` objects.
+
+    :param packed: packed hashes
+    :type packed: `numpy.array`
+    :return: list of hashes
+    :rtype: list[`imagehash.ImageHash`]
+    """
+    import imagehash  # Imported when needed to keep 'import kaishi' light
+
+    bits = np.unpackbits(
+        np.asarray(packed, dtype=np.uint64).astype(">u8").view(np.uint8).reshape(-1, 8),
+        axis=1,
+    ).astype(bool)
+
+    return [imagehash.ImageHash(row.reshape(HASH_SIZE, HASH_SIZE)) for row in bits]
+
+
+def _pack_bits(bits):
+    """Pack an array of 64 flags per hash into a `numpy.uint64` array (first flag is the most significant bit).
+
+    :param bits: array of flags with one row per hash
+    :type bits: `numpy.array`
+    :return: packed hashes
+    :rtype: `numpy.array`
+    """
+    bits = np.asarray(bits, dtype=bool).reshape(len(bits), -1)
+
+    return np.packbits(bits, axis=1).view(">u8").astype(np.uint64).reshape(-1)
+
+
+def batch_perceptual_hashes(
+    thumbnails, hash_type: str = "average", channels_first: bool = False
+):
+    """Compute perceptual hashes for a whole batch of images at once.
+
+    The hashes follow the `imagehash` definitions ("average" is `average_hash`, "difference" is `dhash` and
+    "dct" is `phash`), but images are reduced with an area average instead of PIL resampling, so individual
+    bits can differ from the `imagehash` results.
+
+    :param thumbnails: batch of RGB images (e.g. from `build_numpy_batches(image_type="thumbnail")`)
+    :type thumbnails: `numpy.array`
+    :param hash_type: one of "average", "difference", or "dct"
+    :type hash_type: str
+    :param channels_first: flag indicating channels first vs. channels last in `thumbnails`
+    :type channels_first: bool
+    :return: packed hashes
+    :rtype: `numpy.array`
+    """
+    if hash_type not in PERCEPTUAL_HASH_TYPES:
+        raise ValueError("Hash type must be one of " + ", ".join(PERCEPTUAL_HASH_TYPES))
+    thumbnails = np.asarray(thumbnails, dtype=np.float64)
+    if channels_first:
+        gray = np.einsum("nchw,c->nhw", thumbnails, LUMA_WEIGHTS)
+    else:
+        gray = np.einsum("nhwc,c->nhw", thumbnails, LUMA_WEIGHTS)
+    height, width = gray.shape[1:]
+
+    if hash_type == "average":
+        pixels = _resize(
+            gray, _area_matrix(height, HASH_SIZE), _area_matrix(width, HASH_SIZE)
+        )
+        bits = pixels > pixels.mean(axis=(1, 2), keepdims=True)
+    elif hash_type == "difference":  # One extra column to compare neighbors
+        pixels = _resize(
+            gray, _area_matrix(height, HASH_SIZE), _area_matrix(width, HASH_SIZE + 1)
+        )
+        bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    else:  # Low frequency DCT coefficients compared to their median
+        dct_matrix = _dct_matrix(DCT_SIZE)[:HASH_SIZE]
+        coefficients = _resize(
+            gray,
+            dct_matrix @ _area_matrix(height, DCT_SIZE),
+            dct_matrix @ _area_matrix(width, DCT_SIZE),
+        )
+        flat = coefficients.reshape(len(coefficients), -1)
+        bits = flat > np.median(flat, axis=1, keepdims=True)
+
+    return _pack_bits(bits)
+
+
+def _area_matrix(in_size: int, out_size: int):
+    """Build a matrix that resizes a signal by averaging the input samples that overlap each output sample.
+
+    :param in_size: number of input samples
+    :type in_size: int
+    :param out_size: number of output samples
+    :type out_size: int
+    :return: `out_size` x `in_size` resizing matrix
+    :rtype: `numpy.array`
+    """
+    edges = np.arange(out_size + 1) * (in_size / out_size)
+    starts = np.maximum(edges[:-1, None], np.arange(in_size)[None, :])
+    stops = np.minimum(edges[1:, None], np.arange(1, in_size + 1)[None, :])
+
+    return np.maximum(stops - starts, 0) * (out_size / in_size)
+
+
+def _dct_matrix(size: int):
+    """Build the (unnormalized) type II DCT matrix, as used by `scipy.fftpack.dct`.
+
+    :param size: number of samples
+    :type size: int
+    :return: `size` x `size` DCT matrix
+    :rtype: `numpy.array`
+    """
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+
+    return 2 * np.cos(np.pi * k * (2 * n + 1) / (2 * size))
+
+
+def _resize(images, row_matrix, col_matrix):
+    """Apply separable linear operators to the rows and columns of a batch of 2D images.
+
+    :param images: batch of images
+    :type images: `numpy.array`
+    :param row_matrix: operator applied along the image height
+    :type row_matrix: `numpy.array`
+    :param col_matrix: operator applied along the image width
+    :type col_matrix: `numpy.array`
+    :return: transformed images
+    :rtype: `numpy.array`
+    """
+    return np.einsum("ih,nhw,jw->nij", row_matrix, images, col_matrix, optimize=True)
+
+
+def popcount(array):
+    """Count the set bits of each element of a `numpy.uint64` array.
+
+    :param array: array to count bits in
+    :type array: `numpy.array`
+    :return: bit counts
+    :rtype: `numpy.array`
+    """
+    return _popcount_inplace(np.array(array, dtype=np.uint64))
+
+
+def _popcount_inplace(array):
+    """Count the set bits of each element of a `numpy.uint64` array, overwriting the array.
+
+    :param array: array to count bits in
+    :type array: `numpy.array`
+    :return: bit counts
+    :rtype: `numpy.array`
+    """
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(array)
+    temp = array >> np.uint64(1)
+    temp &= _M1
+    array -= temp
+    np.right_shift(array, np.uint64(2), out=temp)
+    temp &= _M2
+    array &= _M2
+    array += temp
+    np.right_shift(array, np.uint64(4), out=temp)
+    array += temp
+    array &= _M4
+    array *= _H01
+    array >>= np.uint64(56)
+
+    return array
+
+
+def hamming_distance(packed_a, packed_b):
+    """Compute elementwise (broadcast) Hamming distances between packed hashes.
+
+    :param packed_a: packed hashes
+    :type packed_a: `numpy.array`
+    :param packed_b: packed hashes
+    :type packed_b: `numpy.array`
+    :return: Hamming distances
+    :rtype: `numpy.array`
+    """
+    return _popcount_inplace(np.bitwise_xor(packed_a, packed_b))
+
+
+def find_similar_by_hamming(
+    packed, valid, difference_threshold, block_size: int = HAMMING_BLOCK_SIZE
+):
+    """Find near duplicates among packed hashes, computing pairwise distances in bounded-size tiles.
+
+    Gives the same result as :func:`kaishi.core.misc.find_similar_by_value`: the parent of each similar hash
+    is the earliest hash within the threshold.
+
+    :param packed: packed hashes (see :func:`pack_hashes`)
+    :type packed: `numpy.array`
+    :param valid: flags indicating which hashes are present
+    :type valid: `numpy.array`
+    :param difference_threshold: differences above this threshold will be identified for removal
+    :type difference_threshold: int or float
+    :param block_size: number of rows and columns in each tile (memory use grows with its square)
+    :type block_size: int
+    :return: list of similar indices, list of unique items (parents of similar items)
+    :rtype: list and list
+    """
+    n = len(packed)
+    parents = np.full(n, -1, dtype=np.int64)
+    for row_start in range(0, n, block_size):
+        rows = np.arange(row_start, min(row_start + block_size, n))
+        pending = rows[valid[rows]]  # Rows that haven't found a parent yet
+        for col_start in range(0, row_start + len(rows), block_size):
+            if len(pending) == 0:
+                break
+            cols = np.arange(col_start, min(col_start + block_size, n))
+            matches = (
+                hamming_distance(packed[pending, None], packed[None, cols])
+                <= difference_threshold
+            )
+            matches &= valid[cols][None, :] & (cols[None, :] < pending[:, None])
+            found = np.any(matches, axis=1)
+            parents[pending[found]] = cols[np.argmax(matches[found], axis=1)]
+            pending = pending[~found]
+
+    badind = np.nonzero(parents >= 0)[0][::-1]
+
+    return badind.tolist(), parents[badind].tolist()
+
+
+def find_similar_by_bands(
+    packed, valid, difference_threshold, max_pairs: int = HAMMING_BLOCK_SIZE**2
+):
+    """Find near duplicates among packed hashes with multi-index hashing.
+
+    The 64 bits are split into `difference_threshold + 1` bands. Two hashes within the threshold differ in at
+    most that many bits, so at least one of their bands is identical (the pigeonhole principle). Only pairs of
+    hashes sharing a band value are compared, which is close to linear in the number of hashes when the bands
+    are wide (i.e. for small thresholds). Identical hashes are compared once. Gives the same result as
+    :func:`find_similar_by_hamming`: the parent of each similar hash is the earliest hash within the threshold.
+
+    :param packed: packed hashes (see :func:`pack_hashes`)
+    :type packed: `numpy.array`
+    :param valid: flags indicating which hashes are present
+    :type valid: `numpy.array`
+    :param difference_threshold: differences above this threshold will be identified for removal
+    :type difference_threshold: int or float
+    :param max_pairs: maximum number of candidate pairs compared at once (memory use grows with it)
+    :type max_pairs: int
+    :return: list of similar indices, list of unique items (parents of similar items)
+    :rtype: list and list
+    """
+    n = len(packed)
+    n_bands = int(np.floor(difference_threshold)) + 1
+    if n_bands < 1:
+        return [], []
+    indexes = np.nonzero(valid)[0]
+    values, first, inverse = np.unique(
+        packed[indexes], return_index=True, return_inverse=True
+    )
+    first = indexes[first]  # Earliest index of each distinct hash
+    nearest = np.full(len(values), n, dtype=np.int64)  # Earliest other similar hash
+    for shift, width in _get_bands(n_bands):
+        band = (values >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        for a, b in _get_colliding_pairs(band, max_pairs):
+            similar = hamming_distance(values[a], values[b]) <= difference_threshold
+            a, b = a[similar], b[similar]
+            np.minimum.at(nearest, a, first[b])
+            np.minimum.at(nearest, b, first[a])
+
+    parents = np.full(n, n, dtype=np.int64)
+    inverse = inverse.reshape(-1)
+    candidates = (first[inverse], nearest[inverse])
+    for candidate in candidates:  # Only earlier hashes can be parents
+        earlier = candidate < indexes
+        parents[indexes[earlier]] = np.minimum(
+            parents[indexes[earlier]], candidate[earlier]
+        )
+    badind = np.nonzero(parents < n)[0][::-1]
+
+    return badind.tolist(), parents[badind].tolist()
+
+
+def find_similar_hashes(packed, valid, difference_threshold):
+    """Find near duplicates among packed hashes, using the search that is faster for the threshold
+    (:func:`find_similar_by_bands` or :func:`find_similar_by_hamming`).
+
+    :param packed: packed hashes (see :func:`pack_hashes`)
+    :type packed: `numpy.array`
+    :param valid: flags indicating which hashes are present
+    :type valid: `numpy.array`
+    :param difference_threshold: differences above this threshold will be identified for removal
+    :type difference_threshold: int or float
+    :return: list of similar indices, list of unique items (parents of similar items)
+    :rtype: list and list
+    """
+    if 64 // (int(np.floor(difference_threshold)) + 1) >= MIN_BAND_BITS:
+        return find_similar_by_bands(packed, valid, difference_threshold)
+
+    return find_similar_by_hamming(packed, valid, difference_threshold)
+
+
+def _get_bands(n_bands: int):
+    """Split the 64 bits of a packed hash into bands of (nearly) equal widths.
+
+    :param n_bands: number of bands
+    :type n_bands: int
+    :return: shift and width of each band
+    :rtype: list of tuple
+    """
+    bands = []
+    shift = 0
+    for k in range(n_bands):
+        width = 64 // n_bands + (1 if k < 64 % n_bands else 0)
+        bands.append((shift, width))
+        shift += width
+
+    return bands
+
+
+def _get_colliding_pairs(keys, max_pairs: int):
+    """Generate all pairs of positions with equal keys, in chunks of about `max_pairs` pairs.
+
+    :param keys: keys to group positions by
+    :type keys: `numpy.array`
+    :param max_pairs: approximate maximum number of pairs in each chunk
+    :type max_pairs: int
+    :return: generator of position arrays (first and second element of each pair)
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(len(keys)), 0))
+    counts = np.arange(len(keys)) - group_start  # Earlier positions in each group
+    ends = np.cumsum(counts)
+    chunk_start = 0
+    while chunk_start < len(keys):
+        chunk_end = int(
+            np.searchsorted(ends, ends[chunk_start] - counts[chunk_start] + max_pairs)
+        )
+        chunk_end = min(max(chunk_end, chunk_start + 1), len(keys))
+        chunk_counts = counts[chunk_start:chunk_end]
+        total = int(chunk_counts.sum())
+        if total > 0:
+            second = np.repeat(np.arange(chunk_start, chunk_end), chunk_counts)
+            offsets = np.arange(total) - np.repeat(
+                np.cumsum(chunk_counts) - chunk_counts, chunk_counts
+            )
+            first = np.repeat(group_start[chunk_start:chunk_end], chunk_counts)
+            yield order[first + offsets], order[second]
+        chunk_start = chunk_end
@@ -1,7 +1,12 @@
 """Class definition for generic convnet labeler."""
+import json
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
-from kaishi.image.model import Model
+from kaishi.image.prediction_cache import PredictionCache
+from kaishi.image.file import MAX_DIM_FOR_SMALL
+from kaishi.image.file import RESAMPLE_METHOD
 
 
 class LabelerGenericConvnet(PipelineComponent):
@@ -15,6 +20,10 @@ class LabelerGenericConvnet(PipelineComponent):
     def __init__(self):
         """Initialize a new generic convnet labeler component."""
         super().__init__()
+        self.cost = Costs.INFERENCE
+        self.per_file = True
+        self.memoizable = True
+        self.configure()
 
     def __call__(self, dataset):
         """Perform the labeling operation on an image dataset.
@@ -23,23 +32,131 @@ class LabelerGenericConvnet(PipelineComponent):
         :type dataset: :class:`kaishi.image.dataset.ImageDataset`
         """
         if dataset.model is None:
+            from kaishi.image.model import Model  # Imports torch, so only when needed
+
             dataset.model = Model()
-        for batch, fobjs in dataset.build_numpy_batches(
-            batch_size=dataset.model.batch_size
-        ):
+        cache = None
+        pending = dataset.files
+        if self.prediction_cache is not None:  # Only run inference on cache misses
+            cache = PredictionCache(self.prediction_cache)
+            keys = self._get_cache_keys(dataset)
+            pending = []
+            for fobj, output in zip(dataset.files, cache.get(list(keys.values()))):
+                if output is None:
+                    pending.append(fobj)
+                else:
+                    self._apply_labels(fobj, output)
+
+        group = dataset if pending is dataset.files else dataset._get_view(pending)
+        if self.prefetch_depth > 0:  # Prepare the next batches during inference
+            batches = group.prefetch_numpy_batches(
+                dataset.model.batch_size,
+                depth=self.prefetch_depth,
+                workers=self.workers,
+            )
+        else:
+            batches = group.build_numpy_batches(batch_size=dataset.model.batch_size)
+        for batch, fobjs in batches:
             pred = dataset.model.predict(batch)
             for i in range(len(fobjs)):
-                if pred[i, 0] > 0.5:
-                    fobjs[i].add_label("DOCUMENT")
-                rot = np.argmax(pred[i, 1:5])
-                if rot == 0:
-                    fobjs[i].add_label("RECTIFIED")
-                elif rot == 1:
-                    fobjs[i].add_label("ROTATED_RIGHT")
-                elif rot == 2:
-                    fobjs[i].add_label("ROTATED_LEFT")
-                else:
-                    fobjs[i].add_label("UPSIDE_DOWN")
-                if pred[i, 5] > 0.5:
-                    fobjs[i].add_label("STRETCHED")
+                self._apply_labels(fobjs[i], pred[i])
+            if cache is not None:
+                cache.update([keys[id(fobj)] for fobj in fobjs], pred)
+        if cache is not None:
+            cache.close()
         dataset.labeled = True
+
+    def _apply_labels(self, fobj, output):
+        """Add the labels indicated by a model output vector to a file.
+
+        :param fobj: file to label
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        :param output: model output for the file
+        :type output: `numpy.array`
+        """
+        if output[0] > self.document_threshold:
+            fobj.add_label("DOCUMENT")
+        rot = np.argmax(output[1:5])
+        if rot == 0:
+            fobj.add_label("RECTIFIED")
+        elif rot == 1:
+            fobj.add_label("ROTATED_RIGHT")
+        elif rot == 2:
+            fobj.add_label("ROTATED_LEFT")
+        else:
+            fobj.add_label("UPSIDE_DOWN")
+        if output[5] > self.stretched_threshold:
+            fobj.add_label("STRETCHED")
+
+    def _get_cache_keys(self, dataset):
+        """Get prediction cache keys from the file contents and transforms, model and preprocessing parameters.
+
+        The preprocessing includes how each file was decoded, so files decoded at reduced resolution don't share
+        predictions with files decoded at full resolution.
+
+        :param dataset: kaishi image dataset
+        :type dataset: :class:`kaishi.image.dataset.ImageDataset`
+        :return: cache key of each file, by file object ID
+        :rtype: dict
+        """
+        missing = [fobj for fobj in dataset.files if fobj.hash is None]
+        unloaded = [fobj for fobj in dataset.files if not fobj.loaded]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(lambda fobj: fobj.compute_hash(), missing))
+            list(  # Decode the files first, so their decode modes are known
+                executor.map(
+                    lambda fobj: fobj.verify_loaded(
+                        analysis_only=dataset.analysis_only
+                    ),
+                    unloaded,
+                )
+            )
+        prefix = ":".join(
+            [
+                dataset.model.get_signature(),
+                "small_image",
+                str(MAX_DIM_FOR_SMALL),
+                str(RESAMPLE_METHOD),
+            ]
+        )
+
+        return {
+            id(fobj): prefix
+            + ":"
+            + ("draft" if fobj.draft else "full")  # Small images differ by decode
+            + ":"
+            + fobj.hash_algorithm
+            + ":"
+            + fobj.hash
+            + ":"
+            + json.dumps(fobj.transform_log)
+            for fobj in dataset.files
+        }
+
+    def configure(
+        self,
+        prefetch_depth=2,
+        workers=1,
+        prediction_cache=None,
+        document_threshold=0.5,
+        stretched_threshold=0.5,
+    ):
+        """Configure the labeler.
+
+        :param prefetch_depth: number of batches prepared in the background while the model runs (0 to disable)
+        :type prefetch_depth: int
+        :param workers: number of threads used to load images when prefetching (and to hash files)
+        :type workers: int
+        :param prediction_cache: optional path to a persistent cache of model outputs, so unchanged images with
+            an unchanged model (and preprocessing) aren't inferred again
+        :type prediction_cache: str
+        :param document_threshold: labels with DOCUMENT if the document output is greater than this
+        :type document_threshold: float
+        :param stretched_threshold: labels with STRETCHED if the stretched output is greater than this
+        :type stretched_threshold: float
+        """
+        self.prefetch_depth = prefetch_depth
+        self.workers = workers
+        self.prediction_cache = prediction_cache
+        self.document_threshold = document_threshold
+        self.stretched_threshold = stretched_threshold
@@ -1,42 +1,195 @@
 """Definition for PyTorch model abstraction."""
+import os
+import hashlib
+import tempfile
+import warnings
 from torchvision import models
-import pkg_resources
+import numpy as np
 import torch
 import torch.nn as nn
+from kaishi.core.misc import hash_file
+from kaishi.core.tracing import span
+from kaishi.image.file import MAX_DIM_FOR_SMALL
+from kaishi.image.util import DEFAULT_MODEL_ARCH
+from kaishi.image.util import WEIGHTS_FILES
+from kaishi.image.util import get_weights_path
+
+
+QUANTIZATION_TYPES = ["dynamic", "static"]  # int8 quantization options (CPU only)
+QUANTIZATION_ENGINE = "fbgemm"  # Quantized kernels for x86 CPUs
 
 
 class Model:
     """Abstraction for working with PyTorch models."""
 
-    def __init__(self, n_classes: int = 6, model_arch: str = "resnet18"):
+    def __init__(
+        self,
+        n_classes: int = 6,
+        model_arch: str = DEFAULT_MODEL_ARCH,
+        threads: int = None,
+        channels_last: bool = None,
+        quantization: str = None,
+        calibration_batches: list = None,
+        weights: str = None,
+        cache_dir: str = None,
+    ):
         """Initialize generic computer vision model class.
 
+        The model always runs in eval mode without autograd. On the CPU, inputs use the channels last memory
+        format by default and the model can be quantized to int8 (check the effect on predictions with
+        :func:`compare_predictions`).
+
         :param n_classes: number of classes at output layer
         :type n_classes: int
         :param model_arch: one of "resnet18", "vgg16_bn", or "resnet50"
         :type model_arch: str
+        :param threads: number of intra-op threads used by PyTorch (applies to the whole process)
+        :type threads: int
+        :param channels_last: flag to use the channels last memory format (defaults to `True` on the CPU)
+        :type channels_last: bool
+        :param quantization: "dynamic" (int8 linear layers, i.e. the classifier head) or "static" (int8 for the
+            whole network, calibrated on `calibration_batches`), default is `None` (float32)
+        :type quantization: str
+        :param calibration_batches: batches of images (batch, channel, x, y) used to calibrate static quantization
+        :type calibration_batches: list[`numpy.array`]
+        :param weights: path to a state dict to load (defaults to the packaged weights for `model_arch`)
+        :type weights: str
+        :param cache_dir: optional directory where the constructed model is cached as TorchScript, keyed by the
+            architecture, number of classes, quantization, weights checksum and PyTorch version (not supported for
+            static quantization, which depends on the calibration data)
+        :type cache_dir: str
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if self.device.type == "cpu":
+            warnings.warn("No GPU detected, ConvNet prediction tasks will be very slow")
         self.batch_size = 16
-        if model_arch == "vgg16_bn":
-            self.model = self.vgg16_bn(n_classes)
-            weights_filename = pkg_resources.resource_filename(
-                "kaishi", "weights/image_macro_issues_vgg16.pth"
+        self.model_arch = model_arch
+        self.n_classes = n_classes
+        self.quantization = quantization
+        self.weights_checksum = None  # Computed when needed (see 'get_signature')
+        if model_arch not in WEIGHTS_FILES:
+            raise ValueError(
+                "Model architecture must be one of " + ", ".join(WEIGHTS_FILES)
             )
-        elif model_arch == "resnet18":
-            self.model = self.resnet18(n_classes)
-            weights_filename = pkg_resources.resource_filename(
-                "kaishi", "weights/image_macro_issues_resnet18.pth"
-            )
-        elif model_arch == "resnet50":
-            self.model = self.resnet50(n_classes)
-            weights_filename = pkg_resources.resource_filename(
-                "kaishi", "weights/image_macro_issues_resnet50.pth"
-            )
-        state_dict = torch.load(weights_filename, map_location=self.device)
-        self.model.load_state_dict(state_dict)
+        if quantization is not None and self.device.type != "cpu":
+            raise ValueError("Quantized models only run on the CPU")
+        if threads is not None:
+            torch.set_num_threads(threads)
+        self.channels_last = (
+            self.device.type == "cpu" if channels_last is None else channels_last
+        )
+        if weights is None:
+            weights = get_weights_path(model_arch)
+        self.weights = weights
+        self.calibration_checksum = None
+        if quantization == "static" and calibration_batches:
+            digest = hashlib.md5()
+            for batch in calibration_batches:
+                digest.update(np.ascontiguousarray(batch).tobytes())
+            self.calibration_checksum = digest.hexdigest()
+
+        cache_path = None
+        if cache_dir is not None:
+            if quantization == "static":
+                raise ValueError("Statically quantized models can't be cached")
+            cache_path = os.path.join(cache_dir, self.get_cache_filename())
+        if cache_path is not None and os.path.exists(cache_path):
+            self.model = torch.jit.load(cache_path, map_location=self.device)
+        else:
+            self.model = getattr(self, model_arch)(n_classes)
+            state_dict = torch.load(weights, map_location=self.device)
+            self.model.load_state_dict(state_dict)
+            self.model.eval()
+            if quantization is not None:
+                self.model = quantize_model(
+                    self.model,
+                    quantization,
+                    calibration_batches=[
+                        self._to_tensor(batch) for batch in calibration_batches or []
+                    ],
+                )
+            if cache_path is not None:
+                self.model = self._cache_model(self.model, cache_path)
+        self.model.eval()
         if torch.cuda.is_available():
             self.model = self.model.cuda()
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+    def get_cache_filename(self):
+        """Get the name of the TorchScript file this model is cached as (see the `cache_dir` option).
+
+        :return: file name from the architecture, number of classes, quantization, weights checksum and PyTorch
+            version (TorchScript files aren't portable across versions)
+        :rtype: str
+        """
+        return (
+            "_".join(
+                [
+                    self.model_arch,
+                    str(self.n_classes),
+                    self.quantization or "float32",
+                    self.get_weights_checksum(),
+                    torch.__version__,
+                ]
+            )
+            + ".pt"
+        )
+
+    def _cache_model(self, model, cache_path: str):
+        """Trace a model to TorchScript and save it to the cache.
+
+        The model is traced on a fixed example input rather than scripted, since compiling the source of
+        torchvision models doesn't always succeed. Caching is only an optimization, so if tracing or saving fails,
+        a warning is issued and the eager model is used.
+
+        :param model: model in eval mode
+        :type model: `torch.nn.Module`
+        :param cache_path: path of the cached TorchScript file
+        :type cache_path: str
+        :return: traced model, or the eager model if it couldn't be cached
+        :rtype: `torch.jit.ScriptModule` or `torch.nn.Module`
+        """
+        example = torch.zeros(1, 3, MAX_DIM_FOR_SMALL, MAX_DIM_FOR_SMALL)
+        try:
+            with torch.no_grad():
+                traced = torch.jit.trace(model, example.to(self.device))
+            save_atomically(traced, cache_path)
+        except (RuntimeError, OSError) as error:
+            warnings.warn("Couldn't cache the model as TorchScript: " + str(error))
+            return model
+
+        return traced
+
+    def get_weights_checksum(self):
+        """Get the checksum of the weights file (computed on the first call).
+
+        :return: md5 hash of the weights file
+        :rtype: str
+        """
+        if self.weights_checksum is None:
+            self.weights_checksum = hash_file(self.weights)
+
+        return self.weights_checksum
+
+    def get_signature(self):
+        """Get a string that identifies the predictions of this model (e.g. for a prediction cache).
+
+        :return: architecture, number of classes, quantization (and calibration data checksum) and weights checksum
+        :rtype: str
+        """
+        quantization = self.quantization or "float32"
+        if self.calibration_checksum is not None:
+            quantization += "-" + self.calibration_checksum
+
+        return ":".join(
+            [
+                self.model_arch,
+                str(self.n_classes),
+                quantization,
+                self.get_weights_checksum(),
+            ]
+        )
 
     def vgg16_bn(self, n_classes: int):
         """Basic VGG16 model with variable number of output classes.
@@ -68,7 +221,7 @@ class Model:
         :return: PyTorch ResNet18 model object
         :rtype: `torchvision.models.resnet18`
         """
-        model = torch.hub.load("pytorch/vision:v0.4.2", "resnet18", pretrained=False)
+        model = models.resnet18(pretrained=False)
         model.fc = nn.Sequential(
             nn.Linear(512, 64),
             nn.ReLU(),
@@ -87,7 +240,7 @@ class Model:
         :return: PyTorch ResNet50 model object
         :rtype: `torchvision.models.resnet50`
         """
-        model = torch.hub.load("pytorch/vision:v0.4.2", "resnet50", pretrained=False)
+        model = models.resnet50(pretrained=False)
         model.fc = torch.nn.Sequential(
             torch.nn.Linear(in_features=2048, out_features=n_classes),
             torch.nn.Sigmoid(),
@@ -103,6 +256,109 @@ class Model:
         :return: predictions, where the dimensions are (batch, output)
         :rtype: `numpy.array`
         """
+        with span("predict", "inference", batch=len(numpy_array)):
+            with torch.no_grad():
+                return self.model(self._to_tensor(numpy_array)).cpu().numpy()
+
+    def _to_tensor(self, numpy_array):
+        """Convert a batch of images to a float32 tensor on the model device, in the model memory format.
+
+        :param numpy_array: input array, where dimensions are (batch, channel, x, y)
+        :type numpy_array: `numpy.array`
+        :return: input tensor
+        :rtype: `torch.Tensor`
+        """
         in_tensor = torch.from_numpy(numpy_array).to(torch.float32).to(self.device)
+        if self.channels_last:
+            in_tensor = in_tensor.contiguous(memory_format=torch.channels_last)
+
+        return in_tensor
+
+
+def save_atomically(script_module, path: str):
+    """Save a TorchScript module so that concurrent readers never see a partially written file.
+
+    :param script_module: TorchScript module to save
+    :type script_module: `torch.jit.ScriptModule`
+    :param path: destination path
+    :type path: str
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(handle)
+    try:
+        torch.jit.save(script_module, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def quantize_model(model, quantization: str, calibration_batches: list = None):
+    """Quantize a float model in eval mode to int8 for CPU inference.
+
+    :param model: PyTorch model
+    :type model: `torch.nn.Module`
+    :param quantization: "dynamic" (linear layers, weights quantized ahead of time and activations on the fly)
+        or "static" (all supported layers, with activation ranges calibrated on `calibration_batches`)
+    :type quantization: str
+    :param calibration_batches: input tensors used to calibrate static quantization
+    :type calibration_batches: list[`torch.Tensor`]
+    :return: quantized model
+    :rtype: `torch.nn.Module`
+    """
+    if quantization not in QUANTIZATION_TYPES:
+        raise ValueError("Quantization must be one of " + ", ".join(QUANTIZATION_TYPES))
+    torch.backends.quantized.engine = QUANTIZATION_ENGINE
+    if quantization == "dynamic":
+        return torch.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8
+        )
+
+    # Graph mode quantization needs no changes to the models (available as of PyTorch 1.8)
+    from torch.quantization import quantize_fx
+
+    if not calibration_batches:
+        raise ValueError("Static quantization needs calibration batches")
+    qconfig_dict = {"": torch.quantization.get_default_qconfig(QUANTIZATION_ENGINE)}
+    try:
+        prepared = quantize_fx.prepare_fx(
+            model, qconfig_dict, example_inputs=(calibration_batches[0],)
+        )
+    except TypeError:  # PyTorch < 1.13 doesn't take example inputs
+        prepared = quantize_fx.prepare_fx(model, qconfig_dict)
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+
+    return quantize_fx.convert_fx(prepared)
+
+
+def compare_predictions(reference_predict, predict, batches: list, threshold=0.5):
+    """Compare the predictions of a model with those of a reference model (e.g. quantized vs. float) on held-out data.
+
+    :param reference_predict: prediction function of the reference model (e.g. :meth:`Model.predict`)
+    :type reference_predict: function
+    :param predict: prediction function of the model to check
+    :type predict: function
+    :param batches: batches of inputs to predict
+    :type batches: list[`numpy.array`]
+    :param threshold: threshold applied to each output when comparing labels
+    :type threshold: float
+    :return: maximum and mean absolute differences of the outputs, and fraction of outputs on the same side of
+        the threshold
+    :rtype: dict
+    """
+    reference = np.concatenate([reference_predict(batch) for batch in batches])
+    predictions = np.concatenate([predict(batch) for batch in batches])
+    difference = np.abs(predictions - reference)
 
-        return self.model(in_tensor).detach().cpu().numpy()
+    return {
+        "max_abs_difference": float(difference.max()),
+        "mean_abs_difference": float(difference.mean()),
+        "label_agreement": float(
+            np.mean((predictions > threshold) == (reference > threshold))
+        ),
+    }
@@ -0,0 +1,88 @@
+"""Class definition for a persistent cache of model predictions."""
+import os
+import sqlite3
+import numpy as np
+
+
+PREDICTION_CACHE_VERSION = 1  # Bump when the table layout changes
+MAX_KEYS_PER_QUERY = 500  # Stay under the SQLite limit on query variables
+
+
+class PredictionCache:
+    """SQLite-backed record of raw model outputs, keyed by everything that determines them.
+
+    Keys combine the file content hash, any transforms applied to the image, the model signature (architecture,
+    number of classes, quantization and weights checksum) and the preprocessing parameters, so a cached output
+    is only reused for identical inputs to an identical model.
+    """
+
+    def __init__(self, path: str):
+        """Open (or create) a prediction cache file.
+
+        :param path: path to the cache file
+        :type path: str
+        """
+        self.path = os.path.abspath(path)
+        cache_dir = os.path.dirname(self.path)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.connection = sqlite3.connect(self.path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != PREDICTION_CACHE_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS predictions")
+            self.connection.execute(
+                "PRAGMA user_version = " + str(PREDICTION_CACHE_VERSION)
+            )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, output BLOB)"
+        )
+        self.connection.commit()
+
+    def __repr__(self):
+        return "PredictionCache(" + self.path + ")"
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def get(self, keys: list):
+        """Look up the outputs for a list of keys.
+
+        :param keys: cache keys
+        :type keys: list[str]
+        :return: output vectors (None for keys that aren't cached)
+        :rtype: list
+        """
+        outputs = dict()
+        unique_keys = list(set(keys))
+        for start in range(0, len(unique_keys), MAX_KEYS_PER_QUERY):
+            chunk = unique_keys[start : start + MAX_KEYS_PER_QUERY]
+            for key, output in self.connection.execute(
+                "SELECT key, output FROM predictions WHERE key IN ("
+                + ", ".join(["?"] * len(chunk))
+                + ")",
+                chunk,
+            ):
+                outputs[key] = np.frombuffer(output, dtype=np.float32)
+
+        return [outputs.get(key) for key in keys]
+
+    def update(self, keys: list, outputs):
+        """Record the outputs for a list of keys.
+
+        :param keys: cache keys
+        :type keys: list[str]
+        :param outputs: output vectors, one row per key
+        :type outputs: `numpy.array`
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO predictions VALUES (?, ?)",
+            [
+                (key, np.asarray(output, dtype=np.float32).tobytes())
+                for key, output in zip(keys, outputs)
+            ],
+        )
+        self.connection.commit()
+
+    def close(self):
+        """Close the connection to the cache file."""
+        self.connection.close()
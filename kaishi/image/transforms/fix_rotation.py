@@ -1,4 +1,5 @@
 """Class definition for fixing image rotation."""
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
 from kaishi.image.labelers.generic_convnet import LabelerGenericConvnet
 
@@ -9,6 +10,10 @@ class TransformFixRotation(PipelineComponent):
     def __init__(self):
         """Initialize new transform component."""
         super().__init__()
+        self.cost = Costs.INFERENCE
+        self.per_file = True
+        self.memoizable = True
+        self.configure()
 
     def __call__(self, dataset):
         """Perform the transformation operation on an image dataset.
@@ -17,7 +22,9 @@ class TransformFixRotation(PipelineComponent):
         :type dataset: :class:`kaishi.image.dataset.ImageDataset`
         """
         if not dataset.labeled:
-            LabelerGenericConvnet()(dataset)
+            labeler = LabelerGenericConvnet()
+            labeler.configure(prediction_cache=self.prediction_cache)
+            labeler(dataset)
             dataset.labeled = True
 
         for fobj in dataset.files:
@@ -33,3 +40,11 @@ class TransformFixRotation(PipelineComponent):
                 fobj.rotate(180)
                 fobj.remove_label("UPSIDE_DOWN")
             fobj.add_label("RECTIFIED")
+
+    def configure(self, prediction_cache=None):
+        """Configure the transform.
+
+        :param prediction_cache: optional path to a persistent cache of model outputs used when labeling
+        :type prediction_cache: str
+        """
+        self.prediction_cache = prediction_cache
@@ -8,7 +8,9 @@ class TransformLimitDimensions(PipelineComponent):
     def __init__(self):
         """Initialize new transform object."""
         super().__init__()
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
         self.configure()
 
     def __call__(self, dataset):
@@ -17,6 +19,16 @@ class TransformLimitDimensions(PipelineComponent):
         :param dataset: image dataset to perform operation on
         :type dataset: :class:`kaishi.image.dataset.ImageDatset`
         """
+        self.process_files(dataset)
+
+    def process_file(self, fobj, index: int):
+        """Limit the dimensions of an image.
+
+        :param fobj: image file to resize
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        :param index: index of the file in the dataset
+        :type index: int
+        """
         if all(
             [
                 self.max_dimension is None,
@@ -25,12 +37,11 @@ class TransformLimitDimensions(PipelineComponent):
             ]
         ):
             return
-        for i in self.get_target_indexes(dataset):
-            dataset.files[i].limit_dimensions(
-                max_dimension=self.max_dimension,
-                max_width=self.max_width,
-                max_height=self.max_height,
-            )
+        fobj.limit_dimensions(
+            max_dimension=self.max_dimension,
+            max_width=self.max_width,
+            max_height=self.max_height,
+        )
 
     def configure(self, max_dimension=None, max_width=None, max_height=None):
         """Configure the component. Any combination of these parameters can be defined or not, where smallest
@@ -8,7 +8,9 @@ class TransformToGrayscale(PipelineComponent):
     def __init__(self):
         """Initialize transform component."""
         super().__init__()
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
 
     def __call__(self, dataset):
         """Perform operation on a given dataset.
@@ -16,5 +18,14 @@ class TransformToGrayscale(PipelineComponent):
         :param dataset: image dataset with images to convert
         :type dataset: :class:`kaishi.image.dataset.ImageDataset`
         """
-        for i in self.get_target_indexes(dataset):
-            dataset.files[i].convert_to_grayscale()
+        self.process_files(dataset)
+
+    def process_file(self, fobj, index: int):
+        """Convert an image to grayscale.
+
+        :param fobj: image file to convert
+        :type fobj: :class:`kaishi.image.file.ImageFile`
+        :param index: index of the file in the dataset
+        :type index: int
+        """
+        fobj.convert_to_grayscale()
@@ -3,6 +3,14 @@ import numpy as np
 import imghdr
 
 
+DEFAULT_MODEL_ARCH = "resnet18"  # Architecture of the default model
+WEIGHTS_FILES = {  # Packaged weights for each architecture
+    "vgg16_bn": "weights/image_macro_issues_vgg16.pth",
+    "resnet18": "weights/image_macro_issues_resnet18.pth",
+    "resnet50": "weights/image_macro_issues_resnet50.pth",
+}
+
+
 def swap_channel_dimension(tensor):
     """Swap between channels_first and channels_last.
 
@@ -71,3 +79,16 @@ def get_batch_dimensions(
         return swap_channel_dimension(sz)
     else:
         return sz
+
+
+def get_weights_path(model_arch: str = DEFAULT_MODEL_ARCH):
+    """Get the path of the packaged weights for a model architecture (without importing PyTorch).
+
+    :param model_arch: one of "resnet18", "vgg16_bn", or "resnet50"
+    :type model_arch: str
+    :return: path of the weights file
+    :rtype: str
+    """
+    import pkg_resources  # Slow to import, so only when needed
+
+    return pkg_resources.resource_filename("kaishi", WEIGHTS_FILES[model_arch])
@@ -1,6 +1,5 @@
 """Class definition for concatenating tabular data files."""
 from kaishi.core.pipeline_component import PipelineComponent
-import pandas as pd
 
 
 class AggregatorConcatenateDataframes(PipelineComponent):
@@ -17,6 +16,8 @@ class AggregatorConcatenateDataframes(PipelineComponent):
         :param dataset: tabular dataset to perform operation on
         :type dataset: :class:`kaishi.tabular.dataset.TabularDataset`
         """
+        import pandas as pd  # Imported when needed to keep 'import kaishi' light
+
         i_with_valid_dataframes = dataset._get_indexes_with_valid_dataframe()
         i_valid_targets = self.get_target_indexes(dataset)
         i_intersection = list(set(i_with_valid_dataframes) & set(i_valid_targets))
@@ -12,6 +12,8 @@ class TabularDataset:
         recursive: bool = False,
         use_predefined_pipeline: bool = False,
         out_dir: str = None,
+        workers: int = None,
+        manifest: str = None,
     ):
         """Create a tabular data object given a directory of files.
 
@@ -23,6 +25,10 @@ class TabularDataset:
         :type use_predefined_pipeline: bool
         :param out_dir: The output directory.
         :type out_dir: str
+        :param workers: Number of threads used to scan directories.
+        :type workers: int
+        :param manifest: Optional path to a manifest file that caches values (e.g. hashes) between loads.
+        :type manifest: str
         """
         if os.path.exists(source):
             return TabularFileGroup(
@@ -30,6 +36,8 @@ class TabularDataset:
                 recursive=recursive,
                 use_predefined_pipeline=use_predefined_pipeline,
                 out_dir=out_dir,
+                workers=workers,
+                manifest=manifest,
             )
         else:
             raise NotImplementedError("Currently only supports a valid path as input")
@@ -1,7 +1,6 @@
 """Class definition for tabular data files."""
 import warnings
 import numpy as np
-import pandas as pd
 from kaishi.core.file import File
 
 
@@ -50,6 +49,8 @@ class TabularFile(File):
         """Load the file if supported."""
         if self.df is not None:
             return
+        import pandas as pd  # Imported on first load to keep 'import kaishi' light
+
         if self._has_csv_file_ext():
             self.df = pd.read_csv(self.abspath)
         elif self._has_json_file_ext():
@@ -62,6 +63,10 @@ class TabularFile(File):
             )
             self.load_error = True
 
+    def unload(self):
+        """Release the data frame, keeping the summary."""
+        self.df = None
+
     def get_summary(self):
         """Create summary for this data frame.
 
@@ -76,7 +81,7 @@ class TabularFile(File):
             describe = dict()
             fraction_missing = dict()
             for col in self.df.columns.tolist():
-                col_missing = pd.isnull(self.df[col])
+                col_missing = self.df[col].isnull()
                 fraction_missing[col] = col_missing.mean()
                 if np.isnan(fraction_missing[col]):
                     fraction_missing[col] = 0
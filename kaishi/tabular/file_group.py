@@ -28,6 +28,8 @@ class TabularFileGroup(FileGroup):
         recursive: bool,
         use_predefined_pipeline: bool = False,
         out_dir: str = None,
+        workers: int = None,
+        manifest: str = None,
     ):
         """Initialize new tabular file group and a data processing pipeline.
 
@@ -39,11 +41,18 @@ class TabularFileGroup(FileGroup):
         :type use_predefined_pipeline: bool
         :param out_dir: The output directory.
         :type out_dir: str
+        :param workers: Number of threads used to scan directories.
+        :type workers: int
+        :param manifest: Optional path to a manifest file that caches values (e.g. hashes) between loads.
+        :type manifest: str
         """
         super().__init__(recursive)
         self.pipeline = Pipeline()
+        self.supports_checkpoints = False  # Dataframe edits aren't journaled
         self.artifacts["df_concatenated"] = None
-        self.load_dir(source, TabularFile, recursive)
+        self.load_dir(source, TabularFile, recursive, workers=workers)
+        if manifest is not None:
+            self.load_manifest(manifest, workers=workers)
         if use_predefined_pipeline:
             if out_dir is not None:
 
@@ -114,19 +123,57 @@ class TabularFileGroup(FileGroup):
                 else:
                     raise NotImplementedError
 
-    def load_all(self):
-        """Load all files from the source directory."""
-        for fobj in self.files:
+    def load_all(self, files: list = None):
+        """Load all files from the source directory.
+
+        :param files: subset of file objects to load (defaults to all files)
+        :type files: list
+        """
+        for fobj in self.files if files is None else files:
             fobj.verify_loaded()
 
-    def run_pipeline(self, verbose: bool = False):
+    def run_pipeline(
+        self,
+        verbose: bool = False,
+        previous_state: dict = None,
+        chunk_size: int = None,
+        checkpoint: str = None,
+        checkpoint_interval: int = None,
+        resume_from: str = None,
+    ):
         """Run the pipeline as configured.
 
         :param verbose: flag indicating verbosity
         :type verbose: bool
+        :param previous_state: state from :meth:`get_state` after a previous run (only new files are processed)
+        :type previous_state: dict
+        :param chunk_size: if specified, run in streaming mode with at most this many files loaded at once
+        :type chunk_size: int
+        :param checkpoint: optional path where the progress is journaled after each step, to resume the run with
+            `resume_from` if it's interrupted (e.g. by running out of memory)
+        :type checkpoint: str
+        :param checkpoint_interval: if specified, also journal the progress of per-file steps after this many files
+        :type checkpoint_interval: int
+        :param resume_from: path of a checkpoint to resume from (the run starts over if the file doesn't exist)
+        :type resume_from: str
         """
-        self.load_all()
-        self.pipeline(self, verbose=verbose)
+        new_files, resume = self._prepare_run(
+            previous_state, chunk_size, checkpoint, resume_from
+        )
+        if chunk_size is not None:
+            for _ in self.stream_pipeline(chunk_size, verbose=verbose):
+                pass
+            return
+        self.load_all(new_files)
+        self.pipeline(
+            self,
+            verbose=verbose,
+            new_files=new_files,
+            checkpoint=checkpoint,
+            checkpoint_interval=checkpoint_interval,
+            resume=resume,
+        )
+        self.save_manifest()
         if verbose:
             print("Pipeline completed")
 
@@ -8,7 +8,9 @@ class FilterDuplicateRowsEachDataframe(PipelineComponent):
     def __init__(self):
         """Initialize new filter component."""
         super().__init__()
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
 
     def __call__(self, dataset):
         """Perform the filter operation on a given tabular dataset.
@@ -16,7 +18,16 @@ class FilterDuplicateRowsEachDataframe(PipelineComponent):
         :param dataset: dataset to perform operation on
         :type dataset: :class:`kaishi.tabular.dataset.TabularDataset`
         """
-        valid_indexes = dataset._get_indexes_with_valid_dataframe()
-        targets = list(set(valid_indexes) & set(self.get_target_indexes(dataset)))
-        for i in targets:
-            dataset.files[i].df.drop_duplicates(inplace=True)
+        self.process_files(dataset)
+
+    def process_file(self, fobj, index: int):
+        """Drop the duplicate rows of a file's dataframe.
+
+        :param fobj: tabular file
+        :type fobj: :class:`kaishi.tabular.file.TabularFile`
+        :param index: index of the file in the dataset
+        :type index: int
+        """
+        fobj.verify_loaded()
+        if fobj.df is not None:
+            fobj.df.drop_duplicates(inplace=True)
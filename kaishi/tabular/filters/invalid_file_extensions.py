@@ -1,7 +1,7 @@
 """Class definition for filtering invalid tabular file extensions."""
 import os
+from kaishi.core.costs import Costs
 from kaishi.core.pipeline_component import PipelineComponent
-from kaishi.core.misc import trim_list_by_inds
 
 
 VALID_EXT = [
@@ -20,7 +20,12 @@ class FilterInvalidFileExtensions(PipelineComponent):
     def __init__(self):
         """Initialize new filter object."""
         super().__init__()
+        self.cost = Costs.METADATA
+        self.commutative = True
+        self.per_file = True
         self.applies_to_available = True
+        self.fusable = True
+        self.filter_key = "unsupported_extension"
         self.configure()
 
     def __call__(self, dataset):
@@ -29,17 +34,20 @@ class FilterInvalidFileExtensions(PipelineComponent):
         :param dataset: dataset to perform file extension filter on
         :type dataset: :class:`kaishi.tabular.dataset.TabularDataset`
         """
-        badind = []
-        for i in self.get_target_indexes(dataset):
-            fobj = dataset.files[i]
-            _, ext = os.path.splitext(fobj.basename)
-            if len(ext) == 0 or ext not in self.valid_extensions:
-                badind.append(i)
+        return self.process_files(dataset)
 
-        dataset.files, trimmed = trim_list_by_inds(dataset.files, badind)
-        dataset.filtered["unsupported_extension"] = trimmed
+    def process_file(self, fobj, index: int):
+        """Check the extension of a file.
 
-        return trimmed
+        :param fobj: file to check
+        :type fobj: :class:`kaishi.tabular.file.TabularFile`
+        :param index: index of the file in the dataset
+        :type index: int
+        :return: flag indicating if the file has a valid tabular extension
+        :rtype: bool
+        """
+        _, ext = os.path.splitext(fobj.basename)
+        return len(ext) > 0 and ext in self.valid_extensions
 
     def configure(self, valid_extensions=VALID_EXT):
         """Configure the file extension filter (default list defined in `VALID_EXT`).
@@ -39,3 +39,28 @@ def test_duplicates():
     test.configure_pipeline(["FilterDuplicateFiles"])
     test.run_pipeline()
     assert len(test.filtered["duplicates"]) > 0
+
+
+def test_duplicates_with_workers():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, recursive=True)
+    test.configure_pipeline(["FilterDuplicateFiles"])
+    test.pipeline.components[0].configure(hash_algorithm="blake2b", workers=4)
+    test.run_pipeline()
+    assert [repr(fobj) for fobj in test.filtered["duplicates"]] == [
+        "sample_duplicate.jpg"
+    ]
+
+
+def test_by_label_unconfigured():
+    for fuse in [False, True]:
+        test = FileGroup(recursive=True)
+        test.load_dir("tests/data/image", File, recursive=True)
+        test.configure_pipeline(["FilterByRegex", "FilterByLabel"])
+        test.pipeline.components[0].configure(pattern="sample.jpg")
+        test.pipeline.fuse = fuse
+        test.files[0].add_label("TRAIN")
+        original_count = len(test.files)
+        test.run_pipeline()
+        assert len(test.files) == original_count - 1
+        assert "label_match" not in test.filtered
@@ -14,6 +14,9 @@ def test_str():
 def test_compute_hash():
     test = File("tests/data", "image", "sample.jpg")
     assert test.compute_hash() == "df11f7053426c06d1c6073f88571ac40"
+    assert test.hash_algorithm == "md5"
+    test.compute_hash(algorithm="sha1")
+    assert test.hash_algorithm == "sha1" and len(test.hash) == 40
 
 
 def test_labels():
@@ -1,5 +1,6 @@
 from io import StringIO
 import sys
+import pytest
 from kaishi.core.file import File
 from kaishi.core.file_group import FileGroup
 
@@ -32,3 +33,55 @@ def test_file_report():
     test.file_report()
     sys.stdout = sys.__stdout__
     assert "sample.jpg" in print_capture.getvalue()
+    assert "Pipeline profile" not in print_capture.getvalue()
+
+
+def test_file_report_with_profile():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterDuplicateFiles"])
+    test.run_pipeline()
+    print_capture = StringIO()
+    sys.stdout = print_capture
+    test.file_report()
+    sys.stdout = sys.__stdout__
+    assert "Pipeline profile" in print_capture.getvalue()
+    assert "FilterDuplicateFiles" in print_capture.getvalue()
+
+
+def test_stream_pipeline():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles"])
+    test.pipeline.components[0].configure(pattern="gray.jpg")
+    reference = FileGroup(recursive=True)
+    reference.load_dir("tests/data/image", File, True)
+    reference.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles"])
+    reference.pipeline.components[0].configure(pattern="gray.jpg")
+    reference.run_pipeline()
+
+    streamed = [repr(fobj) for fobj in test.stream_pipeline(chunk_size=2)]
+    assert streamed == [repr(fobj) for fobj in reference.files]
+    assert streamed == [repr(fobj) for fobj in test.files]
+    for k in reference.filtered:
+        assert [repr(fobj) for fobj in test.filtered[k]] == [
+            repr(fobj) for fobj in reference.filtered[k]
+        ]
+
+
+def test_stream_pipeline_not_supported():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterSubsample"])
+    with pytest.raises(NotImplementedError):
+        test.run_pipeline(chunk_size=2)
+
+
+def test_stream_pipeline_index_targets_not_supported():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterByRegex"])
+    test.pipeline.components[0].configure(pattern="gray.jpg")
+    test.pipeline.components[0].applies_to([1, ".*sample.*"])
+    with pytest.raises(NotImplementedError, match="applies_to"):
+        test.run_pipeline(chunk_size=2)
@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ["torch", "torchvision", "pandas", "imagehash"]
+
+
+def import_in_subprocess(module):
+    """Import a module in a fresh interpreter, returning the heavy modules it loaded."""
+    code = (
+        "import json, sys\n"
+        "import " + module + "\n"
+        "heavy = " + repr(HEAVY_MODULES) + "\n"
+        "print(json.dumps([name for name in heavy if name in sys.modules]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE
+    ).stdout
+
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_import_is_light():
+    for module in ["kaishi.image.dataset", "kaishi.tabular", "kaishi.core.dataset"]:
+        assert import_in_subprocess(module) == []
+
+
+def test_image_dataset_without_torch():
+    code = (
+        "import sys\n"
+        "from kaishi.image.dataset import ImageDataset\n"
+        "dataset = ImageDataset('tests/data/image', recursive=True)\n"
+        "dataset.configure_pipeline(['FilterDuplicateFiles'])\n"
+        "dataset.run_pipeline()\n"
+        "assert 'torch' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
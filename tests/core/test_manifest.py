@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+from kaishi.core.file import File
+from kaishi.core.file_group import FileGroup
+from kaishi.core.manifest import Manifest
+
+
+def test_reuse_cached_hashes():
+    tempdir = tempfile.TemporaryDirectory()
+    manifest_path = os.path.join(tempdir.name, "manifest.sqlite")
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    assert test.load_manifest(manifest_path) == 0
+    test.configure_pipeline(["FilterDuplicateFiles"])
+    test.run_pipeline()
+    assert os.path.exists(manifest_path)
+
+    reloaded = FileGroup(recursive=True)
+    reloaded.load_dir("tests/data/image", File, True)
+    assert reloaded.load_manifest(manifest_path) == len(reloaded.files)
+    assert reloaded["sample.jpg"].hash == "df11f7053426c06d1c6073f88571ac40"
+
+
+def test_changed_file_is_not_reused():
+    tempdir = tempfile.TemporaryDirectory()
+    shutil.copy("tests/data/image/sample.jpg", tempdir.name)
+    manifest = Manifest(os.path.join(tempdir.name, "manifest.sqlite"))
+    fobj = File(tempdir.name, None, "sample.jpg")
+    fobj.compute_hash()
+    manifest.update([fobj])
+    with open(fobj.abspath, "ab") as fd:
+        fd.write(b"changed")
+    changed = File(tempdir.name, None, "sample.jpg")
+    assert manifest.apply([changed]) == 0
+    assert changed.hash is None
+
+
+def test_manifest_in_source_directory_is_ignored():
+    tempdir = tempfile.TemporaryDirectory()
+    shutil.copy("tests/data/image/sample.jpg", tempdir.name)
+    test = FileGroup(recursive=False)
+    Manifest(os.path.join(tempdir.name, "manifest.sqlite")).close()
+    test.load_dir(tempdir.name, File, False)
+    test.load_manifest(os.path.join(tempdir.name, "manifest.sqlite"))
+    assert [repr(fobj) for fobj in test.files] == ["sample.jpg"]
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+from kaishi.core.file import File
+from kaishi.core.file_group import FileGroup
+from kaishi.core.memoization import ComponentCache
+from kaishi.core.pipeline_component import PipelineComponent
+
+
+class CountingDuplicateLabeler(PipelineComponent):
+    """Memoizable component that labels duplicates, filters one file and counts its runs."""
+
+    def __init__(self):
+        super().__init__()
+        self.memoizable = True
+        self.runs = 0
+
+    def __call__(self, dataset):
+        self.runs += 1
+        for fobj in dataset.files:
+            if len(fobj.children["duplicates"]) > 0:
+                fobj.add_label("TRAIN")
+        dataset.filtered["first"] = dataset.files[:1]
+        dataset.files = dataset.files[1:]
+
+
+def _run(cache, directory="tests/data/image"):
+    group = FileGroup(recursive=True)
+    group.load_dir(directory, File, True)
+    labeler = CountingDuplicateLabeler()
+    group.configure_pipeline(["FilterDuplicateFiles", labeler])
+    group.pipeline.component_cache = cache
+    group.run_pipeline()
+
+    return group, labeler
+
+
+def _describe(group):
+    state = group.get_state()
+    del state["completed_steps"]
+
+    return state
+
+
+def test_memoized_run():
+    cache = ComponentCache()
+    first, labeler = _run(cache)
+    assert labeler.runs == 1 and len(cache) == 2
+    second, labeler = _run(cache)
+    assert labeler.runs == 0  # Replayed
+    assert _describe(second) == _describe(first)
+    assert any(fobj.has_label("TRAIN") for fobj in second.files)
+    assert second.pipeline.completed_steps[-1]["profile"]["files_out"] == len(
+        first.files
+    )
+
+
+def test_memoized_run_persistent():
+    tempdir = tempfile.TemporaryDirectory()
+    first, _ = _run(ComponentCache(os.path.join(tempdir.name, "cache")))
+    second, labeler = _run(ComponentCache(os.path.join(tempdir.name, "cache")))
+    assert labeler.runs == 0
+    assert _describe(second) == _describe(first)
+
+
+def test_memoized_run_changed_files():
+    tempdir = tempfile.TemporaryDirectory()
+    directory = os.path.join(tempdir.name, "data")
+    shutil.copytree("tests/data/image", directory)
+    cache = ComponentCache()
+    _run(cache, directory)
+    os.remove(os.path.join(directory, "sample_duplicate.jpg"))
+    _, labeler = _run(cache, directory)
+    assert labeler.runs == 1  # Different input
+    assert len(cache) == 4
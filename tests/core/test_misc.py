@@ -1,11 +1,63 @@
+import os
+import time
+import tempfile
+import pytest
+import numpy as np
+from kaishi.core.file import File
 from kaishi.core.misc import (
+    load_files_by_walk,
+    load_files_by_scandir,
     trim_list_by_inds,
     find_duplicate_inds,
+    find_duplicate_files,
+    partial_hash_file,
+    hash_file,
     find_similar_by_value,
+    BKTree,
     md5sum,
+    prefetch,
 )
 
 
+def test_load_files_by_scandir():
+    walk_dir, walk_children, walk_files = load_files_by_walk(
+        "tests/data", File, recursive=True
+    )
+    scan_dir, scan_children, scan_files = load_files_by_scandir(
+        "tests/data", File, recursive=True, workers=2
+    )
+    assert scan_dir == walk_dir
+    assert sorted(scan_children) == sorted(walk_children)
+    assert sorted(map(repr, scan_files)) == sorted(map(repr, walk_files))
+    _, _, scan_files_again = load_files_by_scandir("tests/data", File, recursive=True)
+    assert list(map(repr, scan_files)) == list(map(repr, scan_files_again))
+
+
+def test_load_files_by_scandir_unreadable_directory(monkeypatch):
+    tempdir = tempfile.TemporaryDirectory()
+    for relpath in ["x.jpg", "a/z.jpg", "b/y.jpg"]:
+        path = os.path.join(tempdir.name, relpath)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, "wb").close()
+    scandir = os.scandir
+
+    def denied_scandir(path):
+        if os.path.basename(path) == "a":
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", denied_scandir)
+    _, dir_children, files = load_files_by_scandir(tempdir.name, File, True)
+    assert "b" in dir_children
+    assert list(map(repr, files)) == ["x.jpg", "b/y.jpg"]
+
+
+def test_load_files_by_scandir_not_recursive():
+    _, dir_children, files = load_files_by_scandir("tests/data", File)
+    assert len(dir_children) == 0 and len(files) == 0
+
+
 def test_trim_list_by_inds():
     newlist, trimmed = trim_list_by_inds([2, 0, 3, 1], [3, 0, 2])
     assert len(newlist) == 1 and newlist[0] == 0
@@ -20,6 +72,19 @@ def test_find_duplicate_inds():
     )
 
 
+def test_find_duplicate_inds_parent_is_first_occurrence():
+    badind, parentind = find_duplicate_inds(["a", "b", "a", "b", "a"])
+    assert badind == [2, 3, 4] and parentind == [0, 1, 0]
+
+
+def test_find_duplicate_files():
+    _, _, files = load_files_by_scandir("tests/data/image", File)
+    badind, parentind = find_duplicate_files(files, partial_bytes=16)
+    assert [repr(files[i]) for i in badind] == ["sample_duplicate.jpg"]
+    assert [repr(files[i]) for i in parentind] == ["sample.jpg"]
+    assert files[0].hash is None  # Unique sizes are never hashed
+
+
 def test_find_similar_by_value():
     badind, parentind = find_similar_by_value([0, 4, 5, 9], 2)
     assert len(badind) == 1 and len(parentind) == 1
@@ -28,6 +93,74 @@ def test_find_similar_by_value():
     )
 
 
+def test_partial_hash_file():
+    assert partial_hash_file("tests/data/image/sample.jpg") == partial_hash_file(
+        "tests/data/image/sample_duplicate.jpg"
+    )
+    assert partial_hash_file("tests/data/image/sample.jpg") != partial_hash_file(
+        "tests/data/image/real_near1.jpg"
+    )
+
+
+def test_hash_file():
+    assert hash_file("tests/data/image/sample.jpg", chunk_size=1000) == md5sum(
+        "tests/data/image/sample.jpg"
+    )
+    assert len(hash_file("tests/data/image/sample.jpg", algorithm="blake2b")) == 128
+
+
+def test_find_similar_by_value_matches_brute_force():
+    rng = np.random.RandomState(0)
+    values = [int(v) for v in rng.randint(0, 200, size=300)] + [None]
+    badind, parentind = find_similar_by_value(values, 1)
+    expected = dict()
+    for i in range(len(values)):
+        for j in range(i):
+            if values[i] is not None and abs(values[i] - values[j]) <= 1:
+                expected[i] = j
+                break
+    assert dict(zip(badind, parentind)) == expected
+    assert badind == sorted(badind, reverse=True)
+
+
+def test_bktree():
+    tree = BKTree(distance=lambda a, b: bin(a ^ b).count("1"))
+    for i, value in enumerate([0b0000, 0b0001, 0b0111, 0b1111, 0b0001]):
+        tree.add(value, i)
+    assert sorted(tree.query(0b0011, 1)) == [1, 2]
+    assert tree.query(0b1000, 0) == []
+
+
 def test_md5sum():
     hash_value = md5sum("tests/data/image/sample.jpg")
     assert hash_value == "df11f7053426c06d1c6073f88571ac40"
+
+
+def test_prefetch():
+    assert list(prefetch(iter(range(10)), depth=2)) == list(range(10))
+
+
+def test_prefetch_back_pressure():
+    produced = []
+
+    def produce():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    items = prefetch(produce(), depth=2)
+    assert next(items) == 0
+    time.sleep(0.2)
+    assert len(produced) <= 4  # One consumed, two queued, one waiting to be queued
+    items.close()
+
+
+def test_prefetch_error():
+    def produce():
+        yield 1
+        raise RuntimeError("producer failed")
+
+    items = prefetch(produce())
+    assert next(items) == 1
+    with pytest.raises(RuntimeError):
+        next(items)
@@ -1,3 +1,10 @@
+import json
+import os
+import shutil
+import tempfile
+import pytest
+from kaishi.core.file import File
+from kaishi.core.file_group import FileGroup
 from kaishi.core.pipeline import Pipeline
 from kaishi.core.pipeline_component import PipelineComponent
 
@@ -32,3 +39,250 @@ def test_reset():
     pipeline.add_component(PipelineComponent())
     pipeline.reset()
     assert len(pipeline.components) == 0
+
+
+def test_incremental_run():
+    tempdir = tempfile.TemporaryDirectory()
+    for filename in ["sample.jpg", "real_near1.jpg", "gray.jpg"]:
+        shutil.copy(os.path.join("tests/data/image", filename), tempdir.name)
+    first = FileGroup(recursive=False)
+    first.load_dir(tempdir.name, File, False)
+    first.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles"])
+    first.pipeline.components[0].configure(pattern="gray.jpg")
+    first.run_pipeline()
+    state = json.loads(json.dumps(first.get_state()))
+
+    shutil.copy("tests/data/image/sample_duplicate.jpg", tempdir.name)
+    shutil.copy("tests/data/image/real_near2.jpg", tempdir.name)
+    second = FileGroup(recursive=False)
+    second.load_dir(tempdir.name, File, False)
+    second.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles"])
+    second.pipeline.components[0].configure(pattern="gray.jpg")
+    second.run_pipeline(previous_state=state)
+    assert [repr(fobj) for fobj in second.files] == [
+        "real_near1.jpg",
+        "sample.jpg",
+        "real_near2.jpg",
+    ]
+    assert [repr(fobj) for fobj in second.filtered["regex"]] == ["gray.jpg"]
+    assert [repr(fobj) for fobj in second.filtered["duplicates"]] == [
+        "sample_duplicate.jpg"
+    ]
+    assert second["sample.jpg"].children["duplicates"][0].basename == (
+        "sample_duplicate.jpg"
+    )
+    assert second["real_near1.jpg"].hash is None  # Unique sizes are never hashed
+
+
+def test_incremental_run_with_changed_pipeline():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterDuplicateFiles"])
+    test.run_pipeline()
+    state = test.get_state()
+    test.configure_pipeline(["FilterSubsample"])
+    assert test.pipeline.supports_incremental(state) is False
+
+
+def test_profile_report():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    n_files = len(test.files)
+    test.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles"])
+    test.pipeline.components[0].configure(pattern="gray.jpg")
+    test.pipeline.trace_memory = True
+    test.run_pipeline()
+    report = json.loads(json.dumps(test.pipeline.get_profile_report()))
+    assert [step["step"] for step in report["steps"]] == [
+        "FilterByRegex",
+        "FilterDuplicateFiles",
+    ]
+    assert report["steps"][0]["files_in"] == n_files
+    assert report["steps"][0]["files_out"] == n_files - 1
+    assert report["steps"][1]["files_in"] == n_files - 1
+    assert report["total"]["files_out"] == len(test.files)
+    for step in report["steps"]:
+        assert step["wall_time"] >= 0 and step["cpu_time"] >= 0
+        assert step["tracemalloc_peak"] >= 0
+    assert test.pipeline.supports_incremental(test.get_state())
+
+
+def test_profile_report_streaming():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles"])
+    test.pipeline.components[0].configure(pattern="gray.jpg")
+    list(test.stream_pipeline(chunk_size=2))
+    steps = test.pipeline.get_profile_report()["steps"]
+    assert steps[0]["files_out"] == len(test.files) + 1  # Summed over chunks
+    assert steps[0]["tracemalloc_peak"] is None  # Not traced by default
+
+
+def test_fused_groups_with_targets():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterByRegex", "FilterDuplicateFiles", "FilterByRegex"])
+    assert [len(group) for group in test.pipeline._get_fused_groups()] == [1, 1, 1]
+    test.configure_pipeline(["FilterByRegex", "FilterByRegex", "FilterByLabel"])
+    test.pipeline.components[0].configure(pattern=".*near")
+    test.pipeline.components[1].configure(pattern=".*")
+    test.pipeline.components[1].applies_to([0, 1])  # Indexes after the first filter
+    expected = [repr(fobj) for fobj in test.files if "near" not in repr(fobj)][2:]
+    test.run_pipeline()
+    assert [len(group) for group in test.pipeline._get_fused_groups()] == [3]
+    assert [repr(fobj) for fobj in test.files] == expected
+    assert len(test.filtered["regex"]) == 2  # Overwritten by the second filter
+
+
+def test_optimize():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    plan = test.configure_pipeline(
+        [
+            "FilterDuplicateFiles",
+            "FilterByRegex",
+            "FilterSubsample",
+            "FilterDuplicateFiles",
+            "FilterByRegex",
+        ],
+        optimize=True,
+    )
+    assert [step["step"] for step in plan] == [
+        "FilterByRegex",
+        "FilterDuplicateFiles",
+        "FilterSubsample",  # Not commutative, so never crossed
+        "FilterByRegex",
+        "FilterDuplicateFiles",
+    ]
+    assert [step["original_index"] for step in plan] == [1, 0, 2, 4, 3]
+    assert [step["cost"] for step in plan][:2] == ["METADATA", "CONTENT"]
+    assert [str(component) for component in test.pipeline.components] == [
+        step["step"] for step in plan
+    ]
+    assert test.configure_pipeline(["FilterByRegex"]) is None
+
+
+def test_optimize_keeps_output():
+    def run(optimize):
+        test = FileGroup(recursive=True)
+        test.load_dir("tests/data/image", File, True)
+        regex = test.FilterByRegex()
+        regex.configure(pattern=r"gray\.jpg")
+        extensions = test.FilterByRegex()
+        extensions.configure(pattern=r".*\.gif")
+        extensions.applies_to([0])  # Index targets depend on the order
+        test.configure_pipeline(
+            [extensions, "FilterDuplicateFiles", regex], optimize=optimize
+        )
+        test.run_pipeline()
+        return test
+
+    reference = run(False)
+    test = run(True)
+    assert [repr(fobj) for fobj in test.files] == [
+        repr(fobj) for fobj in reference.files
+    ]
+    assert test.filtered.keys() == reference.filtered.keys()
+    for key in reference.filtered:
+        assert [repr(fobj) for fobj in test.filtered[key]] == [
+            repr(fobj) for fobj in reference.filtered[key]
+        ]
+    assert len(reference.filtered["duplicates"]) > 0
+    assert [str(component) for component in test.pipeline.components][1:] == [
+        "FilterByRegex",
+        "FilterDuplicateFiles",
+    ]
+
+
+def test_optimize_changes_kept_duplicate():
+    results = []
+    for optimize in [False, True]:
+        test = FileGroup(recursive=True)
+        test.load_dir("tests/data/image", File, True)
+        regex = test.FilterByRegex()
+        regex.configure(pattern=r"sample\.jpg")  # Kept copy of a duplicate
+        test.configure_pipeline(["FilterDuplicateFiles", regex], optimize=optimize)
+        test.run_pipeline()
+        results.append(test)
+    reference, test = results
+    assert [str(component) for component in test.pipeline.components] == [
+        "FilterByRegex",
+        "FilterDuplicateFiles",
+    ]
+    assert "sample_duplicate.jpg" not in [repr(fobj) for fobj in reference.files]
+    assert "sample_duplicate.jpg" in [repr(fobj) for fobj in test.files]
+    assert len(test.filtered["duplicates"]) == 0
+
+
+class CountingLabeler(PipelineComponent):
+    """Per-file labeler that counts calls and can fail after labeling some files."""
+
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.per_file = True
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def __call__(self, dataset):
+        for fobj in dataset.files:
+            if self.fail_after is not None and self.calls == self.fail_after:
+                raise MemoryError("simulated crash")
+            self.calls += 1
+            fobj.add_label("TRAIN")
+
+
+def test_checkpoint_resume():
+    tempdir = tempfile.TemporaryDirectory()
+    checkpoint = os.path.join(tempdir.name, "checkpoint.json")
+    reference = FileGroup(recursive=True)
+    reference.load_dir("tests/data/image", File, True)
+    reference.configure_pipeline(["FilterDuplicateFiles", CountingLabeler()])
+    reference.run_pipeline()
+
+    crashed = FileGroup(recursive=True)
+    crashed.load_dir("tests/data/image", File, True)
+    crashed.configure_pipeline(["FilterDuplicateFiles", CountingLabeler(fail_after=3)])
+    with pytest.raises(MemoryError):
+        crashed.run_pipeline(checkpoint=checkpoint, checkpoint_interval=2)
+    with open(checkpoint) as checkpoint_file:
+        journal = json.load(checkpoint_file)
+    assert [step["step"] for step in journal["state"]["completed_steps"]] == [
+        "FilterDuplicateFiles"
+    ]
+    assert len(journal["pending"]) == len(reference.files) - 2  # One chunk done
+
+    resumed = FileGroup(recursive=True)
+    resumed.load_dir("tests/data/image", File, True)
+    labeler = CountingLabeler()
+    resumed.configure_pipeline(["FilterDuplicateFiles", labeler])
+    resumed.run_pipeline(checkpoint=checkpoint, resume_from=checkpoint)
+    assert labeler.calls == len(reference.files) - 2  # Only pending files
+    assert [repr(fobj) for fobj in resumed.files] == [
+        repr(fobj) for fobj in reference.files
+    ]
+    assert all(fobj.has_label("TRAIN") for fobj in resumed.files)
+    assert [repr(fobj) for fobj in resumed.filtered["duplicates"]] == [
+        repr(fobj) for fobj in reference.filtered["duplicates"]
+    ]
+    assert len(resumed.pipeline.completed_steps) == 2
+
+    finished = FileGroup(recursive=True)  # Nothing left to run
+    finished.load_dir("tests/data/image", File, True)
+    labeler = CountingLabeler()
+    finished.configure_pipeline(["FilterDuplicateFiles", labeler])
+    finished.run_pipeline(resume_from=checkpoint)
+    assert labeler.calls == 0 and len(finished.files) == len(reference.files)
+
+
+def test_checkpoint_mismatch():
+    tempdir = tempfile.TemporaryDirectory()
+    checkpoint = os.path.join(tempdir.name, "checkpoint.json")
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterDuplicateFiles"])
+    test.run_pipeline(checkpoint=checkpoint)
+    test.configure_pipeline(["FilterByRegex"])
+    with pytest.warns(UserWarning):
+        assert test.load_checkpoint(checkpoint) is None
+    with pytest.raises(ValueError):
+        test.run_pipeline(checkpoint=checkpoint, chunk_size=2)
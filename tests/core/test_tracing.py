@@ -0,0 +1,38 @@
+import json
+import os
+import tempfile
+from kaishi.core.file import File
+from kaishi.core.file_group import FileGroup
+from kaishi.core.tracing import span, start_tracing, stop_tracing, is_tracing
+
+
+def test_span_disabled():
+    assert not is_tracing()
+    with span("noop") as first, span("noop") as second:
+        assert first is second  # Shared no-op context manager
+
+
+def test_trace_pipeline():
+    test = FileGroup(recursive=True)
+    test.load_dir("tests/data/image", File, True)
+    test.configure_pipeline(["FilterDuplicateFiles"])
+    tempdir = tempfile.TemporaryDirectory()
+    path = os.path.join(tempdir.name, "trace.json")
+    start_tracing()
+    try:
+        test.run_pipeline()
+    finally:
+        stop_tracing(path)
+    assert not is_tracing()
+    with open(path) as trace_file:
+        events = json.load(trace_file)["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    (component,) = [event for event in spans if event["cat"] == "pipeline"]
+    assert component["name"] == "FilterDuplicateFiles"
+    hashes = [event for event in spans if event["name"] == "hash"]
+    assert len(hashes) > 0
+    for event in hashes:  # Nested in the component span
+        assert component["ts"] <= event["ts"]
+        assert event["ts"] + event["dur"] <= component["ts"] + component["dur"]
+        assert event["pid"] == component["pid"] and "file" in event["args"]
+    assert any(event["name"] == "thread_name" for event in events)
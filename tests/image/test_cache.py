@@ -0,0 +1,34 @@
+from kaishi.image.cache import PixelCache, image_nbytes
+from kaishi.image.file_group import ImageFileGroup
+
+
+def test_pixel_cache_budget():
+    test = ImageFileGroup("tests/data/image", recursive=True, memory_budget=1)
+    test.load_all()
+    loaded = [fobj for fobj in test.files if fobj.image is not None]
+    assert len(loaded) > 1
+    assert sum([fobj._image is not None for fobj in test.files]) == 1
+    assert all([fobj.thumbnail is not None for fobj in loaded])
+    assert len(test.pixel_cache.entries) == 1
+
+
+def test_pixel_cache_lru():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    files = {fobj.basename: fobj for fobj in test.files}
+    first, second, third = (
+        files["sample.jpg"],
+        files["sample_duplicate.jpg"],
+        files["gray.jpg"],
+    )  # Same dimensions, but the grayscale image has fewer bytes
+    first.verify_loaded()
+    cache = PixelCache(2 * image_nbytes(first.image))
+    for fobj in [first, second, third]:
+        fobj.pixel_cache = cache
+        fobj.verify_loaded()
+        fobj.image  # Records the access for images loaded before the cache was set
+    assert first.evicted  # Least recently used
+    assert first.image is not None  # Reloaded, which evicts the next oldest
+    assert second.evicted and not third.evicted
+    assert cache.total <= cache.budget
+    third.unload()
+    assert id(third) not in cache.entries
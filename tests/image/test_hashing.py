@@ -0,0 +1,136 @@
+import pytest
+import numpy as np
+import imagehash
+from PIL import Image
+from kaishi.core.misc import find_similar_by_value
+from kaishi.image.hashing import (
+    pack_hashes,
+    popcount,
+    hamming_distance,
+    find_similar_by_hamming,
+    find_similar_by_bands,
+    find_similar_hashes,
+    batch_perceptual_hashes,
+    unpack_hashes,
+)
+
+
+def random_hashes(n, seed=0):
+    rng = np.random.RandomState(seed)
+    base = rng.rand(8, 8) > 0.5
+    hashes = []
+    for _ in range(n):  # Random flips of a few bits make near duplicates likely
+        bits = base ^ (rng.rand(8, 8) > 0.9)
+        hashes.append(imagehash.ImageHash(bits))
+    return hashes
+
+
+def test_pack_hashes():
+    hashes = random_hashes(5) + [None]
+    packed, valid = pack_hashes(hashes)
+    assert packed.dtype == np.uint64
+    assert valid.tolist() == [True] * 5 + [False]
+    assert [format(int(value), "016x") for value in packed[:5]] == [
+        str(hashval) for hashval in hashes[:5]
+    ]
+
+
+def test_popcount():
+    values = np.array([0, 1, 0xFF, 0xFFFFFFFFFFFFFFFF], dtype=np.uint64)
+    assert popcount(values).tolist() == [0, 1, 8, 64]
+
+
+def test_hamming_distance():
+    hashes = random_hashes(4)
+    packed, _ = pack_hashes(hashes)
+    distances = hamming_distance(packed[:, None], packed[None, :])
+    for i in range(4):
+        for j in range(4):
+            assert distances[i, j] == hashes[i] - hashes[j]
+
+
+def test_find_similar_by_hamming():
+    hashes = random_hashes(200)
+    hashes[7] = None
+    packed, valid = pack_hashes(hashes)
+    expected = find_similar_by_value(hashes, 4)
+    badind, parentind = find_similar_by_hamming(packed, valid, 4, block_size=16)
+    assert len(badind) > 0
+    assert (badind, parentind) == (expected[0], [int(i) for i in expected[1]])
+
+
+def test_find_similar_by_bands():
+    hashes = random_hashes(300)
+    hashes[7] = None
+    hashes[20] = hashes[10]  # Identical hashes are compared once
+    packed, valid = pack_hashes(hashes)
+    for threshold in [0, 1, 3, 4.5, 7]:
+        expected = find_similar_by_hamming(packed, valid, threshold)
+        assert len(expected[0]) > 0
+        assert find_similar_by_bands(packed, valid, threshold, max_pairs=50) == expected
+    assert find_similar_by_bands(packed, valid, -1) == ([], [])
+
+
+def test_find_similar_by_bands_scaling(monkeypatch):
+    n = 200000  # Comparing all pairs would take 2e10 comparisons
+    rng = np.random.RandomState(0)
+    packed = rng.randint(0, 2**63, size=n, dtype=np.int64).astype(np.uint64)
+    packed[n - 100 :] = packed[:100] ^ np.uint64(0b10010001)  # 3 bits differ
+    valid = np.ones(n, dtype=bool)
+    n_compared = [0]
+
+    def counting_hamming_distance(packed_a, packed_b):
+        n_compared[0] += np.size(packed_a)
+        return hamming_distance(packed_a, packed_b)
+
+    monkeypatch.setattr(
+        "kaishi.image.hashing.hamming_distance", counting_hamming_distance
+    )
+    badind, parentind = find_similar_hashes(packed, valid, 3)  # Default threshold
+    assert badind == list(range(n - 1, n - 101, -1))
+    assert parentind == list(range(99, -1, -1))
+    assert n_compared[0] < 20 * n
+
+
+def test_find_similar_hashes(monkeypatch):
+    hashes = random_hashes(50)
+    packed, valid = pack_hashes(hashes)
+    calls = []
+    monkeypatch.setattr(
+        "kaishi.image.hashing.find_similar_by_bands",
+        lambda *args: calls.append("bands") or find_similar_by_bands(*args),
+    )
+    expected = find_similar_by_hamming(packed, valid, 3)
+    assert find_similar_hashes(packed, valid, 3) == expected
+    assert calls == ["bands"]
+    find_similar_hashes(packed, valid, 12)  # Large thresholds use the tiled search
+    assert calls == ["bands"]
+
+
+def test_batch_perceptual_hashes():
+    rng = np.random.RandomState(0)
+    thumbnails = rng.randint(0, 256, size=(3, 64, 64, 3)).astype(np.uint8)
+    thumbnails[1] = thumbnails[0]
+    for hash_type in ["average", "difference", "dct"]:
+        packed = batch_perceptual_hashes(thumbnails, hash_type=hash_type)
+        assert packed.dtype == np.uint64 and len(packed) == 3
+        assert packed[0] == packed[1]
+        channels_first = batch_perceptual_hashes(
+            np.moveaxis(thumbnails, -1, 1), hash_type=hash_type, channels_first=True
+        )
+        assert (channels_first == packed).all()
+    with pytest.raises(ValueError):
+        batch_perceptual_hashes(thumbnails, hash_type="wavelet")
+
+
+def test_batch_perceptual_hashes_match_imagehash():
+    gradient = np.tile(np.arange(64, dtype=np.uint8)[None, :, None] * 4, (64, 1, 3))
+    image = Image.fromarray(gradient)
+    packed = batch_perceptual_hashes(gradient[None], hash_type="average")
+    assert unpack_hashes(packed)[0] - imagehash.average_hash(image) <= 4
+
+
+def test_unpack_hashes():
+    hashes = random_hashes(5)
+    packed, _ = pack_hashes(hashes)
+    assert unpack_hashes(packed) == hashes
@@ -30,3 +30,49 @@ def test_compute_perceptual_hash():
     test = ImageFile("tests/data", "image", "sample.jpg")
     hashval = test.compute_perceptual_hash()
     assert str(hashval) == "00302df7d7978303"
+
+
+def test_cached_values():
+    test = ImageFile("tests/data", "image", "sample.jpg")
+    hashval = test.compute_perceptual_hash()
+    restored = ImageFile("tests/data", "image", "sample.jpg")
+    restored.set_cached_values(test.get_cached_values())
+    assert restored.perceptual_hash == hashval
+    test.convert_to_grayscale()
+    assert test.get_cached_values()["perceptual_hash"] is None
+
+
+def test_verify_loaded_analysis_only():
+    test = ImageFile("tests/data", "image", "real_near1.jpg")
+    test.verify_loaded(analysis_only=True)
+    assert test.draft
+    assert test.image.size[0] < test.dimensions[0]
+    assert min(test.image.size) >= 224
+    assert test.small_image.size == (224, 224)
+    test.rotate(90)  # Transforms reload the full resolution image first
+    assert not test.draft
+    assert test.image.size == (test.dimensions[1], test.dimensions[0])
+
+
+def test_lazy_derived_images():
+    test = ImageFile("tests/data", "image", "sample.jpg")
+    test.verify_loaded()
+    assert test._thumbnail is None
+    thumbnail = test.thumbnail
+    assert thumbnail.size == (64, 64)
+    assert test.thumbnail is thumbnail  # Memoized
+    test.rotate(90)
+    assert test.thumbnail is not thumbnail
+
+
+def test_evict_replays_transforms():
+    test = ImageFile("tests/data", "image", "sample.jpg")
+    test.verify_loaded()
+    test.rotate(90)
+    test.convert_to_grayscale()
+    expected = test.image.copy()
+    test.evict()
+    assert test._image is None
+    assert test.image.size == expected.size
+    assert test.image.mode == "L"
+    assert list(test.image.getdata()) == list(expected.getdata())
@@ -1,6 +1,14 @@
 import os
+import json
+import shutil
+import sys
+import multiprocessing
 import tempfile
+import pytest
+import numpy as np
+from PIL import Image
 from kaishi.image.file_group import ImageFileGroup
+from kaishi.core.tracing import start_tracing, stop_tracing
 
 
 def test_init_and_load_dir():
@@ -20,3 +28,215 @@ def test_save():
     tempdir = tempfile.TemporaryDirectory()
     test.save(tempdir.name)
     assert len(os.listdir(tempdir.name)) > 0
+
+
+def test_stream_pipeline():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    test.configure_pipeline(["FilterSimilar"])
+    reference = ImageFileGroup("tests/data/image", recursive=True)
+    reference.configure_pipeline(["FilterSimilar"])
+    reference.run_pipeline()
+    for fobj in test.stream_pipeline(chunk_size=2):
+        assert fobj.image is not None or fobj.perceptual_hash is None
+    assert [repr(fobj) for fobj in test.files] == [
+        repr(fobj) for fobj in reference.files
+    ]
+    assert all([fobj.image is None for fobj in test.files])
+    assert len(test.filtered["similar"]) == len(reference.filtered["similar"])
+
+
+def test_save_analysis_only():
+    test = ImageFileGroup("tests/data/image", recursive=True, analysis_only=True)
+    test.load_all()
+    assert any([fobj.draft for fobj in test.files])
+    tempdir = tempfile.TemporaryDirectory()
+    test.save(tempdir.name)
+    for fobj in test.files:
+        if fobj.image is not None:  # Saved at full resolution
+            assert fobj.image.size == fobj.dimensions
+
+
+def test_run_pipeline_loads_after_cheap_filters():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    regex = test.FilterByRegex()
+    regex.configure(pattern=r"sample\.jpg")
+    test.configure_pipeline(
+        [
+            "FilterInvalidImageHeaders",
+            "FilterInvalidFileExtensions",
+            regex,
+            "FilterSimilar",
+        ],
+        optimize=True,
+    )
+    test.run_pipeline()
+    assert not any([fobj.loaded for fobj in test.filtered["regex"]])
+    assert not any([fobj.loaded for fobj in test.filtered["unsupported_extension"]])
+    assert all([fobj.loaded for fobj in test.files])
+    assert len(test.filtered["similar"]) > 0
+
+
+def test_load_all_with_workers():
+    reference = ImageFileGroup("tests/data/image", recursive=True)
+    reference.load_all()
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    test.load_all(workers=2)
+    for fobj, expected in zip(test.files, reference.files):
+        assert fobj.loaded == expected.loaded
+        if not expected.loaded:
+            continue
+        assert fobj._image is None  # Only derived images are sent back
+        assert fobj.has_label("GRAYSCALE") == expected.has_label("GRAYSCALE")
+        assert fobj.thumbnail.tobytes() == expected.thumbnail.tobytes()
+        assert fobj.small_image.tobytes() == expected.small_image.tobytes()
+        assert fobj.image.size == expected.image.size  # Loaded on access
+
+
+def test_load_all_with_workers_without_shared_memory(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("no worker processes without shared memory")
+
+    monkeypatch.delattr(multiprocessing, "shared_memory", raising=False)
+    monkeypatch.setitem(sys.modules, "multiprocessing.shared_memory", None)
+    monkeypatch.setattr("kaishi.image.file_group.ProcessPoolExecutor", fail)
+    reference = ImageFileGroup("tests/data/image", recursive=True)
+    reference.load_all()
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    test.load_all(workers=2)  # Loaded in the main process (as on Python < 3.8)
+    for fobj, expected in zip(test.files, reference.files):
+        assert fobj.loaded == expected.loaded
+        if expected.loaded:
+            assert fobj.thumbnail.tobytes() == expected.thumbnail.tobytes()
+
+
+def test_load_all_with_workers_traced():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    start_tracing()
+    try:
+        test.load_all(workers=2)
+    finally:
+        events = stop_tracing()
+    loads = [event for event in events if event["name"] == "load"]
+    assert len(set(event["pid"] for event in loads)) > 1  # Workers and main process
+    assert set(event["args"]["file"] for event in loads) == set(
+        fobj.abspath for fobj in test.files
+    )
+
+
+def test_build_numpy_batches():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    n_images = 5  # One of the six files isn't an image
+    tensor = test.build_numpy_batches(image_type="thumbnail")
+    assert tensor.shape == (n_images, 3, 64, 64)
+    assert tensor.dtype == np.uint8 and tensor.flags["C_CONTIGUOUS"]
+    batches = list(
+        test.build_numpy_batches(
+            channels_first=False, batch_size=2, image_type="thumbnail", dtype=np.float32
+        )
+    )
+    assert [len(fobjs) for _, fobjs in batches] == [2, 2, 1]
+    last_batch, last_fobjs = batches[-1]
+    assert last_batch.shape == (1, 64, 64, 3) and last_batch.dtype == np.float32
+    assert np.array_equal(
+        last_batch[0], np.asarray(last_fobjs[0].thumbnail.convert("RGB"))
+    )
+
+
+def test_build_numpy_batches_out():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    out = np.zeros((2, 3, 64, 64), dtype=np.float32)
+    for batch, _ in test.build_numpy_batches(
+        batch_size=2, image_type="thumbnail", out=out
+    ):
+        assert np.shares_memory(batch, out)
+    with pytest.raises(ValueError):
+        next(test.build_numpy_batches(batch_size=3, image_type="thumbnail", out=out))
+
+
+def test_prefetch_numpy_batches():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    reference = test.build_numpy_batches()
+    prefetched = list(test.prefetch_numpy_batches(2, depth=2, workers=2))
+    assert all([len(fobjs) <= 2 for _, fobjs in prefetched])
+    assert [fobj for _, fobjs in prefetched for fobj in fobjs] == [
+        fobj for fobj in test.files if fobj.image is not None
+    ]
+    assert np.array_equal(np.concatenate([batch for batch, _ in prefetched]), reference)
+
+
+def test_resume_replays_transforms():
+    tempdir = tempfile.TemporaryDirectory()
+    checkpoint = os.path.join(tempdir.name, "checkpoint.json")
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    test.configure_pipeline(["TransformToGrayscale", "FilterSimilar"])
+    test.run_pipeline(checkpoint=checkpoint)
+
+    resumed = ImageFileGroup("tests/data/image", recursive=True)
+    resumed.configure_pipeline(["TransformToGrayscale", "FilterSimilar"])
+    resumed.run_pipeline(resume_from=checkpoint)
+    assert [repr(fobj) for fobj in resumed.files] == [repr(fobj) for fobj in test.files]
+    for fobj, expected in zip(resumed.files, test.files):
+        assert fobj.transform_log == expected.transform_log
+        if expected.image is not None:
+            assert fobj.image.mode == "L"
+            assert fobj.perceptual_hash == expected.perceptual_hash
+
+
+def test_incremental_run_matches_full_run():
+    tempdir = tempfile.TemporaryDirectory()
+    data_dir = os.path.join(tempdir.name, "data")
+    os.makedirs(data_dir)
+    for filename in ["sample.jpg", "real_near1.jpg", "gray.jpg"]:
+        shutil.copy(os.path.join("tests/data/image", filename), data_dir)
+    steps = ["TransformLimitDimensions", "FilterDuplicateFiles", "FilterSimilar"]
+    first = ImageFileGroup(data_dir, recursive=False)
+    first.configure_pipeline(steps)
+    first.pipeline.components[0].configure(max_dimension=64)
+    first.run_pipeline()
+    state = json.loads(json.dumps(first.get_state()))
+
+    for filename in ["sample_duplicate.jpg", "real_near2.jpg"]:
+        shutil.copy(os.path.join("tests/data/image", filename), data_dir)
+    outputs = []
+    for previous_state in [state, None]:
+        test = ImageFileGroup(data_dir, recursive=False)
+        test.configure_pipeline(steps)
+        test.pipeline.components[0].configure(max_dimension=64)
+        test.run_pipeline(previous_state=previous_state)
+        out_dir = os.path.join(
+            tempdir.name, "incremental" if previous_state else "full"
+        )
+        test.save(out_dir)
+        saved = dict()
+        for filename in sorted(os.listdir(out_dir)):
+            with Image.open(os.path.join(out_dir, filename)) as image:
+                saved[filename] = (image.size, image.tobytes())
+        filtered = {k: sorted(map(repr, v)) for k, v in test.filtered.items()}
+        outputs.append((sorted(map(repr, test.files)), filtered, saved))
+    assert outputs[0] == outputs[1]
+    assert all(max(size) <= 64 for size, _ in outputs[0][2].values())
+
+
+def test_incremental_run_with_index_targets():
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    test.configure_pipeline(["TransformToGrayscale"])
+    test.pipeline.components[0].applies_to(0)
+    test.run_pipeline()
+    state = test.get_state()
+    assert test.pipeline.supports_incremental(state) is False
+
+
+def test_fingerprint_default_model(monkeypatch):
+    tempdir = tempfile.TemporaryDirectory()
+    weights = os.path.join(tempdir.name, "weights.pth")
+    with open(weights, "wb") as weights_file:
+        weights_file.write(b"weights")
+    monkeypatch.setattr("kaishi.image.file_group.get_weights_path", lambda: weights)
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    fingerprint = test.get_fingerprint()
+    assert test.get_fingerprint() == fingerprint
+    with open(weights, "wb") as weights_file:
+        weights_file.write(b"other weights")
+    assert test.get_fingerprint() == fingerprint  # Files are read once per run
+    test.file_stats = dict()
+    assert test.get_fingerprint() != fingerprint
@@ -1,3 +1,5 @@
+import os
+import tempfile
 from kaishi.image.file_group import ImageFileGroup
 
 
@@ -20,3 +22,145 @@ def test_similar():
     test.configure_pipeline(["FilterSimilar"])
     test.run_pipeline()
     assert len(test.filtered["similar"]) > 0
+
+
+def test_similar_with_workers():
+    reference = ImageFileGroup("tests/data/image", recursive=True)
+    reference.configure_pipeline(["FilterSimilar"])
+    reference.run_pipeline()
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    component = test.FilterSimilar()
+    component.configure(workers=2)
+    component(test)  # Images aren't loaded, so they're decoded in worker processes
+    assert [repr(fobj) for fobj in test.files] == [
+        repr(fobj) for fobj in reference.files
+    ]
+    assert [str(fobj.perceptual_hash) for fobj in test.files] == [
+        str(fobj.perceptual_hash) for fobj in reference.files
+    ]
+
+
+def test_similar_workers_same_result():
+    results = []
+    for workers in [1, 2]:
+        test = ImageFileGroup("tests/data/image", recursive=True, analysis_only=True)
+        for fobj in test.files[:3]:  # Transformed, then unloaded
+            fobj.verify_loaded()
+            fobj.limit_dimensions(max_dimension=4)
+            fobj.unload()
+        component = test.FilterSimilar()
+        component.configure(workers=workers)
+        component(test)
+        results.append(test)
+    assert [repr(fobj) for fobj in results[0].files] == [
+        repr(fobj) for fobj in results[1].files
+    ]
+    assert [repr(fobj) for fobj in results[0].filtered["similar"]] == [
+        repr(fobj) for fobj in results[1].filtered["similar"]
+    ]
+    for fobj, expected in zip(results[1].files, results[0].files):
+        assert str(fobj.perceptual_hash) == str(expected.perceptual_hash)
+        assert fobj.perceptual_hash_decode == expected.perceptual_hash_decode
+
+
+def test_similar_batch_hash_types():
+    for hash_type in ["average", "difference", "dct"]:
+        test = ImageFileGroup("tests/data/image", recursive=True)
+        test.configure_pipeline(["FilterSimilar"])
+        test.pipeline.components[0].configure(hash_type=hash_type)
+        test.run_pipeline()
+        assert len(test.filtered["similar"]) > 0
+        assert all(
+            fobj.perceptual_hash_type == hash_type
+            for fobj in test.files
+            if fobj.perceptual_hash is not None
+        )
+
+
+def test_optimized_order():
+    choices = [
+        "FilterInvalidImageHeaders",
+        "FilterInvalidFileExtensions",
+        "FilterSimilar",
+        "FilterInvalidImageHeaders",
+    ]
+    reference = ImageFileGroup("tests/data/image", recursive=True)
+    reference.configure_pipeline(choices)
+    reference.run_pipeline()
+    for fuse in [True, False]:  # Reordered components always share a pass
+        test = ImageFileGroup("tests/data/image", recursive=True)
+        plan = test.configure_pipeline(choices, optimize=True)
+        test.pipeline.fuse = fuse
+        assert [step["cost"] for step in plan] == [
+            "METADATA",
+            "HEADER",
+            "HEADER",
+            "DECODE",
+        ]
+        groups = test.pipeline._get_fused_groups()
+        assert [len(group) for group in groups] == ([3, 1] if fuse else [2, 1, 1])
+        test.run_pipeline()
+        assert len(test.filtered["similar"]) > 0
+        assert [repr(fobj) for fobj in test.files] == [
+            repr(fobj) for fobj in reference.files
+        ]
+        assert test.filtered.keys() == reference.filtered.keys()
+        for key in reference.filtered:  # Same key when several filters reject a file
+            assert [repr(fobj) for fobj in test.filtered[key]] == [
+                repr(fobj) for fobj in reference.filtered[key]
+            ]
+
+
+def test_optimized_order_before_similar():
+    choices = ["FilterSimilar", "FilterInvalidFileExtensions"]
+    reference = ImageFileGroup("tests/data/image", recursive=True)
+    reference.configure_pipeline(choices)
+    reference.run_pipeline()
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    plan = test.configure_pipeline(choices, optimize=True)
+    assert [step["original_index"] for step in plan] == [1, 0]
+    test.run_pipeline()
+    assert [repr(fobj) for fobj in test.files] == [
+        repr(fobj) for fobj in reference.files
+    ]
+    assert len(test.filtered["similar"]) > 0
+    assert not any(fobj.loaded for fobj in test.filtered["unsupported_extension"])
+
+
+def test_similar_after_transform_with_manifest():
+    tempdir = tempfile.TemporaryDirectory()
+    manifest = os.path.join(tempdir.name, "manifest.sqlite")
+    hashed = ImageFileGroup("tests/data/image", recursive=True, manifest=manifest)
+    hashed.configure_pipeline(["FilterSimilar"])
+    hashed.run_pipeline()  # Records the hashes of the images on disk
+    results = []
+    for path in [manifest, None]:
+        test = ImageFileGroup("tests/data/image", recursive=True, manifest=path)
+        limiter = test.TransformLimitDimensions()
+        limiter.configure(max_dimension=4)
+        test.configure_pipeline([limiter, "FilterSimilar"])
+        test.run_pipeline()
+        results.append(test)
+    with_manifest, without_manifest = results
+    assert [repr(fobj) for fobj in with_manifest.files] == [
+        repr(fobj) for fobj in without_manifest.files
+    ]
+    assert [repr(fobj) for fobj in with_manifest.filtered["similar"]] == [
+        repr(fobj) for fobj in without_manifest.filtered["similar"]
+    ]
+    for fobj, expected in zip(with_manifest.files, without_manifest.files):
+        assert str(fobj.perceptual_hash) == str(expected.perceptual_hash)
+
+
+def test_manifest_hashes_need_same_decode_mode():
+    tempdir = tempfile.TemporaryDirectory()
+    manifest = os.path.join(tempdir.name, "manifest.sqlite")
+    hashed = ImageFileGroup("tests/data/image", recursive=True, manifest=manifest)
+    hashed.configure_pipeline(["FilterSimilar"])
+    hashed.run_pipeline()
+    full = ImageFileGroup("tests/data/image", recursive=True, manifest=manifest)
+    assert any([fobj.perceptual_hash is not None for fobj in full.files])
+    draft = ImageFileGroup(
+        "tests/data/image", recursive=True, manifest=manifest, analysis_only=True
+    )
+    assert all([fobj.perceptual_hash is None for fobj in draft.files])
@@ -74,3 +74,38 @@ def test_limit_dimensions_no_setting():
     assert len(test.files) > 0
     assert sum(heights_before) == sum(heights_after)
     assert sum(widths_before) == sum(widths_after)
+
+
+def test_fused_transforms_and_filters():
+    choices = [
+        "FilterInvalidFileExtensions",
+        "TransformToGrayscale",
+        "TransformLimitDimensions",
+        "FilterInvalidImageHeaders",
+    ]
+    results = []
+    for fuse in [False, True]:
+        test = ImageFileGroup("tests/data/image", recursive=True)
+        test.configure_pipeline(choices)
+        test.pipeline.components[2].configure(max_dimension=100)
+        test.pipeline.fuse = fuse
+        test.run_pipeline()
+        assert len(test.pipeline._get_fused_groups()) == (1 if fuse else 4)
+        results.append(test)
+    unfused, fused = results
+    assert [repr(fobj) for fobj in fused.files] == [
+        repr(fobj) for fobj in unfused.files
+    ]
+    assert fused.filtered.keys() == unfused.filtered.keys()
+    for k in unfused.filtered:
+        assert [repr(fobj) for fobj in fused.filtered[k]] == [
+            repr(fobj) for fobj in unfused.filtered[k]
+        ]
+    for fobj, expected in zip(fused.files, unfused.files):
+        if expected.image is None:
+            continue
+        assert fobj.image.tobytes() == expected.image.tobytes()
+        assert fobj.small_image.tobytes() == expected.small_image.tobytes()
+    steps = fused.pipeline.get_profile_report()["steps"]
+    assert [step["step"] for step in steps] == choices
+    assert steps[0]["files_out"] == steps[1]["files_in"]
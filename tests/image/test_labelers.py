@@ -1,3 +1,8 @@
+import os
+import tempfile
+import torch
+from kaishi.image.model import Model
+from kaishi.image.prediction_cache import PredictionCache
 from kaishi.image.file_group import ImageFileGroup
 
 
@@ -7,3 +12,56 @@ def test_generic_convnet():
     test.run_pipeline()
     label_count = sum([len(fobj.labels) for fobj in test.files])
     assert label_count > 0
+
+
+def test_generic_convnet_prediction_cache():
+    tempdir = tempfile.TemporaryDirectory()
+    weights = os.path.join(tempdir.name, "weights.pth")
+    torch.save(Model.resnet18(None, 6).state_dict(), weights)
+    cache_path = os.path.join(tempdir.name, "predictions.db")
+    model = Model(weights=weights)
+    test = ImageFileGroup("tests/data/image", recursive=True)
+    test.model = model
+    labeler = test.LabelerGenericConvnet()
+    labeler.configure(prediction_cache=cache_path, document_threshold=1.0)
+    labeler(test)
+    assert len(PredictionCache(cache_path)) == 4  # Five images, two are identical
+    assert not any([fobj.has_label("DOCUMENT") for fobj in test.files])
+
+    def fail(batch):
+        raise AssertionError("Cached predictions should be reused")
+
+    model.predict = fail
+    relabeled = ImageFileGroup("tests/data/image", recursive=True)
+    relabeled.model = model
+    labeler.configure(prediction_cache=cache_path, document_threshold=0.0)
+    labeler(relabeled)  # Only the file that isn't an image is a cache miss
+    assert all(
+        [
+            fobj.has_label("DOCUMENT")
+            for fobj in relabeled.files
+            if fobj.image is not None
+        ]
+    )
+
+
+def test_generic_convnet_cache_keys_decode_mode():
+    class StubModel:
+        def get_signature(self):
+            return "stub"
+
+    test = ImageFileGroup("tests/data/image", recursive=True, analysis_only=True)
+    test.model = StubModel()
+    test.load_all()
+    drafted = [fobj for fobj in test.files if fobj.draft]
+    assert len(drafted) == 2
+    drafted[0].load_full_resolution()  # Mixes decode modes in one dataset
+    keys = test.LabelerGenericConvnet()._get_cache_keys(test)
+    assert ":draft:" in keys[id(drafted[1])]
+    assert ":full:" in keys[id(drafted[0])]
+
+    full = ImageFileGroup("tests/data/image", recursive=True)
+    full.model = StubModel()
+    full_keys = full.LabelerGenericConvnet()._get_cache_keys(full)
+    for fobj, full_fobj in zip(test.files, full.files):  # Same decode, same key
+        assert (keys[id(fobj)] == full_keys[id(full_fobj)]) == (fobj is not drafted[1])
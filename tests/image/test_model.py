@@ -0,0 +1,101 @@
+import os
+import tempfile
+import pytest
+import numpy as np
+import torch
+import torch.nn as nn
+from kaishi.image.model import Model, quantize_model, compare_predictions
+
+
+def small_model():
+    return nn.Sequential(
+        nn.Conv2d(3, 4, 3),
+        nn.ReLU(),
+        nn.Flatten(),
+        nn.Linear(4 * 6 * 6, 6),
+        nn.Sigmoid(),
+    ).eval()
+
+
+def predict_with(model):
+    def predict(batch):
+        with torch.no_grad():
+            return model(torch.from_numpy(batch).float()).numpy()
+
+    return predict
+
+
+def test_quantize_model():
+    rng = np.random.RandomState(0)
+    batches = [rng.rand(4, 3, 8, 8).astype(np.float32) for _ in range(3)]
+    model = small_model()
+    for quantization in ["dynamic", "static"]:
+        quantized = quantize_model(
+            model,
+            quantization,
+            calibration_batches=[torch.from_numpy(batch) for batch in batches],
+        )
+        result = compare_predictions(
+            predict_with(model), predict_with(quantized), batches
+        )
+        assert result["max_abs_difference"] < 0.05
+        assert result["label_agreement"] > 0.9
+    with pytest.raises(ValueError):
+        quantize_model(model, "static")
+    with pytest.raises(ValueError):
+        quantize_model(model, "float16")
+
+
+def test_compare_predictions():
+    batches = [np.zeros((2, 3))]
+    result = compare_predictions(
+        lambda batch: batch + 0.25, lambda batch: batch + 0.75, batches
+    )
+    assert result["max_abs_difference"] == 0.5
+    assert result["label_agreement"] == 0.0
+
+
+def test_model_cache():
+    tempdir = tempfile.TemporaryDirectory()
+    weights = os.path.join(tempdir.name, "weights.pth")
+    torch.save(Model.resnet18(None, 6).state_dict(), weights)
+    cache_dir = os.path.join(tempdir.name, "cache")
+    model = Model(model_arch="resnet18", weights=weights, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    cached = Model(model_arch="resnet18", weights=weights, cache_dir=cache_dir)
+    assert isinstance(cached.model, torch.jit.ScriptModule)
+    batch = np.random.RandomState(0).rand(2, 3, 64, 64).astype(np.float32)
+    assert np.allclose(model.predict(batch), cached.predict(batch), atol=1e-5)
+    with pytest.raises(ValueError):
+        Model(quantization="static", weights=weights, cache_dir=cache_dir)
+
+
+def test_model_cache_torch_version(monkeypatch):
+    tempdir = tempfile.TemporaryDirectory()
+    weights = os.path.join(tempdir.name, "weights.pth")
+    torch.save(Model.resnet18(None, 6).state_dict(), weights)
+    cache_dir = os.path.join(tempdir.name, "cache")
+    model = Model(model_arch="resnet18", weights=weights, cache_dir=cache_dir)
+    filename = model.get_cache_filename()
+    assert os.listdir(cache_dir) == [filename]
+    assert torch.__version__ in filename
+    monkeypatch.setattr(torch, "__version__", "0.0.0")  # Only while naming the file
+    assert model.get_cache_filename() != filename
+
+
+def test_model_cache_failure(monkeypatch):
+    tempdir = tempfile.TemporaryDirectory()
+    weights = os.path.join(tempdir.name, "weights.pth")
+    torch.save(Model.resnet18(None, 6).state_dict(), weights)
+    cache_dir = os.path.join(tempdir.name, "cache")
+
+    def failing_trace(*args, **kwargs):
+        raise RuntimeError("builtin cannot be used as a value")
+
+    monkeypatch.setattr(torch.jit, "trace", failing_trace)
+    with pytest.warns(UserWarning, match="TorchScript"):
+        model = Model(model_arch="resnet18", weights=weights, cache_dir=cache_dir)
+    assert not isinstance(model.model, torch.jit.ScriptModule)
+    assert not os.path.exists(cache_dir) or os.listdir(cache_dir) == []
+    batch = np.random.RandomState(0).rand(2, 3, 64, 64).astype(np.float32)
+    assert model.predict(batch).shape == (2, 6)
@@ -1,4 +1,5 @@
 import os
+import json
 import tempfile
 import pandas as pd
 from kaishi.tabular.file_group import TabularFileGroup
@@ -46,3 +47,22 @@ def test_save():
         tempdir = tempfile.TemporaryDirectory()
         test.save(tempdir.name)
     assert len(os.listdir(tempdir.name)) > 0
+
+
+def test_checkpoints_not_supported():
+    tempdir = tempfile.TemporaryDirectory()
+    checkpoint = os.path.join(tempdir.name, "checkpoint.json")
+    test = TabularFileGroup("tests/data/tabular", recursive=True)
+    test.configure_pipeline(["FilterDuplicateRowsEachDataframe"])
+    with pytest.raises(ValueError):
+        test.run_pipeline(checkpoint=checkpoint)
+    assert not os.path.exists(checkpoint)
+    test.run_pipeline()
+    with open(checkpoint, "w") as checkpoint_file:  # Even a matching journal
+        json.dump(
+            {"steps": [], "state": test.get_state(), "pending": None}, checkpoint_file
+        )
+    resumed = TabularFileGroup("tests/data/tabular", recursive=True)
+    resumed.configure_pipeline(["FilterDuplicateRowsEachDataframe"])
+    with pytest.raises(ValueError):  # Resuming would skip the row deduplication
+        resumed.run_pipeline(resume_from=checkpoint)